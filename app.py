@@ -1,21 +1,61 @@
 import os
 import sqlite3
+import threading
+import time
+try:
+    import fcntl
+except ImportError:
+    # Windows: sem trava de arquivo; BEGIN IMMEDIATE ainda serializa as migrações
+    fcntl = None
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Sem Pillow os uploads são salvos como recebidos, sem versões redimensionadas
+    Image = ImageOps = None
+try:
+    import segno
+except ImportError:
+    # Sem segno a página de pagamento mostra só o código PIX copia-e-cola
+    segno = None
 try:
     import pymysql
     pymysql.install_as_MySQLdb()
 except Exception:
     # Se PyMySQL não estiver instalado, SQLAlchemy tentará usar MySQLdb (mysqlclient)
     pass
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, render_template_string, request, redirect, url_for, session, flash, jsonify, g
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
 from flask_sqlalchemy import SQLAlchemy
 from decimal import Decimal
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.datastructures import CallbackDict
+from markupsafe import escape, Markup
+from jinja2 import nodes
+from jinja2.ext import Extension
+import io
 import json
-from datetime import datetime
-import uuid
+import hashlib
+import hmac
+import re
+import secrets
+import math
+import random
+import zlib
+import unicodedata
+import ast
+from datetime import datetime, timedelta
+from collections import OrderedDict, Counter
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field, asdict
 import click
 import urllib.parse
+import urllib.request
+import smtplib
+from email.message import EmailMessage
 from dotenv import load_dotenv
 
 try:
@@ -59,16 +99,109 @@ class Produto(db.Model):
     visivel = db.Column(db.Boolean, default=True)
     # Adicione outros campos conforme necessário
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+# 🗄️ Gerenciador de conexões SQLite
+# Cada thread (worker do gunicorn ou thread do servidor de dev) mantém uma conexão
+# de escrita e uma de leitura abertas e as reaproveita entre requisições.
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024)))
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
+
+_db_local = threading.local()
+
+class PooledConnection(sqlite3.Connection):
+    """Conexão reaproveitável: close() devolve ao pool da thread em vez de fechar.
+
+    Como a mesma conexão pode ser pedida por funções aninhadas (ex.: is_admin()
+    dentro de uma rota), um contador de uso garante que só o último close()
+    descarta transações não confirmadas, como o close() original faria.
+    Ações em apos_commit rodam só depois do commit (o rollback as descarta).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uso = 0
+        self.apos_commit = []
+
+    def commit(self):
+        super().commit()
+        acoes, self.apos_commit = self.apos_commit, []
+        for acao in acoes:
+            acao()
+
+    def rollback(self):
+        super().rollback()
+        self.apos_commit = []
+
+    def close(self):
+        self.uso = max(0, self.uso - 1)
+        if self.uso == 0 and self.in_transaction:
+            self.rollback()
+
+    def liberar(self):
+        """Zera o contador e descarta transações pendentes (fim da requisição)."""
+        self.uso = 0
+        if self.in_transaction:
+            self.rollback()
+
+    def fechar(self):
+        """Fecha de fato a conexão SQLite."""
+        super().close()
+
+def _abrir_conexao(readonly=False):
+    """Abre uma conexão nova já com os PRAGMAs de desempenho aplicados"""
+    timeout = SQLITE_BUSY_TIMEOUT_MS / 1000
+    if readonly:
+        uri = f"file:{urllib.parse.quote(DB_PATH)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=timeout, factory=PooledConnection,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        conn.execute('PRAGMA query_only = 1')
+    else:
+        conn = sqlite3.connect(DB_PATH, timeout=timeout, factory=PooledConnection,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        # WAL: leitores não bloqueiam o escritor (e vice-versa); persiste no arquivo
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
     conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
     return conn
 
-def ensure_is_admin_column(conn):
-    cols = [r['name'] for r in conn.execute("PRAGMA table_info(usuarios)").fetchall()]
-    if 'is_admin' not in cols:
-        conn.execute("ALTER TABLE usuarios ADD COLUMN is_admin INTEGER NOT NULL DEFAULT 0")
-        conn.commit()
+def _pool_da_thread():
+    """Conexões da thread atual; descarta as herdadas de outro processo (fork)."""
+    if getattr(_db_local, 'pid', None) != os.getpid():
+        _db_local.pid = os.getpid()
+        _db_local.conexoes = {}
+    return _db_local.conexoes
+
+def get_db_connection(readonly=False):
+    """Retorna a conexão SQLite da thread atual.
+
+    readonly=True usa uma conexão somente leitura separada, indicada para
+    leituras do catálogo. Chamar conn.close() continua sendo o esperado.
+    """
+    pool = _pool_da_thread()
+    conn = pool.get(readonly)
+    if conn is None:
+        try:
+            conn = _abrir_conexao(readonly)
+        except sqlite3.OperationalError:
+            if not readonly:
+                raise
+            # Banco ainda não criado: usa a conexão de escrita
+            return get_db_connection()
+        pool[readonly] = conn
+    conn.uso += 1
+    return conn
+
+def fechar_conexoes_da_thread():
+    """Fecha de fato as conexões da thread atual (CLI, testes, troca de banco)."""
+    pool = _pool_da_thread()
+    for conn in pool.values():
+        conn.fechar()
+    pool.clear()
 
 def ensure_password_column(conn):
     cols = [r['name'] for r in conn.execute("PRAGMA table_info(usuarios)").fetchall()]
@@ -81,37 +214,804 @@ def ensure_password_column(conn):
     conn.commit()
     return 'senha_hash'
 
-def ensure_tamanhos_column(conn):
-    """Garante que a coluna tamanhos existe na tabela produtos"""
-    cols = [r['name'] for r in conn.execute("PRAGMA table_info(produtos)").fetchall()]
-    if 'tamanhos' not in cols:
-        conn.execute("ALTER TABLE produtos ADD COLUMN tamanhos TEXT")
-        conn.commit()
-        print("✅ Coluna 'tamanhos' adicionada à tabela produtos")
+class TravaArquivo:
+    """Trava exclusiva entre processos (gunicorn sobe vários workers ao mesmo tempo)"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    def __enter__(self):
+        self.arquivo = open(self.caminho, 'a+')
+        if fcntl:
+            fcntl.flock(self.arquivo.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.arquivo.fileno(), fcntl.LOCK_UN)
+        self.arquivo.close()
+
+class TrabalhoEmSegundoPlano:
+    """Roda `funcao` num thread daemon do processo, a cada `intervalo` s ou quando
+    acordado (acordar(), em geral via conn.apos_commit de quem gerou o trabalho).
+
+    Um thread por processo, recriado nos filhos do fork do gunicorn. `funcao`
+    devolve True quando ainda sobrou trabalho, e então roda de novo sem esperar.
+    """
+
+    def __init__(self, nome, funcao, intervalo):
+        self.nome = nome
+        self.funcao = funcao
+        self.intervalo = intervalo
+        self._evento = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def garantir(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._evento = threading.Event()
+        threading.Thread(target=self._rodar, args=(self._evento,), name=self.nome, daemon=True).start()
+
+    def acordar(self):
+        self.garantir()
+        self._evento.set()
+
+    def _rodar(self, evento):
+        while True:
+            evento.wait(self.intervalo)
+            evento.clear()
+            try:
+                while self.funcao():
+                    pass
+            except Exception as e:
+                print(f"Erro em {self.nome}: {e}")
+
+# 🧱 Migrações de schema
+# Cada migração roda uma única vez, em ordem, e o número da última aplicada fica
+# em PRAGMA user_version (histórico na tabela schema_version). Elas rodam na
+# inicialização (init_db) ou via `flask upgrade-db`; as rotas nunca inspecionam
+# o schema. Para evoluir o banco, acrescente uma nova função com @migracao(N).
+# O corpo de uma migração não muda depois de publicado; o que depende do código
+# atual (p.ex. preencher uma tabela derivada) vai em `depois`, que roda quando
+# todas as pendentes já foram aplicadas, com o schema final.
+MIGRACOES = []
+MIGRACOES_DEPOIS = {}
+MIGRACAO_LOCK_PATH = DB_PATH + '.migracao.lock'
+
+def migracao(numero, descricao, depois=None):
+    """Registra uma migração de schema (e o passo `depois(conn)`, se houver)"""
+    def registrar(func):
+        MIGRACOES.append((numero, descricao, func))
+        MIGRACOES.sort(key=lambda m: m[0])
+        if depois:
+            MIGRACOES_DEPOIS[numero] = depois
+        return func
+    return registrar
+
+def _adicionar_coluna(conn, tabela, coluna, definicao):
+    """ALTER TABLE ADD COLUMN idempotente (bancos antigos podem já ter a coluna)"""
+    cols = [r['name'] for r in conn.execute(f"PRAGMA table_info({tabela})").fetchall()]
+    if coluna not in cols:
+        conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+
+@migracao(1, 'Tabelas base: usuarios, produtos e pedidos')
+def _migracao_tabelas_base(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            senha TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS produtos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            preco REAL NOT NULL,
+            imagem TEXT,
+            categoria TEXT,
+            descricao TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pedidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER,
+            nome_cliente TEXT NOT NULL,
+            email_cliente TEXT NOT NULL,
+            telefone TEXT,
+            cep TEXT NOT NULL,
+            endereco TEXT NOT NULL,
+            numero TEXT NOT NULL,
+            complemento TEXT,
+            bairro TEXT NOT NULL,
+            cidade TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            metodo_pagamento TEXT NOT NULL,
+            total REAL NOT NULL,
+            status TEXT DEFAULT 'Pendente',
+            itens TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        )
+    ''')
+
+@migracao(2, 'Coluna usuarios.is_admin')
+def _migracao_is_admin(conn):
+    _adicionar_coluna(conn, 'usuarios', 'is_admin', 'INTEGER NOT NULL DEFAULT 0')
+
+@migracao(3, 'Colunas tamanhos, estoque, imagens_adicionais e visivel em produtos')
+def _migracao_colunas_produtos(conn):
+    _adicionar_coluna(conn, 'produtos', 'tamanhos', 'TEXT')
+    _adicionar_coluna(conn, 'produtos', 'estoque', 'INTEGER DEFAULT 0')
+    _adicionar_coluna(conn, 'produtos', 'imagens_adicionais', 'TEXT')
+    _adicionar_coluna(conn, 'produtos', 'visivel', 'INTEGER NOT NULL DEFAULT 1')
+
+@migracao(4, 'Tabela versoes (contadores de invalidação de cache)')
+def _migracao_versoes(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS versoes (
+            nome TEXT PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+@migracao(5, 'Tabela imagens_derivadas (versões WebP redimensionadas)')
+def _migracao_imagens_derivadas(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS imagens_derivadas (
+            imagem TEXT NOT NULL,
+            variante TEXT NOT NULL,
+            arquivo TEXT NOT NULL,
+            largura INTEGER NOT NULL,
+            altura INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            PRIMARY KEY (imagem, variante)
+        )
+    ''')
+
+@migracao(6, 'Tabela imagens_armazenadas (contagem de referências das imagens)')
+def _migracao_imagens_armazenadas(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS imagens_armazenadas (
+            imagem TEXT PRIMARY KEY,
+            referencias INTEGER NOT NULL DEFAULT 0,
+            criada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+@migracao(7, 'Tabela tarefas_imagens (processamento de uploads em segundo plano)')
+def _migracao_tarefas_imagens(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tarefas_imagens (
+            id TEXT PRIMARY KEY,
+            produto_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'processando',
+            total INTEGER NOT NULL,
+            concluidas INTEGER NOT NULL DEFAULT 0,
+            falhas INTEGER NOT NULL DEFAULT 0,
+            mensagem TEXT,
+            criada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            atualizada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+@migracao(8, 'Tabela pedido_itens (itens de pedidos.itens normalizados)')
+def _migracao_pedido_itens(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pedido_itens (
+            pedido_id INTEGER NOT NULL REFERENCES pedidos (id) ON DELETE CASCADE,
+            produto_id INTEGER NOT NULL,
+            tamanho TEXT NOT NULL DEFAULT '',
+            cor TEXT NOT NULL DEFAULT '',
+            nome TEXT NOT NULL,
+            preco REAL NOT NULL,
+            quantidade INTEGER NOT NULL,
+            subtotal REAL NOT NULL,
+            imagem TEXT,
+            criado_em TIMESTAMP NOT NULL,
+            categoria TEXT,
+            PRIMARY KEY (pedido_id, produto_id, tamanho, cor)
+        )
+    ''')
+    # Agregações por produto e por período (criado_em copia pedidos.created_at)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pedido_itens_produto ON pedido_itens (produto_id, criado_em)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pedido_itens_criado_em ON pedido_itens (criado_em)')
+
+    # Backfill a partir do JSON dos pedidos existentes. A lógica fica congelada aqui
+    # (nada de registrar_itens_pedido, que muda com a aplicação); itens que não dão
+    # para converter são pulados em vez de abortar a migração.
+    linhas = []
+    for pedido in conn.execute('SELECT id, itens, created_at FROM pedidos').fetchall():
+        try:
+            itens = json.loads(pedido['itens'] or '[]')
+        except (json.JSONDecodeError, TypeError):
+            itens = None
+        if not isinstance(itens, list):
+            print(f"Aviso: pedido {pedido['id']} com itens inválidos, ignorado no backfill")
+            continue
+        for item in itens:
+            if not isinstance(item, dict) or item.get('produto_id') is None:
+                continue
+            try:
+                produto_id = int(item['produto_id'])
+                preco = float(item.get('preco') or 0)
+                quantidade = int(item.get('quantidade') or 0)
+                subtotal = float(item.get('subtotal', preco * quantidade))
+            except (TypeError, ValueError):
+                print(f"Aviso: item inválido no pedido {pedido['id']} ignorado no backfill: {item!r}")
+                continue
+            imagem = item.get('imagem')
+            linhas.append((pedido['id'], produto_id, str(item.get('tamanho') or ''), str(item.get('cor') or ''),
+                           str(item.get('nome') or ''), preco, quantidade, subtotal,
+                           imagem if isinstance(imagem, str) else None, pedido['created_at'], produto_id))
+    conn.executemany('''
+        INSERT INTO pedido_itens (pedido_id, produto_id, tamanho, cor, nome, preco, quantidade, subtotal, imagem,
+                                  criado_em, categoria)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP),
+                (SELECT categoria FROM produtos WHERE id = ?))
+        ON CONFLICT (pedido_id, produto_id, tamanho, cor) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            subtotal = subtotal + excluded.subtotal
+    ''', linhas)
+
+@migracao(9, 'Rollups de vendas por hora/dia, categoria e produto')
+def _migracao_rollups_vendas(conn):
+    # Categoria do produto no momento da venda (o produto pode mudar de categoria depois).
+    # Bancos criados depois desta versão já têm a coluna pela migração 8.
+    _adicionar_coluna(conn, 'pedido_itens', 'categoria', 'TEXT')
+    conn.execute('''
+        UPDATE pedido_itens SET categoria = (SELECT categoria FROM produtos WHERE produtos.id = pedido_itens.produto_id)
+        WHERE categoria IS NULL
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vendas_hora (
+            hora TEXT NOT NULL,
+            status TEXT NOT NULL,
+            pedidos INTEGER NOT NULL DEFAULT 0,
+            receita REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (hora, status)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vendas_dia (
+            dia TEXT NOT NULL,
+            status TEXT NOT NULL,
+            pedidos INTEGER NOT NULL DEFAULT 0,
+            receita REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, status)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vendas_categoria_dia (
+            dia TEXT NOT NULL,
+            status TEXT NOT NULL,
+            categoria TEXT NOT NULL,
+            pedidos INTEGER NOT NULL DEFAULT 0,
+            unidades INTEGER NOT NULL DEFAULT 0,
+            receita REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, status, categoria)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vendas_produto_dia (
+            dia TEXT NOT NULL,
+            status TEXT NOT NULL,
+            produto_id INTEGER NOT NULL,
+            categoria TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            unidades INTEGER NOT NULL DEFAULT 0,
+            receita REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, status, produto_id, categoria)
+        )
+    ''')
+    # Carga inicial congelada nesta versão (reconstruir_rollups_vendas pode mudar)
+    for tabela in ('vendas_hora', 'vendas_dia', 'vendas_categoria_dia', 'vendas_produto_dia'):
+        conn.execute(f'DELETE FROM {tabela}')
+    conn.execute('''
+        INSERT INTO vendas_hora (hora, status, pedidos, receita)
+        SELECT substr(created_at, 1, 13), COALESCE(status, 'Pendente'), COUNT(*), SUM(total) FROM pedidos GROUP BY 1, 2
+    ''')
+    conn.execute('''
+        INSERT INTO vendas_dia (dia, status, pedidos, receita)
+        SELECT substr(created_at, 1, 10), COALESCE(status, 'Pendente'), COUNT(*), SUM(total) FROM pedidos GROUP BY 1, 2
+    ''')
+    conn.execute('''
+        INSERT INTO vendas_categoria_dia (dia, status, categoria, pedidos, unidades, receita)
+        SELECT substr(p.created_at, 1, 10), COALESCE(p.status, 'Pendente'), COALESCE(i.categoria, ''),
+               COUNT(DISTINCT i.pedido_id), SUM(i.quantidade), SUM(i.subtotal)
+        FROM pedido_itens i JOIN pedidos p ON p.id = i.pedido_id
+        GROUP BY 1, 2, 3
+    ''')
+    conn.execute('''
+        INSERT INTO vendas_produto_dia (dia, status, produto_id, categoria, nome, unidades, receita)
+        SELECT substr(p.created_at, 1, 10), COALESCE(p.status, 'Pendente'), i.produto_id, COALESCE(i.categoria, ''),
+               MAX(i.nome), SUM(i.quantidade), SUM(i.subtotal)
+        FROM pedido_itens i JOIN pedidos p ON p.id = i.pedido_id
+        GROUP BY 1, 2, 3, 4
+    ''')
+
+# 🗂️ Índices gerenciados
+# Definição de cada índice secundário (nome -> "tabela (colunas) [WHERE ...]").
+# garantir_indices cria os que faltam e recria os que mudaram de definição; para
+# alterar um índice, edite aqui e registre uma migração que chame garantir_indices.
+INDICES = {
+    # Vitrine: categoria = ? ORDER BY id DESC (e DISTINCT categoria) só de produtos visíveis
+    'idx_produtos_vitrine': 'produtos (categoria, id DESC) WHERE visivel = 1',
+    # "Meus pedidos": usuario_id = ? ORDER BY created_at DESC
+    'idx_pedidos_usuario': 'pedidos (usuario_id, created_at DESC)',
+    'idx_pedidos_status': 'pedidos (status, created_at)',
+    'idx_pedido_itens_produto': 'pedido_itens (produto_id, criado_em)',
+    'idx_pedido_itens_criado_em': 'pedido_itens (criado_em)',
+    # Limpeza das sessões vencidas
+    'idx_sessoes_expira_em': 'sessoes (expira_em)',
+    # Reservas ainda ativas: vencidas por produto (na compra) e todas (varredura)
+    'idx_reservas_ativas_produto': "reservas_estoque (produto_id, expira_em) WHERE status = 'ativa'",
+    'idx_reservas_ativas_expira_em': "reservas_estoque (expira_em) WHERE status = 'ativa'",
+    'idx_reservas_pedido': 'reservas_estoque (pedido_id)',
+    # Limpeza das chaves de idempotência vencidas
+    'idx_chaves_idempotencia_expira_em': 'chaves_idempotencia (expira_em)',
+    # Fila do worker de notificações: só as pendentes, pela hora da próxima tentativa
+    'idx_notificacoes_fila': "notificacoes (proxima_tentativa) WHERE status = 'pendente'",
+}
+# usuarios.email já é UNIQUE (sqlite_autoindex_usuarios_1) desde a migração 1
+
+def _normalizar_sql(sql):
+    return ' '.join((sql or '').split())
+
+def garantir_indices(conn):
+    """Cria/recria os índices de INDICES cujas tabelas já existem"""
+    tabelas = {r['name'] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    existentes = {r['name']: r['sql'] for r in conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index'")}
+    alterados = []
+    for nome, definicao in INDICES.items():
+        if definicao.split()[0] not in tabelas:
+            continue
+        sql = f'CREATE INDEX {nome} ON {definicao}'
+        if nome in existentes:
+            if _normalizar_sql(existentes[nome]) == _normalizar_sql(sql):
+                continue
+            conn.execute(f'DROP INDEX {nome}')
+        conn.execute(sql)
+        alterados.append(nome)
+    if alterados:
+        conn.execute('ANALYZE')
+    return alterados
+
+@migracao(10, 'Índices secundários de produtos e pedidos')
+def _migracao_indices(conn):
+    garantir_indices(conn)
+
+@migracao(11, 'Busca textual de produtos (FTS5 produtos_busca + gatilhos)')
+def _migracao_busca_produtos(conn):
+    # Conteúdo externo: o índice guarda só os tokens e lê o texto de produtos
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS produtos_busca USING fts5(
+            nome, descricao, categoria,
+            content='produtos', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS produtos_busca_ai AFTER INSERT ON produtos BEGIN
+            INSERT INTO produtos_busca (rowid, nome, descricao, categoria)
+            VALUES (new.id, new.nome, new.descricao, new.categoria);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS produtos_busca_ad AFTER DELETE ON produtos BEGIN
+            INSERT INTO produtos_busca (produtos_busca, rowid, nome, descricao, categoria)
+            VALUES ('delete', old.id, old.nome, old.descricao, old.categoria);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS produtos_busca_au AFTER UPDATE OF nome, descricao, categoria ON produtos BEGIN
+            INSERT INTO produtos_busca (produtos_busca, rowid, nome, descricao, categoria)
+            VALUES ('delete', old.id, old.nome, old.descricao, old.categoria);
+            INSERT INTO produtos_busca (rowid, nome, descricao, categoria)
+            VALUES (new.id, new.nome, new.descricao, new.categoria);
+        END
+    ''')
+    conn.execute("INSERT INTO produtos_busca (produtos_busca) VALUES ('rebuild')")
+
+def _enfileirar_relacionados(conn):
+    # Tabela derivada: quem preenche é o recálculo em segundo plano (todos os
+    # produtos), com o código atual e o schema final
+    marcar_relacionados(conn)
+
+@migracao(12, 'Tabela produtos_relacionados (candidatos pré-calculados)', depois=_enfileirar_relacionados)
+def _migracao_produtos_relacionados(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS produtos_relacionados (
+            produto_id INTEGER NOT NULL,
+            posicao INTEGER NOT NULL,
+            relacionado_id INTEGER NOT NULL,
+            pontuacao REAL NOT NULL,
+            PRIMARY KEY (produto_id, posicao)
+        )
+    ''')
+
+@migracao(13, 'Tabela sessoes (sessões guardadas no servidor)')
+def _migracao_sessoes(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessoes (
+            id TEXT PRIMARY KEY,
+            dados BLOB NOT NULL,
+            expira_em REAL NOT NULL
+        )
+    ''')
+    garantir_indices(conn)
+
+@migracao(14, 'Tabela reservas_estoque (baixa de estoque na criação do pedido)')
+def _migracao_reservas_estoque(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reservas_estoque (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pedido_id INTEGER NOT NULL,
+            produto_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'ativa',
+            expira_em REAL NOT NULL,
+            criada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    garantir_indices(conn)
+
+@migracao(15, 'Tabela chaves_idempotencia (respostas dos pedidos por Idempotency-Key)')
+def _migracao_chaves_idempotencia(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chaves_idempotencia (
+            rota TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            hash_requisicao TEXT NOT NULL,
+            pedido_id INTEGER,
+            status INTEGER NOT NULL,
+            resposta TEXT NOT NULL,
+            expira_em REAL NOT NULL,
+            PRIMARY KEY (rota, chave)
+        ) WITHOUT ROWID
+    ''')
+    garantir_indices(conn)
+
+@migracao(16, 'Tabela notificacoes (outbox de WhatsApp e e-mail dos pedidos)')
+def _migracao_notificacoes(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notificacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pedido_id INTEGER NOT NULL,
+            canal TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pendente',
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            proxima_tentativa REAL NOT NULL,
+            erro TEXT,
+            criada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            enviada_em TIMESTAMP
+        )
+    ''')
+    garantir_indices(conn)
+
+@migracao(17, 'Tabela pedidos_pix (BR Code e QR gerados por pedido)')
+def _migracao_pedidos_pix(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pedidos_pix (
+            pedido_id INTEGER PRIMARY KEY,
+            chave_cache TEXT NOT NULL,
+            codigo TEXT NOT NULL,
+            qr_svg TEXT,
+            qr_png BLOB,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+@migracao(18, 'Tabela relacionados_pendentes (recálculo dos relacionados fora das escritas)')
+def _migracao_relacionados_pendentes(conn):
+    # produto_id 0 = recalcular todos
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS relacionados_pendentes (
+            produto_id INTEGER PRIMARY KEY
+        )
+    ''')
+
+@migracao(19, 'Tabela pagamentos_revisao (PIX recebido depois do cancelamento do pedido)')
+def _migracao_pagamentos_revisao(conn):
+    # situacao: reativado (estoque reservado de novo, pedido pago) ou reembolsar
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pagamentos_revisao (
+            pedido_id INTEGER PRIMARY KEY,
+            valor REAL,
+            end_to_end_id TEXT,
+            situacao TEXT NOT NULL,
+            recebido_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            resolvido_em TIMESTAMP
+        )
+    ''')
+
+def versao_schema(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def aplicar_migracoes():
+    """Aplica as migrações pendentes e retorna a lista das que rodaram"""
+    aplicadas = []
+    conn = get_db_connection()
+    try:
+        # Caminho rápido: nada pendente, nem precisa da trava
+        if versao_schema(conn) >= MIGRACOES[-1][0]:
+            return aplicadas
+        with TravaArquivo(MIGRACAO_LOCK_PATH):
+            for numero, descricao, func in MIGRACOES:
+                # Relê a cada passo: outro processo pode ter migrado enquanto esperávamos
+                if versao_schema(conn) >= numero:
+                    continue
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    func(conn)
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS schema_version (
+                            versao INTEGER PRIMARY KEY,
+                            descricao TEXT NOT NULL,
+                            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    ''')
+                    conn.execute('INSERT OR REPLACE INTO schema_version (versao, descricao) VALUES (?, ?)',
+                                 (numero, descricao))
+                    conn.execute(f'PRAGMA user_version = {int(numero)}')
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                aplicadas.append(numero)
+                print(f"✅ Migração {numero} aplicada: {descricao}")
+            for numero in aplicadas:
+                if numero not in MIGRACOES_DEPOIS:
+                    continue
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    MIGRACOES_DEPOIS[numero](conn)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        return aplicadas
+    finally:
+        conn.close()
+
+def ler_versao(nome, conn=None):
+    """Lê o contador de versão compartilhado entre os workers (0 se não existir)"""
+    close_conn = conn is None
+    if close_conn:
+        conn = get_db_connection(readonly=True)
+    try:
+        row = conn.execute('SELECT versao FROM versoes WHERE nome = ?', (nome,)).fetchone()
+        return row['versao'] if row else 0
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        if close_conn:
+            conn.close()
+
+def incrementar_versao(nome, conn):
+    """Incrementa o contador dentro da transação do chamador (quem chama faz o commit)"""
+    conn.execute('''
+        INSERT INTO versoes (nome, versao) VALUES (?, 1)
+        ON CONFLICT(nome) DO UPDATE SET versao = versao + 1
+    ''', (nome,))
+
+# 🍪 Sessões no servidor
+# O cookie leva só um id opaco; o conteúdo da sessão (sacola, mensagem do pedido,
+# flashes) fica num armazém no servidor. O valor é o JSON com tags do Flask, sem
+# espaços, comprimido com zlib a partir de SESSAO_COMPRIMIR_BYTES. Backends
+# (SESSAO_BACKEND): sqlite (padrão, tabela sessoes, vale para todos os workers),
+# memoria (um processo só: desenvolvimento e testes) e cookie (sessão assinada
+# padrão do Flask). Sessões vencidas são apagadas a cada SESSAO_LIMPEZA_INTERVALO s.
+SESSAO_BACKEND = os.getenv('SESSAO_BACKEND', 'sqlite')
+SESSAO_COMPRIMIR_BYTES = 512
+SESSAO_LIMPEZA_INTERVALO = int(os.getenv('SESSAO_LIMPEZA_INTERVALO', '300'))
+SESSAO_ID_VALIDO = re.compile(r'[A-Za-z0-9_-]{43}')
+_serializador_sessao = TaggedJSONSerializer()
+
+def codificar_sessao(dados):
+    bruto = _serializador_sessao.dumps(dict(dados)).encode('utf-8')
+    if len(bruto) >= SESSAO_COMPRIMIR_BYTES:
+        return b'z' + zlib.compress(bruto, 6)
+    return b'j' + bruto
+
+def decodificar_sessao(valor):
+    valor = bytes(valor)
+    bruto = zlib.decompress(valor[1:]) if valor[:1] == b'z' else valor[1:]
+    return _serializador_sessao.loads(bruto.decode('utf-8'))
+
+class SessaoServidor(CallbackDict, SessionMixin):
+    """Sessão guardada no servidor; `sid` é o id que vai no cookie"""
+
+    def __init__(self, dados=None, sid=None):
+        def ao_alterar(sessao):
+            sessao.modified = True
+            sessao.accessed = True
+        super().__init__(dados, ao_alterar)
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        # Regrava sem alterações só para estender a validade no armazém
+        self.renovar = False
+        self.usuario_inicial = dict.get(self, 'user_id')
+
+    def __getitem__(self, chave):
+        self.accessed = True
+        return super().__getitem__(chave)
+
+    def get(self, chave, padrao=None):
+        self.accessed = True
+        return super().get(chave, padrao)
 
-def ensure_estoque_column(conn):
-    """Garante que a coluna estoque existe na tabela produtos"""
-    cols = [r['name'] for r in conn.execute("PRAGMA table_info(produtos)").fetchall()]
-    if 'estoque' not in cols:
-        conn.execute("ALTER TABLE produtos ADD COLUMN estoque INTEGER DEFAULT 0")
+    def setdefault(self, chave, padrao=None):
+        self.accessed = True
+        return super().setdefault(chave, padrao)
+
+class ArmazemSessoesMemoria:
+    """sid -> (valor, expira_em) num dict do processo"""
+
+    def __init__(self):
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def obter(self, sid):
+        with self._lock:
+            item = self._dados.get(sid)
+        if not item or item[1] <= time.time():
+            return None, None
+        return item
+
+    def gravar(self, sid, valor, expira_em):
+        with self._lock:
+            self._dados[sid] = (valor, expira_em)
+
+    def remover(self, sid):
+        with self._lock:
+            self._dados.pop(sid, None)
+
+    def limpar_expiradas(self):
+        agora = time.time()
+        with self._lock:
+            vencidas = [sid for sid, (_, expira_em) in self._dados.items() if expira_em <= agora]
+            for sid in vencidas:
+                del self._dados[sid]
+        return len(vencidas)
+
+class ArmazemSessoesSQLite:
+    """Tabela sessoes, com conexão própria por thread: gravar a sessão não pode
+    confirmar nem descartar a transação da rota na conexão do pool."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _conn(self):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = _abrir_conexao()
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def obter(self, sid):
+        row = self._conn().execute(
+            'SELECT dados, expira_em FROM sessoes WHERE id = ? AND expira_em > ?', (sid, time.time())).fetchone()
+        return (row['dados'], row['expira_em']) if row else (None, None)
+
+    def gravar(self, sid, valor, expira_em):
+        conn = self._conn()
+        conn.execute('''
+            INSERT INTO sessoes (id, dados, expira_em) VALUES (?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET dados = excluded.dados, expira_em = excluded.expira_em
+        ''', (sid, valor, expira_em))
         conn.commit()
-        print("✅ Coluna 'estoque' adicionada à tabela produtos")
 
-def ensure_imagens_adicionais_column(conn):
-    """Garante que a coluna imagens_adicionais existe na tabela produtos"""
-    cols = [r['name'] for r in conn.execute("PRAGMA table_info(produtos)").fetchall()]
-    if 'imagens_adicionais' not in cols:
-        conn.execute("ALTER TABLE produtos ADD COLUMN imagens_adicionais TEXT")
+    def remover(self, sid):
+        conn = self._conn()
+        conn.execute('DELETE FROM sessoes WHERE id = ?', (sid,))
         conn.commit()
-        print("✅ Coluna 'imagens_adicionais' adicionada à tabela produtos")
 
-def ensure_visivel_column(conn):
-    """Garante que a coluna visivel existe na tabela produtos"""
-    cols = [r['name'] for r in conn.execute("PRAGMA table_info(produtos)").fetchall()]
-    if 'visivel' not in cols:
-        conn.execute("ALTER TABLE produtos ADD COLUMN visivel INTEGER NOT NULL DEFAULT 1")
+    def limpar_expiradas(self):
+        conn = self._conn()
+        apagadas = conn.execute('DELETE FROM sessoes WHERE expira_em <= ?', (time.time(),)).rowcount
         conn.commit()
-        print("✅ Coluna 'visivel' adicionada à tabela produtos")
+        return apagadas
+
+class InterfaceSessaoServidor(SessionInterface):
+    """SessionInterface do Flask sobre um armazém (memória ou SQLite)"""
+
+    def __init__(self, armazem):
+        self.armazem = armazem
+        # Lê cookies assinados de antes da troca para não perder sacolas no deploy
+        self._cookie_assinado = SecureCookieSessionInterface()
+        self._ultima_limpeza = 0.0
+
+    def _validade(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return SessaoServidor()
+        if not SESSAO_ID_VALIDO.fullmatch(sid):
+            antiga = self._cookie_assinado.open_session(app, request)
+            sessao = SessaoServidor(dict(antiga or {}))
+            sessao.modified = bool(antiga)
+            return sessao
+        try:
+            valor, expira_em = self.armazem.obter(sid)
+            if valor is not None:
+                sessao = SessaoServidor(decodificar_sessao(valor), sid)
+                sessao.renovar = expira_em - time.time() < self._validade(app) / 2
+                return sessao
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            print(f"Erro ao ler sessão: {e}")
+        return SessaoServidor()
+
+    def save_session(self, app, session, response):
+        nome = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            # Sessão esvaziada (logout): apaga no servidor e no navegador
+            if session.sid and session.modified:
+                self.armazem.remover(session.sid)
+                response.delete_cookie(nome, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        if session.sid and session.get('user_id') != session.usuario_inicial:
+            # Login ou troca de usuário: id novo contra fixação de sessão
+            self.armazem.remover(session.sid)
+            session.sid = None
+        id_novo = session.sid is None
+        if id_novo:
+            session.sid = secrets.token_urlsafe(32)
+
+        if id_novo or session.modified or session.renovar:
+            self.armazem.gravar(session.sid, codificar_sessao(session), time.time() + self._validade(app))
+        if id_novo or self.should_set_cookie(app, session):
+            response.set_cookie(nome, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
+        self._limpar_se_preciso()
+
+    def _limpar_se_preciso(self):
+        agora = time.monotonic()
+        if agora - self._ultima_limpeza < SESSAO_LIMPEZA_INTERVALO:
+            return
+        self._ultima_limpeza = agora
+        try:
+            self.armazem.limpar_expiradas()
+        except sqlite3.Error as e:
+            print(f"Erro ao limpar sessões expiradas: {e}")
+
+def criar_interface_sessao(backend):
+    """SessionInterface do backend escolhido (None mantém a sessão em cookie do Flask)"""
+    if backend == 'cookie':
+        return None
+    if backend == 'memoria':
+        return InterfaceSessaoServidor(ArmazemSessoesMemoria())
+    if backend != 'sqlite':
+        print(f"Aviso: SESSAO_BACKEND '{backend}' desconhecido, usando sqlite")
+    return InterfaceSessaoServidor(ArmazemSessoesSQLite())
+
+_interface_sessao = criar_interface_sessao(SESSAO_BACKEND)
+if _interface_sessao:
+    app.session_interface = _interface_sessao
 
 # Filtro personalizado para converter JSON no template
 @app.template_filter('fromjson')
@@ -131,15 +1031,257 @@ def inject_config():
     except:
         return dict(global_config={})
 
-# 🧹 Middleware para FORÇAR limpeza de cache
+# 🎁 Bundles de assets (CSS/JS)
+# `flask build-assets` concatena e minifica cada bundle em static/dist/<nome>.<hash>.<ext>
+# e grava static/dist/manifest.json. Com o manifest presente os templates carregam um
+# único arquivo nomeado pelo conteúdo (cache imutável); sem ele (desenvolvimento),
+# asset_urls() devolve os arquivos de origem com ?v=<hash do conteúdo>.
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+ASSETS_DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+ASSETS_DIST_URL = '/static/dist/'
+ASSETS_MANIFEST_PATH = os.path.join(ASSETS_DIST_DIR, 'manifest.json')
+ASSETS_USAR_BUNDLES = os.getenv('ASSETS_USAR_BUNDLES', '1') == '1'
+
+# Ordem dos arquivos = ordem em que eram carregados nos templates
+ASSET_BUNDLES = {
+    'base.css': [
+        'css/filters.css',
+        'css/products-cards.css',
+        'css/vibrant-theme.css',
+        'css/sacola-lateral.css',
+        'css/banner-images.css',
+        'css/base.css',
+    ],
+    'index.css': ['css/modern-products.css', 'css/index.css'],
+    'base.js': ['js/base.js'],
+    'index.js': ['js/index.js'],
+    'pagamento-pix.js': ['js/pagamento-pix.js'],
+}
+
+_hashes_assets = {}
+_manifest_assets = {'mtime': None, 'bundles': {}}
+
+def _hash_asset(filename):
+    """Hash curto do conteúdo de um arquivo de static/ (recalculado só se o mtime mudar)"""
+    caminho = os.path.join(STATIC_DIR, filename)
+    try:
+        mtime = os.path.getmtime(caminho)
+    except OSError:
+        return None
+    atual = _hashes_assets.get(filename)
+    if atual and atual[0] == mtime:
+        return atual[1]
+    with open(caminho, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:10]
+    _hashes_assets[filename] = (mtime, digest)
+    return digest
+
+def _manifest_bundles():
+    try:
+        mtime = os.path.getmtime(ASSETS_MANIFEST_PATH)
+    except OSError:
+        return {}
+    if mtime != _manifest_assets['mtime']:
+        try:
+            with open(ASSETS_MANIFEST_PATH, 'r', encoding='utf-8') as f:
+                bundles = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao ler manifest de assets: {e}")
+            bundles = {}
+        _manifest_assets.update(mtime=mtime, bundles=bundles)
+    return _manifest_assets['bundles']
+
+@app.template_global()
+def asset_url(filename, **values):
+    """Como url_for('static', filename=...), com ?v=<hash> para cache imutável"""
+    versao = _hash_asset(filename)
+    if versao:
+        values['v'] = versao
+    return url_for('static', filename=filename, **values)
+
+@app.template_global()
+def asset_urls(bundle):
+    """URLs a carregar para um bundle: o arquivo gerado, ou as fontes em desenvolvimento"""
+    if ASSETS_USAR_BUNDLES:
+        gerado = _manifest_bundles().get(bundle)
+        if gerado and os.path.exists(os.path.join(ASSETS_DIST_DIR, gerado)):
+            return [url_for('static', filename=f'dist/{gerado}')]
+    return [asset_url(f) for f in ASSET_BUNDLES[bundle]]
+
+def _minificar_css(texto):
+    """Minificação conservadora: comentários, espaços e ';' antes de '}'"""
+    texto = re.sub(r'/\*.*?\*/', '', texto, flags=re.S)
+    texto = re.sub(r'\s+', ' ', texto)
+    texto = re.sub(r'\s*([{};,>])\s*', r'\1', texto)
+    texto = texto.replace(';}', '}')
+    return texto.strip() + '\n'
+
+def _minificar_js(texto):
+    """Minificação conservadora: remove indentação, linhas vazias e comentários de linha inteira.
+    As quebras de linha são mantidas (o código depende de inserção automática de ';')."""
+    linhas = []
+    for linha in texto.splitlines():
+        linha = linha.strip()
+        if not linha or linha.startswith('//'):
+            continue
+        linhas.append(linha)
+    return '\n'.join(linhas) + '\n'
+
+def gerar_bundles():
+    """Gera os bundles em static/dist, grava o manifest e remove versões antigas"""
+    os.makedirs(ASSETS_DIST_DIR, exist_ok=True)
+    manifest = {}
+    for nome, arquivos in ASSET_BUNDLES.items():
+        fontes = []
+        for arquivo in arquivos:
+            with open(os.path.join(STATIC_DIR, arquivo), 'r', encoding='utf-8') as f:
+                fontes.append(f.read())
+        base, ext = os.path.splitext(nome)
+        if ext == '.css':
+            conteudo = _minificar_css('\n'.join(fontes))
+        else:
+            conteudo = ';\n'.join(_minificar_js(fonte) for fonte in fontes)
+        digest = hashlib.sha256(conteudo.encode('utf-8')).hexdigest()[:10]
+        gerado = f"{base}.{digest}{ext}"
+        with open(os.path.join(ASSETS_DIST_DIR, gerado), 'w', encoding='utf-8') as f:
+            f.write(conteudo)
+        manifest[nome] = gerado
+        tamanho_fontes = sum(len(fonte.encode('utf-8')) for fonte in fontes)
+        print(f"{nome}: {tamanho_fontes} -> {len(conteudo.encode('utf-8'))} bytes (dist/{gerado})")
+
+    temporario = f"{ASSETS_MANIFEST_PATH}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporario, ASSETS_MANIFEST_PATH)
+
+    for arquivo in os.listdir(ASSETS_DIST_DIR):
+        if arquivo != 'manifest.json' and arquivo not in manifest.values():
+            os.remove(os.path.join(ASSETS_DIST_DIR, arquivo))
+    return manifest
+
+# Devolve as conexões ao pool ao final de cada requisição
+@app.teardown_appcontext
+def liberar_conexoes(exc):
+    for conn in _pool_da_thread().values():
+        try:
+            conn.liberar()
+        except sqlite3.Error as e:
+            print(f"Erro ao liberar conexão: {e}")
+
+# 🗃️ Política de cache HTTP por rota
+# - catalogo: vitrine pública; cache curto + stale-while-revalidate para visitantes
+#   anônimos, com ETag calculado antes de renderizar (304 sem render)
+# - privado: páginas por usuário (carrinho, conta); só revalidação por ETag
+# - sensivel: admin, checkout e pagamento; nunca armazenadas
+# - estatico: arquivos de static/; longos e imutáveis quando versionados (?v=)
+CATALOGO_MAX_AGE = int(os.getenv('CATALOGO_MAX_AGE', '60'))
+CATALOGO_STALE_WHILE_REVALIDATE = int(os.getenv('CATALOGO_STALE_WHILE_REVALIDATE', '300'))
+ESTATICO_MAX_AGE = int(os.getenv('ESTATICO_MAX_AGE', '86400'))
+ESTATICO_IMUTAVEL_MAX_AGE = 31536000
+# Imagens enviadas (e suas versões) têm o hash do conteúdo no nome
+ARQUIVO_POR_CONTEUDO = re.compile(r'^/static/produtos/(img|derivados)/[0-9a-f]{32}[.-]')
+
+POLITICAS_CACHE = {
+    'catalogo': f'public, max-age={CATALOGO_MAX_AGE}, stale-while-revalidate={CATALOGO_STALE_WHILE_REVALIDATE}',
+    'privado': 'private, no-cache',
+    'sensivel': 'private, no-store',
+}
+
+def politica_cache(nome):
+    """Define a política de cache HTTP de uma rota (aplicar abaixo do @app.route)"""
+    def decorar(view):
+        view.politica_cache = nome
+        return view
+    return decorar
+
+def _politica_da_rota():
+    if request.endpoint == 'static':
+        return 'estatico'
+    view = app.view_functions.get(request.endpoint)
+    politica = getattr(view, 'politica_cache', None)
+    if politica:
+        return politica
+    if request.endpoint and request.endpoint.startswith(('admin', 'debug')):
+        return 'sensivel'
+    return 'privado'
+
+def _versao_aplicacao():
+    """Identificador do código/templates em uso (igual em todos os workers do deploy)"""
+    h = hashlib.sha1()
+    arquivos = [os.path.abspath(__file__)]
+    templates_dir = os.path.join(BASE_DIR, 'templates')
+    if os.path.isdir(templates_dir):
+        arquivos += sorted(os.path.join(templates_dir, f) for f in os.listdir(templates_dir))
+    # as páginas embutem as URLs dos assets com hash
+    arquivos.append(ASSETS_MANIFEST_PATH)
+    arquivos += [os.path.join(STATIC_DIR, f) for fontes in ASSET_BUNDLES.values() for f in fontes]
+    for caminho in arquivos:
+        try:
+            h.update(f"{caminho}:{os.path.getmtime(caminho)}".encode())
+        except OSError:
+            pass
+    return h.hexdigest()[:12]
+
+VERSAO_APLICACAO = _versao_aplicacao()
+
+def _catalogo_publico():
+    """A página de vitrine só é igual para todos quando não há nada da sessão nela"""
+    return not (session.get('user_id') or session.get('carrinho') or session.get('_flashes'))
+
+def _etag_catalogo():
+    """ETag da vitrine derivado das versões de catálogo, configurações e código"""
+    configuracoes_loja.obter()
+    chave = (f"{VERSAO_APLICACAO}:{cache_catalogo.versao_atual()}:"
+             f"{configuracoes_loja.versao()}:{request.full_path}")
+    return hashlib.sha1(chave.encode()).hexdigest()
+
+@app.before_request
+def responder_nao_modificado():
+    """Responde 304 para a vitrine sem renderizar quando o ETag bate"""
+    if request.method not in ('GET', 'HEAD') or _politica_da_rota() != 'catalogo':
+        return None
+    if not _catalogo_publico():
+        return None
+    try:
+        g.etag_catalogo = _etag_catalogo()
+    except Exception as e:
+        print(f"Erro ao calcular ETag do catálogo: {e}")
+        return None
+    if g.etag_catalogo in request.if_none_match:
+        return app.response_class(status=304)
+    return None
+
 @app.after_request
-def add_no_cache_headers(response):
-    """Força o navegador a não fazer cache das páginas"""
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    response.headers['Last-Modified'] = datetime.now().strftime('%a, %d %b %Y %H:%M:%S GMT')
-    response.headers['ETag'] = str(uuid.uuid4())
+def aplicar_politica_cache(response):
+    """Cache-Control por rota + ETag do conteúdo com respostas 304"""
+    politica = _politica_da_rota()
+
+    if politica == 'estatico':
+        if (request.args.get('v') or request.path.startswith(ASSETS_DIST_URL)
+                or ARQUIVO_POR_CONTEUDO.match(request.path)):
+            response.headers['Cache-Control'] = f'public, max-age={ESTATICO_IMUTAVEL_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = f'public, max-age={ESTATICO_MAX_AGE}'
+        # send_file já gera ETag/Last-Modified e trata If-None-Match/If-Modified-Since
+        return response
+
+    if politica == 'catalogo' and 'etag_catalogo' in g and _catalogo_publico():
+        response.headers['Cache-Control'] = POLITICAS_CACHE['catalogo']
+        response.set_etag(g.etag_catalogo)
+        response.vary.add('Cookie')
+        return response
+
+    if politica == 'catalogo':
+        politica = 'privado'
+    response.headers['Cache-Control'] = POLITICAS_CACHE[politica]
+    if politica == 'sensivel':
+        return response
+
+    # ETag do próprio conteúdo: a segunda visita recebe 304 sem corpo
+    if (response.status_code == 200 and request.method in ('GET', 'HEAD')
+            and not response.direct_passthrough and not response.is_streamed):
+        response.add_etag()
+        response.make_conditional(request)
     return response
 
 # Configurações para produção
@@ -306,77 +1448,22 @@ def validate_numeric_field(form, field_name, min_val=0, max_val=None, required=T
 def init_db():
     """Inicializar banco de dados"""
     try:
-        conn = get_db_connection()
-        
-        # Verificar se já foi inicializado (tabela produtos existe e tem dados)
-        try:
-            result = conn.execute('SELECT COUNT(*) FROM produtos').fetchone()
-            if result and result[0] > 0:
-                conn.close()
-                return  # Já inicializado
-        except:
-            pass  # Tabela não existe, continuar inicialização
-
-        # Tabelas
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS usuarios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                senha TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS produtos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome TEXT NOT NULL,
-                preco REAL NOT NULL,
-                imagem TEXT,
-                categoria TEXT,
-                descricao TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        # Schema sempre atualizado antes de qualquer outra coisa
+        aplicar_migracoes()
 
-        # Tabela de pedidos
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS pedidos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                usuario_id INTEGER,
-                nome_cliente TEXT NOT NULL,
-                email_cliente TEXT NOT NULL,
-                telefone TEXT,
-                cep TEXT NOT NULL,
-                endereco TEXT NOT NULL,
-                numero TEXT NOT NULL,
-                complemento TEXT,
-                bairro TEXT NOT NULL,
-                cidade TEXT NOT NULL,
-                estado TEXT NOT NULL,
-                metodo_pagamento TEXT NOT NULL,
-                total REAL NOT NULL,
-                status TEXT DEFAULT 'Pendente',
-                itens TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
-            )
-        ''')
+        conn = get_db_connection()
 
-        # Garante coluna is_admin (se faltar, cria)
-        ensure_is_admin_column(conn)
-        
-        # Garante coluna tamanhos (se faltar, cria)
-        ensure_tamanhos_column(conn)
-        
-        # Garante coluna estoque (se faltar, cria)
-        ensure_estoque_column(conn)
+        # Verificar se já foi inicializado (tabela produtos tem dados)
+        result = conn.execute('SELECT COUNT(*) FROM produtos').fetchone()
+        if result and result[0] > 0:
+            conn.close()
+            return  # Já inicializado
 
         # Admin padrão (com is_admin=1)
         admin_exists = conn.execute('SELECT COUNT(*) FROM usuarios WHERE email = ?', ('admin@uzzerstore.com',)).fetchone()[0]
         if admin_exists == 0:
             conn.execute('''
-                INSERT INTO usuarios (nome, email, senha, is_admin) 
+                INSERT INTO usuarios (nome, email, senha, is_admin)
                 VALUES (?, ?, ?, 1)
             ''', (
                 'Administrador',
@@ -384,147 +1471,1754 @@ def init_db():
                 generate_password_hash('Admin@2024!')
             ))
 
-        conn.commit()
+        conn.commit()
+        print("✅ Banco de dados inicializado com sucesso!")
+        # Se o banco estiver vazio de produtos, tentar popular com imagens em static/produtos
+        try:
+            seed_count = seed_products_from_static(conn)
+            if seed_count:
+                print(f"✅ Seed automático: inseridos {seed_count} produtos a partir de static/produtos")
+        except Exception as se:
+            print(f"Aviso: falha ao popular produtos automaticamente: {se}")
+        conn.close()
+    except Exception as e:
+        print(f"❌ Erro ao inicializar banco: {e}")
+
+
+def seed_products_from_static(conn=None):
+    """Popula a tabela produtos a partir dos arquivos em static/produtos se não houver entradas.
+    Retorna o número de produtos inseridos.
+    Se uma conexão for passada, usa-a; caso contrário abre uma conexão temporária.
+    """
+    import os
+    from datetime import datetime
+
+    close_conn = False
+    if conn is None:
+        conn = get_db_connection()
+        close_conn = True
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    produtos_dir = os.path.join(BASE_DIR, 'static', 'produtos')
+    if not os.path.isdir(produtos_dir):
+        if close_conn:
+            conn.close()
+        return 0
+
+    files = [f for f in os.listdir(produtos_dir) if os.path.isfile(os.path.join(produtos_dir, f))]
+    if not files:
+        if close_conn:
+            conn.close()
+        return 0
+
+    # Ler imagens já referenciadas
+    cur = conn.execute("SELECT imagem FROM produtos WHERE imagem IS NOT NULL")
+    existing = set([r['imagem'] for r in cur.fetchall() if r['imagem']])
+
+    def infer_category(filename):
+        s = filename.lower()
+        if 'bermuda' in s:
+            return 'Bermudas'
+        if 'calça' in s or 'calca' in s:
+            return 'Calças'
+        if 'camisa' in s or 'polo' in s:
+            return 'Camisetas'
+        if 'camiseta' in s:
+            return 'Camisetas'
+        if 'bolsa' in s:
+            return 'Acessórios'
+        if 'boné' in s or 'bone' in s:
+            return 'Acessórios'
+        if 'cueca' in s:
+            return 'Moda Intima'
+        return 'Sem categoria'
+
+    inserted = 0
+    for fn in files:
+        imagem_field = f'produtos/{fn}'
+        if imagem_field in existing:
+            continue
+        nome = os.path.splitext(fn)[0].replace('_', ' ').replace('-', ' ').title()
+        preco = 49.90
+        categoria = infer_category(fn)
+        descricao = ''
+        tamanhos = 'P,M,G'
+        estoque = 10
+
+        try:
+            conn.execute('''
+                INSERT INTO produtos (nome, preco, imagem, categoria, descricao, tamanhos, estoque, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (nome, preco, imagem_field, categoria, descricao, tamanhos, estoque, datetime.utcnow().isoformat()))
+            processar_imagem(conn, imagem_field)
+            inserted += 1
+        except Exception:
+            # ignora erros de inserção individuais
+            continue
+
+    if inserted > 0:
+        marcar_relacionados(conn)
+        invalidar_catalogo(conn)
+        conn.commit()
+
+    if close_conn:
+        conn.close()
+
+    return inserted
+
+def is_admin():
+    """Verifica se usuário atual é administrador (otimizado)"""
+    if 'user_id' not in session:
+        return False
+    
+    # Cache na sessão para evitar consultas repetidas
+    if 'is_admin_cached' in session:
+        return session['is_admin_cached']
+    
+    try:
+        conn = get_db_connection()
+        user = conn.execute('SELECT id, email, is_admin FROM usuarios WHERE id = ?', 
+                           (session['user_id'],)).fetchone()
+        conn.close()
+
+        if not user:
+            session['is_admin_cached'] = False
+            return False
+
+        # Converter sqlite3.Row para dict para acesso seguro
+        user_dict = dict(user)
+        
+        # Verificação unificada de admin
+        is_admin_user = (
+            bool(user_dict.get('is_admin', False)) or  # Coluna is_admin
+            user_dict['id'] == 1 or  # Primeiro usuário
+            user_dict['email'] in ['admin@uzzerstore.com', 'administrador@uzzerstore.com']  # Emails admin
+        )
+        
+        # Cache o resultado na sessão
+        session['is_admin_cached'] = is_admin_user
+        session.permanent = True
+        
+        return is_admin_user
+        
+    except Exception as e:
+        print(f"Erro ao verificar admin: {e}")
+        return False
+
+
+
+# 📦 Cache do catálogo
+CATALOGO_CACHE_MAX_ITENS = int(os.getenv('CATALOGO_CACHE_MAX_ITENS', '512'))
+CATALOGO_CACHE_TTL = int(os.getenv('CATALOGO_CACHE_TTL', '300'))
+CATALOGO_VERSAO_INTERVALO = float(os.getenv('CATALOGO_VERSAO_INTERVALO', '2'))
+
+class CacheCatalogo:
+    """Cache LRU em memória para leituras do catálogo.
+
+    As entradas valem enquanto a versão do catálogo (tabela versoes) não mudar.
+    A versão é relida no máximo a cada `intervalo_versao` segundos, então as
+    escritas de outros workers aparecem com esse atraso; o TTL é só uma rede
+    de segurança.
+    """
+
+    def __init__(self, nome_versao, max_itens=512, ttl=300, intervalo_versao=2):
+        self.nome_versao = nome_versao
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.intervalo_versao = intervalo_versao
+        self.hits = 0
+        self.misses = 0
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+        self._versao = None
+        self._versao_lida_em = 0.0
+
+    def versao_atual(self):
+        agora = time.monotonic()
+        if self._versao is None or agora - self._versao_lida_em >= self.intervalo_versao:
+            versao = ler_versao(self.nome_versao)
+            with self._lock:
+                if versao != self._versao:
+                    self._dados.clear()
+                    self._versao = versao
+                self._versao_lida_em = agora
+        return self._versao
+
+    def obter(self, chave, carregar):
+        """Retorna o valor em cache para `chave` ou chama `carregar()` e guarda"""
+        versao = self.versao_atual()
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._dados.get(chave)
+            if entrada and entrada[0] == versao and agora - entrada[1] < self.ttl:
+                self._dados.move_to_end(chave)
+                self.hits += 1
+                return entrada[2]
+            self.misses += 1
+
+        valor = carregar()
+        with self._lock:
+            self._dados[chave] = (versao, agora, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_itens:
+                self._dados.popitem(last=False)
+        return valor
+
+    def invalidar(self):
+        """Força a releitura da versão na próxima consulta"""
+        with self._lock:
+            self._versao = None
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'versao': self._versao,
+                'itens': len(self._dados),
+                'max_itens': self.max_itens,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+cache_catalogo = CacheCatalogo('catalogo', CATALOGO_CACHE_MAX_ITENS,
+                               CATALOGO_CACHE_TTL, CATALOGO_VERSAO_INTERVALO)
+
+def _invalidar_caches_catalogo():
+    cache_catalogo.invalidar()
+    cache_fragmentos.invalidar()
+    cache_busca.invalidar()
+    cache_facetas.invalidar()
+
+def invalidar_catalogo(conn):
+    """Marca o catálogo como alterado; chamar antes do commit da escrita.
+
+    A versão sobe dentro da transação; os caches deste processo só são zerados
+    depois do commit, senão uma leitura concorrente relê a versão antiga e o
+    processo segue servindo o catálogo velho até o próximo intervalo_versao.
+    """
+    incrementar_versao('catalogo', conn)
+    if _invalidar_caches_catalogo not in conn.apos_commit:
+        conn.apos_commit.append(_invalidar_caches_catalogo)
+
+# 🧩 Cache de fragmentos de template
+# {% cache 'produto_card', produto.id %}...{% endcache %} guarda o HTML já
+# renderizado do bloco num LRU próprio (não disputa espaço com as consultas), válido
+# enquanto a versão do catálogo não mudar. Serve para blocos que só dependem dos
+# valores da chave e do catálogo: nada de sessão, usuário ou request dentro deles.
+FRAGMENTOS_CACHE_MAX_ITENS = int(os.getenv('FRAGMENTOS_CACHE_MAX_ITENS', '2048'))
+
+cache_fragmentos = CacheCatalogo('catalogo', FRAGMENTOS_CACHE_MAX_ITENS,
+                                 CATALOGO_CACHE_TTL, CATALOGO_VERSAO_INTERVALO)
+
+class CacheFragmentos(Extension):
+    """Tag {% cache chave[, chave...] %} ... {% endcache %} (valores hasheáveis)"""
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        chave = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            chave.append(parser.parse_expression())
+        corpo = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_renderizar', [nodes.List(chave)]),
+                               [], [], corpo).set_lineno(lineno)
+
+    def _renderizar(self, chave, caller):
+        return cache_fragmentos.obter(('fragmento',) + tuple(chave), caller)
+
+app.jinja_env.add_extension(CacheFragmentos)
+
+def _consultar_catalogo(sql, params=()):
+    conn = get_db_connection(readonly=True)
+    try:
+        return tuple(dict(r) for r in conn.execute(sql, params).fetchall())
+    finally:
+        conn.close()
+
+CATALOGO_PAGINA_TAMANHO = int(os.getenv('CATALOGO_PAGINA_TAMANHO', '24'))
+CATALOGO_PAGINA_MAXIMO = 100
+
+def catalogo_pagina(categoria=None, cursor=None, limite=CATALOGO_PAGINA_TAMANHO):
+    """Página da vitrine por keyset (id DESC): produtos com id < cursor.
+
+    Retorna (produtos, proximo_cursor); proximo_cursor é None na última página.
+    O custo não depende da profundidade da página, ao contrário de OFFSET.
+    Só a primeira página das categorias existentes, no tamanho padrão, vai para
+    o cache: cursor, limite e categoria vêm do cliente e encheriam o LRU.
+    """
+    def carregar():
+        filtros, params = ['visivel = 1'], []
+        if categoria:
+            filtros.append('categoria = ?')
+            params.append(categoria)
+        if cursor is not None:
+            filtros.append('id < ?')
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(filtros)}"
+        # Busca um a mais para saber se existe próxima página
+        rows = _consultar_catalogo(
+            f'SELECT * FROM produtos {where} ORDER BY id DESC LIMIT ?', (*params, limite + 1))
+        if len(rows) > limite:
+            return rows[:limite], rows[limite - 1]['id']
+        return rows, None
+    if cursor is not None or limite != CATALOGO_PAGINA_TAMANHO:
+        return carregar()
+    if categoria and categoria not in {c['categoria'] for c in catalogo_categorias()}:
+        return carregar()
+    return cache_catalogo.obter(('pagina', categoria), carregar)
+
+def catalogo_categorias():
+    return cache_catalogo.obter(('categorias',), lambda: _consultar_catalogo(
+        'SELECT DISTINCT categoria FROM produtos WHERE visivel = 1 AND categoria IS NOT NULL ORDER BY categoria'))
+
+def catalogo_produto(produto_id):
+    """Produto individual (dict) ou None"""
+    def carregar():
+        rows = _consultar_catalogo('SELECT * FROM produtos WHERE id = ?', (produto_id,))
+        return rows[0] if rows else None
+    return cache_catalogo.obter(('produto', produto_id), carregar)
+
+# 🔍 Busca de produtos
+# produtos_busca (FTS5, migração 11) acompanha produtos por gatilhos. O tokenizer
+# ignora acentos ("calca" acha "calça"), cada termo vira prefixo para o typeahead
+# e a ordem é por bm25, com mais peso no nome e na categoria que na descrição.
+BUSCA_PAGINA_TAMANHO = int(os.getenv('BUSCA_PAGINA_TAMANHO', '12'))
+BUSCA_PAGINA_MAXIMO = 50
+BUSCA_MAX_TERMOS = 8
+# Cada tecla do typeahead é uma chave nova: a busca tem um LRU pequeno só dela
+# para não empurrar para fora as páginas, produtos e facetas de cache_catalogo
+BUSCA_CACHE_MAX_ITENS = int(os.getenv('BUSCA_CACHE_MAX_ITENS', '128'))
+
+cache_busca = CacheCatalogo('catalogo', BUSCA_CACHE_MAX_ITENS,
+                            CATALOGO_CACHE_TTL, CATALOGO_VERSAO_INTERVALO)
+# Marcadores do highlight trocados por <mark> depois de escapar o nome
+_DESTAQUE_INICIO, _DESTAQUE_FIM = '\x02', '\x03'
+
+def consulta_fts(texto):
+    """Consulta FTS5 com todos os termos digitados como prefixo ('' se não houver termos)"""
+    termos = re.findall(r'\w+', (texto or '').lower())[:BUSCA_MAX_TERMOS]
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+def buscar_produtos(texto, pagina=1, limite=BUSCA_PAGINA_TAMANHO):
+    """Produtos visíveis que casam com `texto`, por relevância.
+
+    Retorna (produtos, tem_mais); cada produto traz 'destaque', o nome em HTML
+    escapado com os termos encontrados em <mark>.
+    """
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return (), False
+
+    def carregar():
+        rows = _consultar_catalogo('''
+            SELECT p.*, highlight(produtos_busca, 0, ?, ?) AS destaque
+            FROM produtos_busca JOIN produtos p ON p.id = produtos_busca.rowid
+            WHERE produtos_busca MATCH ? AND p.visivel = 1
+            ORDER BY bm25(produtos_busca, 10.0, 1.0, 4.0), p.id DESC
+            LIMIT ? OFFSET ?
+        ''', (_DESTAQUE_INICIO, _DESTAQUE_FIM, consulta, limite + 1, (pagina - 1) * limite))
+        for row in rows:
+            row['destaque'] = (str(escape(row['destaque'] or row['nome']))
+                               .replace(_DESTAQUE_INICIO, '<mark>').replace(_DESTAQUE_FIM, '</mark>'))
+        return rows[:limite], len(rows) > limite
+    return cache_busca.obter((consulta, pagina, limite), carregar)
+
+def url_imagem_produto(imagem, variante='thumb'):
+    """URL da imagem de um produto: versão WebP da variante, se houver, ou o original"""
+    if not imagem or not imagem.strip():
+        return None
+    if imagem.startswith(('http', '/')):
+        return imagem
+    responsiva = imagem_responsiva(imagem, variante)
+    return responsiva['src'] if responsiva else url_for('static', filename=imagem)
+
+# 🧭 Filtros facetados
+# O índice de facetas é montado uma vez por versão do catálogo (em cache_facetas,
+# fora do LRU das consultas para não ser despejado) e guarda, para cada valor de
+# cada dimensão, um bitmap (int) dos produtos visíveis que têm aquele valor; o bit
+# i é o i-ésimo produto na ordem da vitrine (id DESC).
+# Filtrar é AND entre dimensões e OR dentro de cada uma. A contagem de uma
+# dimensão ignora o filtro dela mesma: mostra quantos produtos cada opção traria
+# junto com os demais filtros.
+FAIXAS_PRECO = (
+    ('ate-50', 'Até R$ 50', 0, 50),
+    ('50-100', 'R$ 50 a R$ 100', 50, 100),
+    ('100-200', 'R$ 100 a R$ 200', 100, 200),
+    ('acima-200', 'Acima de R$ 200', 200, None),
+)
+ORDEM_TAMANHOS = ('PP', 'P', 'M', 'G', 'GG', 'XG')
+ROTULOS_ESTOQUE = {'disponivel': 'Em estoque', 'esgotado': 'Esgotado'}
+DIMENSOES_FACETAS = ('categoria', 'preco', 'tamanho', 'estoque')
+
+def tamanhos_do_produto(tamanhos):
+    """'P, m,G' -> ['P', 'M', 'G']"""
+    return [t.strip().upper() for t in (tamanhos or '').split(',') if t.strip()]
+
+def faixa_preco(preco):
+    for chave, _rotulo, minimo, maximo in FAIXAS_PRECO:
+        if preco >= minimo and (maximo is None or preco < maximo):
+            return chave
+    return FAIXAS_PRECO[0][0]
+
+@dataclass
+class IndiceFacetas:
+    produtos: tuple
+    facetas: dict
+    # (preço, posição) em ordem de preço, para preco_min/preco_max
+    precos: tuple = ()
+
+    @property
+    def todos(self):
+        return (1 << len(self.produtos)) - 1
+
+    def mascara_preco(self, minimo=None, maximo=None):
+        """Bitmap dos produtos com minimo <= preço <= maximo"""
+        if minimo is None and maximo is None:
+            return self.todos
+        valores = [preco for preco, _ in self.precos]
+        inicio = bisect_left(valores, minimo) if minimo is not None else 0
+        fim = bisect_right(valores, maximo) if maximo is not None else len(valores)
+        mascara = 0
+        for _, posicao in self.precos[inicio:fim]:
+            mascara |= 1 << posicao
+        return mascara
+
+    def filtrar(self, selecionados, minimo=None, maximo=None):
+        """(bitmap do resultado, contagens por dimensão) para {dimensão: {valores}}"""
+        base = self.mascara_preco(minimo, maximo)
+        mascaras = {}
+        for dimensao, valores in selecionados.items():
+            if valores:
+                mascara = 0
+                for valor in valores:
+                    mascara |= self.facetas.get(dimensao, {}).get(valor, 0)
+                mascaras[dimensao] = mascara
+
+        resultado = base
+        for mascara in mascaras.values():
+            resultado &= mascara
+
+        contagens = {}
+        for dimensao, valores in self.facetas.items():
+            outras = base
+            for outra, mascara in mascaras.items():
+                if outra != dimensao:
+                    outras &= mascara
+            contagens[dimensao] = {valor: (outras & bitmap).bit_count() for valor, bitmap in valores.items()}
+        return resultado, contagens
+
+    def pagina(self, mascara, pagina, limite):
+        """Produtos de uma página do bitmap, na ordem da vitrine"""
+        inicio, produtos, posicao = (pagina - 1) * limite, [], 0
+        while mascara and len(produtos) < limite:
+            bit = mascara & -mascara
+            if posicao >= inicio:
+                produtos.append(self.produtos[bit.bit_length() - 1])
+            mascara ^= bit
+            posicao += 1
+        return produtos
+
+def montar_indice_facetas(produtos):
+    facetas = {dimensao: {} for dimensao in DIMENSOES_FACETAS}
+
+    def marcar(dimensao, valor, bit):
+        facetas[dimensao][valor] = facetas[dimensao].get(valor, 0) | bit
+
+    for posicao, produto in enumerate(produtos):
+        bit = 1 << posicao
+        if produto.get('categoria'):
+            marcar('categoria', produto['categoria'], bit)
+        marcar('preco', faixa_preco(float(produto['preco'] or 0)), bit)
+        for tamanho in tamanhos_do_produto(produto.get('tamanhos')):
+            marcar('tamanho', tamanho, bit)
+        marcar('estoque', 'disponivel' if (produto.get('estoque') or 0) > 0 else 'esgotado', bit)
+
+    ordem_faixas = [chave for chave, *_ in FAIXAS_PRECO]
+    facetas['categoria'] = dict(sorted(facetas['categoria'].items()))
+    facetas['preco'] = {chave: facetas['preco'][chave] for chave in ordem_faixas if chave in facetas['preco']}
+    facetas['tamanho'] = dict(sorted(
+        facetas['tamanho'].items(),
+        key=lambda item: (ORDEM_TAMANHOS.index(item[0]) if item[0] in ORDEM_TAMANHOS else len(ORDEM_TAMANHOS), item[0])))
+    precos = tuple(sorted((float(p['preco'] or 0), posicao) for posicao, p in enumerate(produtos)))
+    return IndiceFacetas(tuple(produtos), facetas, precos)
+
+cache_facetas = CacheCatalogo('catalogo', 1, CATALOGO_CACHE_TTL, CATALOGO_VERSAO_INTERVALO)
+
+def catalogo_facetas():
+    """Índice de facetas da versão atual do catálogo"""
+    return cache_facetas.obter(('facetas',), lambda: montar_indice_facetas(
+        _consultar_catalogo('SELECT * FROM produtos WHERE visivel = 1 ORDER BY id DESC')))
+
+def rotulo_faceta(dimensao, valor):
+    if dimensao == 'preco':
+        return next((rotulo for chave, rotulo, *_ in FAIXAS_PRECO if chave == valor), valor)
+    if dimensao == 'estoque':
+        return ROTULOS_ESTOQUE.get(valor, valor)
+    return valor
+
+# 🔗 Produtos relacionados
+# produtos_relacionados guarda, por produto, os melhores candidatos já ordenados:
+# mesma categoria com preço próximo (mesma faixa vale mais) e produtos comprados
+# juntos nos pedidos; a página do produto lê pela chave primária. As escritas só
+# marcam os produtos afetados em relacionados_pendentes (na própria transação); o
+# recálculo roda depois do commit, num thread do processo (recalculo_relacionados)
+# ou via `flask recalcular-relacionados`. Como ele não mexe no catálogo, a lista
+# cacheada segue a versão 'relacionados', que só o recálculo incrementa.
+RELACIONADOS_CANDIDATOS = 12
+RELACIONADOS_EXIBIDOS = 4
+# Vizinhos de preço avaliados na categoria, de cada lado
+RELACIONADOS_VIZINHOS = 16
+RELACIONADOS_LOTE = 200
+RELACIONADOS_INTERVALO = float(os.getenv('RELACIONADOS_INTERVALO', '30'))
+
+def _pontuacao_relacionado(produto, candidato, compras_juntas):
+    pontuacao = 0.0
+    if candidato['categoria'] == produto['categoria']:
+        pontuacao += 1.0
+        preco, outro = float(produto['preco'] or 0), float(candidato['preco'] or 0)
+        if faixa_preco(preco) == faixa_preco(outro):
+            pontuacao += 0.5
+        pontuacao += 0.5 * (1 - min(1.0, abs(preco - outro) / max(preco, outro, 1.0)))
+    if compras_juntas:
+        pontuacao += 1.5 * math.log1p(compras_juntas)
+    return pontuacao
+
+def recalcular_relacionados(conn, produto_ids=None):
+    """Recalcula os candidatos de `produto_ids` (todos os produtos se None)"""
+    produtos = {r['id']: r for r in conn.execute(
+        'SELECT id, categoria, preco FROM produtos WHERE visivel = 1').fetchall()}
+    alvos = list(produtos) if produto_ids is None else [i for i in set(produto_ids) if i in produtos]
+
+    por_categoria = {}
+    for produto in produtos.values():
+        por_categoria.setdefault(produto['categoria'], []).append((float(produto['preco'] or 0), produto['id']))
+    for lista in por_categoria.values():
+        lista.sort()
+
+    # Co-compras: quantos pedidos têm os dois produtos
+    filtro, params = '', []
+    if produto_ids is not None:
+        filtro = f"WHERE a.produto_id IN ({','.join('?' * len(alvos))})"
+        params = alvos
+    compras_juntas = {}
+    if alvos:
+        for r in conn.execute(f'''
+            SELECT a.produto_id, b.produto_id AS relacionado_id, COUNT(DISTINCT a.pedido_id) AS vezes
+            FROM pedido_itens a
+            JOIN pedido_itens b ON b.pedido_id = a.pedido_id AND b.produto_id != a.produto_id
+            {filtro}
+            GROUP BY a.produto_id, b.produto_id
+        ''', params):
+            compras_juntas.setdefault(r['produto_id'], {})[r['relacionado_id']] = r['vezes']
+
+    linhas = []
+    for produto_id in alvos:
+        produto = produtos[produto_id]
+        mesma_categoria = por_categoria.get(produto['categoria'], [])
+        meio = bisect_left(mesma_categoria, (float(produto['preco'] or 0), produto_id))
+        vizinhos = mesma_categoria[max(0, meio - RELACIONADOS_VIZINHOS):meio + RELACIONADOS_VIZINHOS + 1]
+        juntos = compras_juntas.get(produto_id, {})
+        candidatos = {i for _, i in vizinhos} | {i for i in juntos if i in produtos}
+        candidatos.discard(produto_id)
+        melhores = sorted(
+            ((_pontuacao_relacionado(produto, produtos[i], juntos.get(i, 0)), i) for i in candidatos),
+            key=lambda c: (-c[0], -c[1]))[:RELACIONADOS_CANDIDATOS]
+        linhas += [(produto_id, posicao, i, round(pontuacao, 4))
+                   for posicao, (pontuacao, i) in enumerate(melhores)]
+
+    if produto_ids is None:
+        conn.execute('DELETE FROM produtos_relacionados')
+    else:
+        conn.executemany('DELETE FROM produtos_relacionados WHERE produto_id = ?', [(i,) for i in set(produto_ids)])
+    conn.executemany(
+        'INSERT INTO produtos_relacionados (produto_id, posicao, relacionado_id, pontuacao) VALUES (?, ?, ?, ?)',
+        linhas)
+    return len(alvos)
+
+def marcar_relacionados(conn, produto_ids=None):
+    """Agenda o recálculo de `produto_ids` (todos se None) na transação do chamador"""
+    ids = {0} if produto_ids is None else {int(i) for i in produto_ids}
+    conn.executemany('INSERT OR IGNORE INTO relacionados_pendentes (produto_id) VALUES (?)', [(i,) for i in ids])
+    conn.apos_commit.append(recalculo_relacionados.acordar)
+
+def marcar_relacionados_do_produto(conn, produto_id, categorias=()):
+    """Escrita de um produto: ele, os das `categorias` (antes/depois) e os que o listam"""
+    categorias = [c for c in set(categorias) if c]
+    ids = {produto_id}
+    if categorias:
+        ids.update(r[0] for r in conn.execute(
+            f"SELECT id FROM produtos WHERE categoria IN ({','.join('?' * len(categorias))})", categorias))
+    ids.update(r[0] for r in conn.execute(
+        'SELECT produto_id FROM produtos_relacionados WHERE relacionado_id = ?', (produto_id,)))
+    marcar_relacionados(conn, ids)
+
+def processar_relacionados_pendentes(limite=RELACIONADOS_LOTE):
+    """Recalcula um lote de relacionados_pendentes; True se ainda sobrou algum"""
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        ids = [r[0] for r in conn.execute(
+            'SELECT produto_id FROM relacionados_pendentes ORDER BY produto_id LIMIT ?', (limite,))]
+        if not ids:
+            conn.rollback()
+            return False
+        if ids[0] == 0:
+            recalcular_relacionados(conn)
+            conn.execute('DELETE FROM relacionados_pendentes')
+            restam = False
+        else:
+            recalcular_relacionados(conn, ids)
+            conn.executemany('DELETE FROM relacionados_pendentes WHERE produto_id = ?', [(i,) for i in ids])
+            restam = len(ids) == limite
+        incrementar_versao('relacionados', conn)
+        conn.apos_commit.append(cache_relacionados.invalidar)
+        conn.commit()
+        return restam
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+recalculo_relacionados = TrabalhoEmSegundoPlano(
+    'recalculo-relacionados', processar_relacionados_pendentes, RELACIONADOS_INTERVALO)
+
+cache_relacionados = CacheCatalogo('relacionados', CATALOGO_CACHE_MAX_ITENS,
+                                   CATALOGO_CACHE_TTL, CATALOGO_VERSAO_INTERVALO)
+
+def produtos_relacionados(produto_id, quantidade=RELACIONADOS_EXIBIDOS):
+    """Relacionados para a página do produto: o melhor candidato fixo e os demais em rodízio"""
+    candidatos = cache_relacionados.obter(produto_id, lambda: _consultar_catalogo('''
+        SELECT p.* FROM produtos_relacionados r
+        JOIN produtos p ON p.id = r.relacionado_id
+        WHERE r.produto_id = ? AND p.visivel = 1
+        ORDER BY r.posicao
+    ''', (produto_id,)))
+    if len(candidatos) <= quantidade:
+        return list(candidatos)
+    resto = candidatos[1:]
+    inicio = random.randrange(len(resto))
+    return [candidatos[0]] + [resto[(inicio + i) % len(resto)] for i in range(quantidade - 1)]
+
+# 🖼️ Imagens de produto
+# Uploads vão para static/produtos/img/<sha256>.<ext>: o nome é o hash do conteúdo,
+# então a mesma foto enviada de novo (ou usada em várias imagens adicionais) é um
+# único arquivo com URL imutável. imagens_armazenadas conta quantas vezes cada uma é
+# usada pelos produtos; ao remover produtos, as que chegam a zero são apagadas.
+# Com Pillow são geradas versões WebP em static/produtos/derivados/<nome>-<largura>.webp;
+# as dimensões ficam em imagens_derivadas e os templates montam srcset/sizes a partir dela.
+UPLOAD_DIR = os.path.join(STATIC_DIR, 'produtos')
+IMAGENS_DIR = os.path.join(UPLOAD_DIR, 'img')
+IMAGENS_PREFIXO = 'produtos/img/'
+DERIVADOS_DIR = os.path.join(UPLOAD_DIR, 'derivados')
+IMAGEM_BLOCO_UPLOAD = 64 * 1024
+# Limites de upload: por arquivo (checado durante a cópia) e por requisição
+# (MAX_CONTENT_LENGTH, o Werkzeug recusa com 413 antes de ler o corpo)
+UPLOAD_MAX_ARQUIVO = int(os.getenv('UPLOAD_MAX_ARQUIVO_MB', '8')) * 1024 * 1024
+UPLOAD_MAX_REQUISICAO = int(os.getenv('UPLOAD_MAX_REQUISICAO_MB', '40')) * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_REQUISICAO
+IMAGEM_PROCESSOS = int(os.getenv('IMAGEM_PROCESSOS', '2'))
+
+class UploadInvalido(ValueError):
+    """Arquivo enviado recusado (tamanho ou formato)"""
+
+def _assinatura_imagem(bloco):
+    """JPEG, PNG, GIF ou WebP pelos primeiros bytes"""
+    return (bloco.startswith((b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a'))
+            or (bloco[:4] == b'RIFF' and bloco[8:12] == b'WEBP'))
+IMAGEM_VARIANTES = OrderedDict([('thumb', 160), ('card', 400), ('detalhe', 800), ('zoom', 1600)])
+IMAGEM_QUALIDADE_WEBP = int(os.getenv('IMAGEM_QUALIDADE_WEBP', '80'))
+
+def imagem_local(imagem):
+    """Imagem salva em static/ (e não URL externa)"""
+    return bool(imagem) and not imagem.startswith(('http://', 'https://', '/'))
+
+def salvar_upload_imagem(arquivo):
+    """Grava um upload no armazenamento por conteúdo e retorna o caminho relativo.
+
+    O SHA-256 é calculado enquanto o arquivo é copiado em blocos para um temporário,
+    que então vira produtos/img/<hash>.<ext>. Levanta UploadInvalido se o arquivo
+    passar de UPLOAD_MAX_ARQUIVO ou não começar como uma imagem.
+    """
+    ext = os.path.splitext(secure_filename(arquivo.filename))[1].lower()
+    os.makedirs(IMAGENS_DIR, exist_ok=True)
+    h = hashlib.sha256()
+    tamanho = 0
+    temporario = os.path.join(IMAGENS_DIR, f".upload-{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        with open(temporario, 'wb') as destino:
+            while True:
+                bloco = arquivo.stream.read(IMAGEM_BLOCO_UPLOAD)
+                if not bloco:
+                    break
+                if tamanho == 0 and not _assinatura_imagem(bloco):
+                    raise UploadInvalido(f'"{arquivo.filename}" não é uma imagem JPEG, PNG, GIF ou WebP')
+                tamanho += len(bloco)
+                if tamanho > UPLOAD_MAX_ARQUIVO:
+                    raise UploadInvalido(f'"{arquivo.filename}" passa do limite de '
+                                         f'{UPLOAD_MAX_ARQUIVO // (1024 * 1024)} MB por imagem')
+                h.update(bloco)
+                destino.write(bloco)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    imagem = f"{IMAGENS_PREFIXO}{h.hexdigest()[:32]}{ext}"
+    # A referência provisória vem antes do arquivo: a coleta de órfãs não apaga uma
+    # imagem com referência, e ela é solta no fim da requisição (soltar_uploads)
+    try:
+        _fixar_upload(imagem)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    g.setdefault('uploads', []).append(imagem)
+    # Mesmo se o arquivo já existe o replace é feito (conteúdo idêntico): garante
+    # que ele continue lá caso uma coleta de órfãs tenha acabado de apagá-lo
+    os.replace(temporario, os.path.join(STATIC_DIR, imagem))
+    return imagem
+
+def _fixar_upload(imagem):
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        atualizar_referencias(conn, novas=[imagem])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def imagens_do_produto(produto):
+    """Imagem principal + adicionais de um produto (linha ou dict), com repetições"""
+    adicionais = produto['imagens_adicionais'] or ''
+    if adicionais.startswith('['):
+        extras = safe_parse_json(adicionais)
+    else:
+        extras = adicionais.split(',')
+    return [i.strip() for i in [produto['imagem'], *extras] if i and i.strip()]
+
+def atualizar_referencias(conn, antigas=(), novas=()):
+    """Ajusta a contagem de uso das imagens armazenadas por conteúdo"""
+    delta = Counter(i for i in novas if i.startswith(IMAGENS_PREFIXO))
+    delta.subtract(i for i in antigas if i.startswith(IMAGENS_PREFIXO))
+    for imagem, diferenca in delta.items():
+        if diferenca:
+            conn.execute('''
+                INSERT INTO imagens_armazenadas (imagem, referencias) VALUES (?, ?)
+                ON CONFLICT(imagem) DO UPDATE SET referencias = referencias + excluded.referencias
+            ''', (imagem, diferenca))
+
+def coletar_imagens_orfas(conn):
+    """Tira do banco as imagens sem uso; retorna {imagem: arquivos} para
+    remover_imagens_orfas depois do commit"""
+    orfas = {}
+    for row in conn.execute('SELECT imagem FROM imagens_armazenadas WHERE referencias <= 0').fetchall():
+        imagem = row['imagem']
+        orfas[imagem] = [imagem] + [r['arquivo'] for r in conn.execute(
+            'SELECT arquivo FROM imagens_derivadas WHERE imagem = ?', (imagem,)).fetchall()]
+        conn.execute('DELETE FROM imagens_derivadas WHERE imagem = ?', (imagem,))
+        conn.execute('DELETE FROM imagens_armazenadas WHERE imagem = ?', (imagem,))
+    return orfas
+
+def remover_imagens_orfas(orfas):
+    """Apaga os arquivos das órfãs que continuam sem registro.
+
+    Entre o commit da coleta e aqui outro upload pode ter voltado a usar a mesma
+    imagem (mesmo hash). A conferência roda com a trava de escrita do banco, que
+    _fixar_upload também pega antes de gravar o arquivo, então as duas não se cruzam.
+    """
+    if not orfas:
+        return
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for imagem, arquivos in orfas.items():
+            if conn.execute('SELECT 1 FROM imagens_armazenadas WHERE imagem = ?', (imagem,)).fetchone():
+                continue
+            remover_arquivos_imagem(arquivos)
+        conn.rollback()
+    finally:
+        conn.close()
+
+def remover_arquivos_imagem(arquivos):
+    for arquivo in arquivos:
+        try:
+            os.remove(os.path.join(STATIC_DIR, arquivo))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Erro ao remover {arquivo}: {e}")
+
+def gerar_derivados(imagem):
+    """Gera as larguras de IMAGEM_VARIANTES em WebP (sem ampliar o original).
+
+    Retorna [(variante, arquivo, largura, altura, bytes)].
+    """
+    if Image is None or not imagem_local(imagem):
+        return []
+    os.makedirs(DERIVADOS_DIR, exist_ok=True)
+    nome = os.path.splitext(os.path.basename(imagem))[0]
+    derivados = []
+    with Image.open(os.path.join(STATIC_DIR, imagem)) as original:
+        img = ImageOps.exif_transpose(original)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if img.mode in ('LA', 'P', 'PA') else 'RGB')
+        largura_original, altura_original = img.size
+        ultima_largura = None
+        for variante, largura in IMAGEM_VARIANTES.items():
+            largura = min(largura, largura_original)
+            if largura == ultima_largura:
+                continue
+            ultima_largura = largura
+            altura = max(1, round(altura_original * largura / largura_original))
+            copia = img if largura == largura_original else img.resize((largura, altura), Image.LANCZOS)
+            arquivo = f'produtos/derivados/{nome}-{largura}.webp'
+            caminho = os.path.join(STATIC_DIR, arquivo)
+            copia.save(caminho, 'WEBP', quality=IMAGEM_QUALIDADE_WEBP)
+            derivados.append((variante, arquivo, largura, altura, os.path.getsize(caminho)))
+    return derivados
+
+def tem_derivados(conn, imagem):
+    return conn.execute('SELECT 1 FROM imagens_derivadas WHERE imagem = ? LIMIT 1', (imagem,)).fetchone() is not None
+
+def registrar_derivados(conn, imagem, derivados):
+    conn.execute('DELETE FROM imagens_derivadas WHERE imagem = ?', (imagem,))
+    conn.executemany('''
+        INSERT INTO imagens_derivadas (imagem, variante, arquivo, largura, altura, bytes)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(imagem, *d) for d in derivados])
+
+def processar_imagem(conn, imagem, regerar=False):
+    """Gera e registra as versões de uma imagem; falhas mantêm só o original"""
+    if not regerar and tem_derivados(conn, imagem):
+        return []
+    try:
+        derivados = gerar_derivados(imagem)
+    except Exception as e:
+        print(f"Erro ao gerar versões de {imagem}: {e}")
+        return []
+    if derivados:
+        registrar_derivados(conn, imagem, derivados)
+    return derivados
+
+def _tarefa_derivados(imagem):
+    """Roda no pool de processos: valida a imagem decodificando-a e gera as versões"""
+    with Image.open(os.path.join(STATIC_DIR, imagem)) as img:
+        img.verify()
+    return gerar_derivados(imagem)
+
+class TarefasImagens:
+    """Processa as imagens enviadas em um pool de processos, fora da requisição.
+
+    O admin recebe a resposta logo após o produto ser gravado; o andamento fica na
+    tabela tarefas_imagens (visível de qualquer worker em /admin/tarefas/<id>).
+    Ao terminar cada imagem, as versões são registradas e o catálogo invalidado.
+    """
+
+    def __init__(self, max_processos=2):
+        self.max_processos = max_processos
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _executor_atual(self):
+        with self._lock:
+            # Pool criado sob demanda e recriado em processos filhos (fork do gunicorn)
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.max_processos)
+                self._pid = os.getpid()
+            return self._executor
+
+    def enviar(self, produto_id, imagens):
+        """Agenda as imagens sem versões e retorna o id da tarefa (None se nada a fazer)"""
+        if Image is None:
+            return None
+        conn = get_db_connection()
+        try:
+            pendentes = [i for i in dict.fromkeys(imagens) if not tem_derivados(conn, i)]
+            if not pendentes:
+                return None
+            tarefa_id = secrets.token_hex(8)
+            conn.execute('INSERT INTO tarefas_imagens (id, produto_id, total) VALUES (?, ?, ?)',
+                         (tarefa_id, produto_id, len(pendentes)))
+            conn.commit()
+        finally:
+            conn.close()
+        executor = self._executor_atual()
+        for imagem in pendentes:
+            futuro = executor.submit(_tarefa_derivados, imagem)
+            futuro.add_done_callback(
+                lambda f, imagem=imagem: self._concluir(tarefa_id, imagem, f))
+        return tarefa_id
+
+    def _concluir(self, tarefa_id, imagem, futuro):
+        mensagem = None
+        try:
+            derivados = futuro.result()
+        except Exception as e:
+            derivados = []
+            mensagem = f"{imagem}: {e}"
+            print(f"Erro ao processar imagem {imagem}: {e}")
+        conn = get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # A imagem pode ter sido coletada (produto removido) durante o processamento:
+            # as versões são apagadas em vez de registradas, ainda com a trava de escrita
+            # (um novo upload da mesma imagem espera e gera as suas)
+            if derivados and imagem.startswith(IMAGENS_PREFIXO) and not conn.execute(
+                    'SELECT 1 FROM imagens_armazenadas WHERE imagem = ?', (imagem,)).fetchone():
+                remover_arquivos_imagem([d[1] for d in derivados])
+                derivados = []
+            if derivados:
+                registrar_derivados(conn, imagem, derivados)
+                invalidar_catalogo(conn)
+            conn.execute('''
+                UPDATE tarefas_imagens
+                SET concluidas = concluidas + 1,
+                    falhas = falhas + ?,
+                    mensagem = COALESCE(?, mensagem),
+                    status = CASE WHEN concluidas + 1 < total THEN 'processando'
+                                  WHEN falhas + ? > 0 THEN 'concluida_com_erros'
+                                  ELSE 'concluida' END,
+                    atualizada_em = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (1 if mensagem else 0, mensagem, 1 if mensagem else 0, tarefa_id))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Erro ao registrar tarefa {tarefa_id}: {e}")
+        finally:
+            conn.close()
+
+    def status(self, tarefa_id):
+        conn = get_db_connection(readonly=True)
+        try:
+            row = conn.execute('SELECT * FROM tarefas_imagens WHERE id = ?', (tarefa_id,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+tarefas_imagens = TarefasImagens(IMAGEM_PROCESSOS)
+
+@app.teardown_appcontext
+def soltar_uploads(exc):
+    """Solta as referências provisórias dos uploads da requisição; os que não
+    chegaram a ser usados por um produto viram órfãos e são apagados"""
+    uploads = g.pop('uploads', None)
+    if not uploads:
+        return
+    conn = get_db_connection()
+    try:
+        # Transação que a rota deixou aberta (erro no meio) é descartada antes
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute('BEGIN IMMEDIATE')
+        atualizar_referencias(conn, antigas=uploads)
+        orfas = coletar_imagens_orfas(conn)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Erro ao soltar uploads {uploads}: {e}")
+        return
+    finally:
+        conn.close()
+    remover_imagens_orfas(orfas)
+
+@app.errorhandler(UploadInvalido)
+@app.errorhandler(RequestEntityTooLarge)
+def upload_recusado(erro):
+    if isinstance(erro, RequestEntityTooLarge):
+        mensagem = f'Envio maior que o limite de {UPLOAD_MAX_REQUISICAO // (1024 * 1024)} MB'
+    else:
+        mensagem = str(erro)
+    flash(mensagem, 'error')
+    return redirect(request.url, code=303)
+
+def catalogo_derivados():
+    """{imagem: [derivados ordenados por largura]} (cacheado junto com o catálogo)"""
+    def carregar():
+        por_imagem = {}
+        for d in _consultar_catalogo(
+                'SELECT imagem, variante, arquivo, largura, altura FROM imagens_derivadas ORDER BY largura'):
+            por_imagem.setdefault(d['imagem'], []).append(d)
+        return por_imagem
+    return cache_catalogo.obter(('derivados',), carregar)
+
+@app.template_global()
+def imagem_responsiva(imagem, variante='card'):
+    """src/srcset/dimensões de uma imagem local, ou None se não houver versões"""
+    if not imagem_local(imagem):
+        return None
+    derivados = catalogo_derivados().get(imagem)
+    if not derivados:
+        return None
+    escolhido = next((d for d in derivados if d['variante'] == variante), derivados[-1])
+    return {
+        'src': url_for('static', filename=escolhido['arquivo']),
+        'srcset': ', '.join(f"{url_for('static', filename=d['arquivo'])} {d['largura']}w" for d in derivados),
+        'largura': escolhido['largura'],
+        'altura': escolhido['altura'],
+    }
+
+# 🛒 Precificação do carrinho
+@dataclass
+class ItemCarrinho:
+    """Linha do carrinho já resolvida contra a tabela produtos"""
+    produto: dict
+    quantidade: int
+    tamanho: str
+    cor: str
+    subtotal: float
+
+    @property
+    def produto_id(self):
+        return self.produto['id']
+
+    @property
+    def preco(self):
+        return float(self.produto['preco'])
+
+    def to_dict(self):
+        """Formato usado pela API da sacola e pelo JSON salvo em pedidos.itens"""
+        return {
+            'produto_id': self.produto_id,
+            'nome': self.produto['nome'],
+            'preco': self.preco,
+            'imagem': self.produto['imagem'],
+            'quantidade': self.quantidade,
+            'tamanho': self.tamanho,
+            'cor': self.cor,
+            'subtotal': self.subtotal
+        }
+
+@dataclass
+class ResumoCarrinho:
+    itens: list = field(default_factory=list)
+    total: float = 0
+
+CARRINHO_COLUNAS = 'id, nome, preco, imagem, categoria'
+CARRINHO_LOTE_SQL = 500  # abaixo do limite de variáveis do SQLite
+
+def calcular_carrinho(carrinho_itens, conn=None):
+    """Resolve todos os itens do carrinho com uma única consulta WHERE id IN (...).
+
+    Itens cujo produto não existe mais são ignorados, como antes.
+    """
+    resumo = ResumoCarrinho()
+    if not carrinho_itens:
+        return resumo
+
+    ids = list(dict.fromkeys(item['produto_id'] for item in carrinho_itens))
+    close_conn = conn is None
+    if close_conn:
+        conn = get_db_connection(readonly=True)
+    try:
+        produtos = {}
+        for i in range(0, len(ids), CARRINHO_LOTE_SQL):
+            lote = ids[i:i + CARRINHO_LOTE_SQL]
+            marcadores = ','.join('?' * len(lote))
+            for row in conn.execute(
+                f'SELECT {CARRINHO_COLUNAS} FROM produtos WHERE id IN ({marcadores})', lote
+            ):
+                produtos[row['id']] = dict(row)
+    finally:
+        if close_conn:
+            conn.close()
+
+    for item in carrinho_itens:
+        produto = produtos.get(item['produto_id'])
+        if not produto:
+            continue
+        item_total = float(produto['preco']) * item['quantidade']
+        resumo.itens.append(ItemCarrinho(
+            produto=produto,
+            quantidade=item['quantidade'],
+            tamanho=item.get('tamanho', 'M'),
+            cor=item.get('cor', 'Padrão'),
+            subtotal=item_total
+        ))
+        resumo.total += item_total
+    return resumo
+
+# 🧾 Itens de pedido
+# A tabela pedido_itens é a fonte para históricos e relatórios; pedidos.itens
+# continua sendo gravado com o mesmo JSON, só como registro do pedido.
+def registrar_itens_pedido(conn, pedido_id, itens):
+    """Grava os itens (formato de ItemCarrinho.to_dict) na mesma transação do pedido"""
+    conn.executemany('''
+        INSERT INTO pedido_itens (pedido_id, produto_id, tamanho, cor, nome, preco, quantidade, subtotal, imagem,
+                                  criado_em, categoria)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, (SELECT created_at FROM pedidos WHERE id = ?),
+                (SELECT categoria FROM produtos WHERE id = ?))
+        ON CONFLICT (pedido_id, produto_id, tamanho, cor) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            subtotal = subtotal + excluded.subtotal
+    ''', [(
+        pedido_id,
+        int(item['produto_id']),
+        item.get('tamanho') or '',
+        item.get('cor') or '',
+        item.get('nome') or '',
+        float(item.get('preco') or 0),
+        int(item.get('quantidade') or 0),
+        float(item.get('subtotal', float(item.get('preco') or 0) * int(item.get('quantidade') or 0))),
+        item.get('imagem'),
+        pedido_id,
+        int(item['produto_id']),
+    ) for item in itens])
+
+# 📈 Relatórios de vendas
+# Rollups mantidos de forma incremental: cada pedido soma (+1) sua contribuição nas
+# tabelas vendas_* ao ser criado; numa troca de status a contribuição sai do status
+# antigo (-1) e entra no novo (+1), na mesma transação. Os relatórios só leem os
+# rollups, então o custo depende do número de dias do período e não de pedidos.
+# Horas/dias em UTC, como o CURRENT_TIMESTAMP de pedidos.created_at.
+STATUS_PEDIDO_PADRAO = 'Pendente'
+STATUS_CONCLUIDOS = ('Pago', 'Concluído', 'Entregue')
+STATUS_CANCELADO = 'Cancelado'
+STATUS_PEDIDO_SQL = f"COALESCE(p.status, '{STATUS_PEDIDO_PADRAO}')"
+
+def _acumular_vendas(conn, pedido_id, sinal):
+    conn.execute(f'''
+        INSERT INTO vendas_hora (hora, status, pedidos, receita)
+        SELECT substr(p.created_at, 1, 13), {STATUS_PEDIDO_SQL}, ?, ? * p.total FROM pedidos p WHERE p.id = ?
+        ON CONFLICT (hora, status) DO UPDATE SET
+            pedidos = pedidos + excluded.pedidos, receita = receita + excluded.receita
+    ''', (sinal, sinal, pedido_id))
+    conn.execute(f'''
+        INSERT INTO vendas_dia (dia, status, pedidos, receita)
+        SELECT substr(p.created_at, 1, 10), {STATUS_PEDIDO_SQL}, ?, ? * p.total FROM pedidos p WHERE p.id = ?
+        ON CONFLICT (dia, status) DO UPDATE SET
+            pedidos = pedidos + excluded.pedidos, receita = receita + excluded.receita
+    ''', (sinal, sinal, pedido_id))
+    conn.execute(f'''
+        INSERT INTO vendas_categoria_dia (dia, status, categoria, pedidos, unidades, receita)
+        SELECT substr(p.created_at, 1, 10), {STATUS_PEDIDO_SQL}, COALESCE(i.categoria, ''),
+               ?, ? * SUM(i.quantidade), ? * SUM(i.subtotal)
+        FROM pedido_itens i JOIN pedidos p ON p.id = i.pedido_id
+        WHERE i.pedido_id = ?
+        GROUP BY COALESCE(i.categoria, '')
+        ON CONFLICT (dia, status, categoria) DO UPDATE SET
+            pedidos = pedidos + excluded.pedidos, unidades = unidades + excluded.unidades,
+            receita = receita + excluded.receita
+    ''', (sinal, sinal, sinal, pedido_id))
+    conn.execute(f'''
+        INSERT INTO vendas_produto_dia (dia, status, produto_id, categoria, nome, unidades, receita)
+        SELECT substr(p.created_at, 1, 10), {STATUS_PEDIDO_SQL}, i.produto_id, COALESCE(i.categoria, ''), MAX(i.nome),
+               ? * SUM(i.quantidade), ? * SUM(i.subtotal)
+        FROM pedido_itens i JOIN pedidos p ON p.id = i.pedido_id
+        WHERE i.pedido_id = ?
+        GROUP BY i.produto_id, COALESCE(i.categoria, '')
+        ON CONFLICT (dia, status, produto_id, categoria) DO UPDATE SET
+            nome = excluded.nome, unidades = unidades + excluded.unidades, receita = receita + excluded.receita
+    ''', (sinal, sinal, pedido_id))
+    if sinal < 0:
+        # Linhas que ficaram sem pedidos (status antigo) não precisam continuar existindo
+        # (só no dia/hora do pedido, pela chave primária)
+        criado = conn.execute('SELECT created_at FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+        if criado:
+            hora, dia = criado['created_at'][:13], criado['created_at'][:10]
+            conn.execute('DELETE FROM vendas_hora WHERE hora = ? AND pedidos <= 0', (hora,))
+            conn.execute('DELETE FROM vendas_dia WHERE dia = ? AND pedidos <= 0', (dia,))
+            conn.execute('DELETE FROM vendas_categoria_dia WHERE dia = ? AND pedidos <= 0', (dia,))
+            conn.execute('DELETE FROM vendas_produto_dia WHERE dia = ? AND unidades <= 0', (dia,))
+
+def registrar_venda(conn, pedido_id):
+    """Soma um pedido recém-criado (já com os itens gravados) nos rollups"""
+    _acumular_vendas(conn, pedido_id, 1)
+
+def alterar_status_pedido(conn, pedido_id, status):
+    """Troca o status de um pedido movendo sua contribuição nos rollups
+    (pago confirma a reserva de estoque; cancelado devolve as unidades, mesmo as de
+    um pedido já pago; sair de cancelado reserva de novo e pode levantar
+    EstoqueInsuficiente, então quem chama desfaz a transação)"""
+    atual = conn.execute('SELECT status, metodo_pagamento FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+    if not atual or atual['status'] == status:
+        return False
+    if atual['status'] == STATUS_CANCELADO:
+        itens = [dict(row) for row in conn.execute(
+            'SELECT produto_id, quantidade FROM pedido_itens WHERE pedido_id = ?', (pedido_id,))]
+        expira_em = math.inf if status in STATUS_CONCLUIDOS else validade_reserva(atual['metodo_pagamento'])
+        reservar_estoque(conn, pedido_id, itens, expira_em)
+    _acumular_vendas(conn, pedido_id, -1)
+    conn.execute('UPDATE pedidos SET status = ? WHERE id = ?', (status, pedido_id))
+    _acumular_vendas(conn, pedido_id, 1)
+    if status in STATUS_CONCLUIDOS:
+        confirmar_reservas(conn, pedido_id)
+    elif status == STATUS_CANCELADO:
+        liberar_reservas_pedido(conn, pedido_id)
+    return True
+
+def reconstruir_rollups_vendas(conn):
+    """Recalcula todos os rollups a partir de pedidos/pedido_itens"""
+    for tabela in ('vendas_hora', 'vendas_dia', 'vendas_categoria_dia', 'vendas_produto_dia'):
+        conn.execute(f'DELETE FROM {tabela}')
+    conn.execute(f'''
+        INSERT INTO vendas_hora (hora, status, pedidos, receita)
+        SELECT substr(p.created_at, 1, 13), {STATUS_PEDIDO_SQL}, COUNT(*), SUM(p.total) FROM pedidos p GROUP BY 1, 2
+    ''')
+    conn.execute(f'''
+        INSERT INTO vendas_dia (dia, status, pedidos, receita)
+        SELECT substr(p.created_at, 1, 10), {STATUS_PEDIDO_SQL}, COUNT(*), SUM(p.total) FROM pedidos p GROUP BY 1, 2
+    ''')
+    conn.execute(f'''
+        INSERT INTO vendas_categoria_dia (dia, status, categoria, pedidos, unidades, receita)
+        SELECT substr(p.created_at, 1, 10), {STATUS_PEDIDO_SQL}, COALESCE(i.categoria, ''),
+               COUNT(DISTINCT i.pedido_id), SUM(i.quantidade), SUM(i.subtotal)
+        FROM pedido_itens i JOIN pedidos p ON p.id = i.pedido_id
+        GROUP BY 1, 2, 3
+    ''')
+    conn.execute(f'''
+        INSERT INTO vendas_produto_dia (dia, status, produto_id, categoria, nome, unidades, receita)
+        SELECT substr(p.created_at, 1, 10), {STATUS_PEDIDO_SQL}, i.produto_id, COALESCE(i.categoria, ''), MAX(i.nome),
+               SUM(i.quantidade), SUM(i.subtotal)
+        FROM pedido_itens i JOIN pedidos p ON p.id = i.pedido_id
+        GROUP BY 1, 2, 3, 4
+    ''')
+
+def periodo_relatorio(filtros, hoje=None):
+    """(inicio, fim) em 'AAAA-MM-DD' para os filtros da página de relatórios"""
+    hoje = hoje or datetime.utcnow().date()
+    periodo = filtros.get('periodo') or 'mes'
+    if periodo == 'hoje':
+        return hoje.isoformat(), hoje.isoformat()
+    if periodo == 'semana':
+        inicio = hoje - timedelta(days=hoje.weekday())
+    elif periodo == 'trimestre':
+        inicio = hoje.replace(month=3 * ((hoje.month - 1) // 3) + 1, day=1)
+    elif periodo == 'ano':
+        inicio = hoje.replace(month=1, day=1)
+    elif periodo == 'personalizado' and filtros.get('dataInicio'):
+        return filtros['dataInicio'], filtros.get('dataFim') or hoje.isoformat()
+    else:
+        inicio = hoje.replace(day=1)
+    return inicio.isoformat(), hoje.isoformat()
+
+def relatorio_vendas(conn, filtros):
+    """Dados de /admin/relatorios/dados calculados só com os rollups"""
+    inicio, fim = periodo_relatorio(filtros)
+    categoria = filtros.get('categoria') or None
+    status = filtros.get('status') or None
+
+    onde, params = ['dia BETWEEN ? AND ?'], [inicio, fim]
+    if categoria:
+        onde.append('categoria = ?')
+        params.append(categoria)
+    # Sem filtro de categoria os totais vêm de vendas_dia (total do pedido, com frete)
+    tabela = 'vendas_categoria_dia' if categoria else 'vendas_dia'
+
+    por_status = {r['status']: {'pedidos': r['pedidos'], 'receita': r['receita']} for r in conn.execute(
+        f"SELECT status, SUM(pedidos) AS pedidos, SUM(receita) AS receita FROM {tabela} "
+        f"WHERE {' AND '.join(onde)} GROUP BY status", params)}
+
+    if status:
+        onde.append('status = ?')
+        params.append(status)
+    where = ' AND '.join(onde)
+
+    if filtros.get('periodo') == 'hoje' and not categoria:
+        serie = conn.execute(f'''
+            SELECT hora || ':00' AS data, SUM(receita) AS valor FROM vendas_hora
+            WHERE hora BETWEEN ? AND ? {'AND status = ?' if status else ''}
+            GROUP BY hora ORDER BY hora
+        ''', [f'{inicio} 00', f'{fim} 23'] + ([status] if status else [])).fetchall()
+    else:
+        serie = conn.execute(
+            f"SELECT dia AS data, SUM(receita) AS valor FROM {tabela} WHERE {where} GROUP BY dia ORDER BY dia",
+            params).fetchall()
+
+    produtos = conn.execute(f'''
+        SELECT produto_id, MAX(nome) AS nome, SUM(unidades) AS vendas, SUM(receita) AS valor
+        FROM vendas_produto_dia WHERE {where}
+        GROUP BY produto_id ORDER BY valor DESC LIMIT 5
+    ''', params).fetchall()
+    categorias = conn.execute(f'''
+        SELECT categoria, SUM(unidades) AS unidades FROM vendas_categoria_dia WHERE {where}
+        GROUP BY categoria ORDER BY unidades DESC
+    ''', params).fetchall()
+
+    selecionados = {s: v for s, v in por_status.items() if not status or s == status}
+    return {
+        'periodo': {'inicio': inicio, 'fim': fim},
+        'vendas': {
+            'total': round(sum(v['receita'] for v in selecionados.values()), 2),
+            'periodo': [{'data': r['data'], 'valor': round(r['valor'], 2)} for r in serie],
+        },
+        'pedidos': {
+            'total': sum(v['pedidos'] for v in selecionados.values()),
+            'concluidos': sum(v['pedidos'] for s, v in por_status.items() if s in STATUS_CONCLUIDOS),
+            'pendentes': por_status.get(STATUS_PEDIDO_PADRAO, {}).get('pedidos', 0),
+            'cancelados': por_status.get(STATUS_CANCELADO, {}).get('pedidos', 0),
+            'por_status': {s: v['pedidos'] for s, v in por_status.items()},
+        },
+        'produtos': [{'id': r['produto_id'], 'nome': r['nome'], 'vendas': r['vendas'],
+                      'valor': round(r['valor'], 2)} for r in produtos],
+        'categorias': {r['categoria'] or 'Sem categoria': r['unidades'] for r in categorias},
+    }
+
+def itens_dos_pedidos(conn, pedido_ids):
+    """{pedido_id: [itens]} com uma consulta só"""
+    itens = {pedido_id: [] for pedido_id in pedido_ids}
+    for lote in range(0, len(pedido_ids), 500):
+        ids = pedido_ids[lote:lote + 500]
+        marcadores = ','.join('?' * len(ids))
+        for row in conn.execute(f'''
+            SELECT pedido_id, produto_id, nome, preco, imagem, quantidade, tamanho, cor, subtotal
+            FROM pedido_itens WHERE pedido_id IN ({marcadores})
+            ORDER BY pedido_id, rowid
+        ''', ids).fetchall():
+            item = dict(row)
+            itens[item.pop('pedido_id')].append(item)
+    return itens
+
+# 📦 Estoque e reservas
+# produtos.estoque é o saldo disponível. O pedido baixa o estoque na mesma transação
+# em que é criado (BEGIN IMMEDIATE): cada produto faz UPDATE ... SET estoque =
+# estoque - ? WHERE id = ? AND estoque >= ?, e se algum não tiver saldo nada do
+# pedido é gravado (EstoqueInsuficiente). Cada baixa vira uma reserva ativa, que é
+# confirmada quando o pedido é pago; se vencer antes, as unidades voltam ao estoque
+# e o pedido é cancelado. A sacola só limita a quantidade ao saldo do momento.
+# Só o PIX (pago na hora, pelo webhook) vence por padrão; cartão e boleto são
+# confirmados à mão em /admin/pedidos e só vencem se RESERVA_VALIDADE_MIN (minutos)
+# for definido. Toda troca de status passa por alterar_status_pedido.
+RESERVA_VALIDADE_PIX_MIN = int(os.getenv('RESERVA_VALIDADE_PIX_MIN', '30'))
+RESERVA_VALIDADE_MIN = int(os.getenv('RESERVA_VALIDADE_MIN', '0'))
+RESERVA_LIMPEZA_INTERVALO = int(os.getenv('RESERVA_LIMPEZA_INTERVALO', '60'))
+_reservas_varridas_em = 0.0
+
+def mensagem_estoque(nome, disponivel):
+    if disponivel <= 0:
+        return f'"{nome}" está esgotado.'
+    return f'Só restam {disponivel} unidade(s) de "{nome}".'
+
+class EstoqueInsuficiente(ValueError):
+    """Algum item do pedido não tem saldo; a transação deve ser desfeita"""
+
+    def __init__(self, produto_id, nome, disponivel):
+        self.produto_id = produto_id
+        self.disponivel = disponivel
+        super().__init__(mensagem_estoque(nome, disponivel))
+
+def folga_estoque(carrinho, produto_id, estoque):
+    """Quantas unidades do produto ainda cabem na sacola sem passar do estoque"""
+    na_sacola = sum(item['quantidade'] for item in carrinho if item['produto_id'] == produto_id)
+    return max(0, (estoque or 0) - na_sacola)
+
+def validade_reserva(metodo_pagamento):
+    """Momento (epoch) em que a reserva vence (math.inf: não vence)"""
+    minutos = RESERVA_VALIDADE_PIX_MIN if (metodo_pagamento or '').lower() == 'pix' else RESERVA_VALIDADE_MIN
+    if minutos <= 0:
+        return math.inf
+    return time.time() + minutos * 60
+
+def reservar_estoque(conn, pedido_id, itens, expira_em):
+    """Baixa o estoque de todos os itens do pedido e registra as reservas.
+
+    Deve rodar dentro de BEGIN IMMEDIATE, junto com o INSERT do pedido.
+    """
+    global _reservas_varridas_em
+    quantidades = Counter()
+    for item in itens:
+        quantidades[int(item['produto_id'])] += int(item['quantidade'])
+    if not quantidades:
+        return
+
+    # Reservas vencidas destes produtos voltam antes (e de todos, de tempos em tempos)
+    agora = time.monotonic()
+    if agora - _reservas_varridas_em >= RESERVA_LIMPEZA_INTERVALO:
+        _reservas_varridas_em = agora
+        liberar_reservas_expiradas(conn)
+    else:
+        liberar_reservas_expiradas(conn, list(quantidades))
+
+    # Ordem fixa por id: a transação já é exclusiva, mas mantém o padrão de travas
+    for produto_id, quantidade in sorted(quantidades.items()):
+        baixou = conn.execute(
+            'UPDATE produtos SET estoque = estoque - ? WHERE id = ? AND estoque >= ?',
+            (quantidade, produto_id, quantidade)
+        ).rowcount
+        if not baixou:
+            row = conn.execute('SELECT nome, estoque FROM produtos WHERE id = ?', (produto_id,)).fetchone()
+            if not row:
+                raise EstoqueInsuficiente(produto_id, f'Produto {produto_id}', 0)
+            raise EstoqueInsuficiente(produto_id, row['nome'], max(0, row['estoque'] or 0))
+    conn.executemany(
+        'INSERT INTO reservas_estoque (pedido_id, produto_id, quantidade, expira_em) VALUES (?, ?, ?, ?)',
+        [(pedido_id, produto_id, quantidade, expira_em) for produto_id, quantidade in sorted(quantidades.items())]
+    )
+
+def _devolver_reservas(conn, condicao, params, status, situacoes=('ativa',)):
+    """Devolve ao estoque as reservas (ativas, por padrão) que atendem à condição"""
+    marcadores = ','.join('?' * len(situacoes))
+    reservas = conn.execute(
+        f"SELECT id, pedido_id, produto_id, quantidade FROM reservas_estoque "
+        f"WHERE status IN ({marcadores}) AND {condicao}",
+        [*situacoes, *params]
+    ).fetchall()
+    conn.executemany('UPDATE produtos SET estoque = estoque + ? WHERE id = ?',
+                     [(r['quantidade'], r['produto_id']) for r in reservas])
+    conn.executemany('UPDATE reservas_estoque SET status = ? WHERE id = ?',
+                     [(status, r['id']) for r in reservas])
+    return reservas
+
+def confirmar_reservas(conn, pedido_id):
+    conn.execute("UPDATE reservas_estoque SET status = 'confirmada' WHERE pedido_id = ? AND status = 'ativa'",
+                 (pedido_id,))
+
+def liberar_reservas_pedido(conn, pedido_id):
+    # Cancelar um pedido já pago (admin) também devolve as unidades confirmadas
+    return len(_devolver_reservas(conn, 'pedido_id = ?', [pedido_id], 'liberada', ('ativa', 'confirmada')))
+
+def liberar_reservas_expiradas(conn, produto_ids=None):
+    """Devolve as reservas vencidas e cancela os pedidos delas; retorna os pedidos cancelados"""
+    condicao, params = 'expira_em <= ?', [time.time()]
+    if produto_ids:
+        condicao += f" AND produto_id IN ({','.join('?' * len(produto_ids))})"
+        params += list(produto_ids)
+    pedidos = sorted({r['pedido_id'] for r in _devolver_reservas(conn, condicao, params, 'expirada')})
+    for pedido_id in pedidos:
+        # O pedido inteiro vence junto, inclusive os outros produtos dele
+        _devolver_reservas(conn, 'pedido_id = ?', [pedido_id], 'expirada')
+        alterar_status_pedido(conn, pedido_id, STATUS_CANCELADO)
+    return pedidos
+
+def _bench_estoque_trabalhador(args):
+    """Processo do bench-estoque: tenta `tentativas` compras do mesmo produto.
+
+    Passa pela rota /processar-compra (test client), então cada tentativa roda o
+    caminho inteiro do pedido: idempotência, reserva, itens, rollups, outbox e
+    marcação dos relacionados.
+    """
+    produto_id, tentativas, quantidade = args
+    vendidos, recusados, erros, tempos = 0, 0, 0, []
+    cliente = app.test_client()
+    corpo = {
+        'cliente': {'nome': 'bench', 'email': 'bench@local', 'telefone': ''},
+        'endereco': {'cep': '-', 'endereco': '-', 'numero': '-', 'bairro': '-', 'cidade': '-', 'estado': '-'},
+        'produto': {'id': produto_id, 'nome': 'Produto disputado', 'preco': 10, 'quantidade': quantidade},
+        'pagamento': 'pix',
+    }
+    for _ in range(tentativas):
+        inicio = time.perf_counter()
+        resposta = cliente.post('/processar-compra', json=corpo,
+                                headers={'Idempotency-Key': secrets.token_hex(16)})
+        if resposta.status_code == 200:
+            vendidos += 1
+        elif resposta.status_code == 409:
+            recusados += 1
+        else:
+            # busy_timeout estourado ou outro erro do pedido
+            erros += 1
+        tempos.append(time.perf_counter() - inicio)
+    return vendidos, recusados, erros, tempos
+
+# 🔁 Idempotência dos pedidos
+# O cliente manda a mesma chave (cabeçalho Idempotency-Key ou campo
+# chave_idempotencia) em todas as tentativas de um pedido. A resposta de sucesso
+# fica em chaves_idempotencia, gravada na mesma transação do pedido, e uma
+# repetição recebe essa resposta com uma leitura pela chave primária, sem abrir
+# transação de escrita. A mesma chave com outros dados é recusada (422). Erros
+# não são guardados: a nova tentativa roda de novo.
+IDEMPOTENCIA_TTL = int(os.getenv('IDEMPOTENCIA_TTL_HORAS', '24')) * 3600
+IDEMPOTENCIA_CHAVE_MAX = 255
+IDEMPOTENCIA_LIMPEZA_INTERVALO = 300
+_idempotencia_limpa_em = 0.0
+
+@dataclass
+class RespostaIdempotente:
+    pedido_id: int
+    status: int
+    corpo: dict
+
+class ChaveIdempotenciaReutilizada(ValueError):
+    """A chave já foi usada numa requisição com outro conteúdo"""
+
+def _chave_idempotencia():
+    chave = (request.headers.get('Idempotency-Key') or request.form.get('chave_idempotencia') or '').strip()
+    if not chave or len(chave) > IDEMPOTENCIA_CHAVE_MAX:
+        return None
+    return chave
+
+def _hash_requisicao(extra=None):
+    """Hash do corpo da requisição; `extra` entra junto (p.ex. o carrinho da sessão)"""
+    if request.is_json:
+        corpo = request.get_data()
+    else:
+        campos = sorted((k, v) for k, v in request.form.items(multi=True) if k != 'chave_idempotencia')
+        corpo = json.dumps(campos, ensure_ascii=False).encode()
+    hash_corpo = hashlib.sha256(corpo)
+    if extra is not None:
+        hash_corpo.update(b'\0' + json.dumps(extra, ensure_ascii=False, sort_keys=True).encode())
+    return hash_corpo.hexdigest()
+
+def _carrinho_normalizado(carrinho_itens):
+    """Carrinho da sessão em forma canônica: soma repetidos e ignora a ordem"""
+    quantidades = {}
+    for item in carrinho_itens:
+        chave = (item['produto_id'], item.get('tamanho') or '', item.get('cor') or '')
+        quantidades[chave] = quantidades.get(chave, 0) + item['quantidade']
+    return sorted([*chave, quantidade] for chave, quantidade in quantidades.items())
+
+@dataclass
+class RequisicaoIdempotente:
+    rota: str
+    chave: str
+    hash_requisicao: str
+
+    def buscar(self, conn):
+        """Resposta já guardada para esta chave (None se não houver ou se venceu)"""
+        row = conn.execute('''
+            SELECT hash_requisicao, pedido_id, status, resposta FROM chaves_idempotencia
+            WHERE rota = ? AND chave = ? AND expira_em > ?
+        ''', (self.rota, self.chave, time.time())).fetchone()
+        if not row:
+            return None
+        if row['hash_requisicao'] != self.hash_requisicao:
+            raise ChaveIdempotenciaReutilizada('Chave de idempotência já usada com outros dados')
+        return RespostaIdempotente(row['pedido_id'], row['status'], json.loads(row['resposta']))
+
+    def guardar(self, conn, pedido_id, status, corpo):
+        """Grava a resposta; chamar dentro da transação que criou o pedido"""
+        global _idempotencia_limpa_em
+        agora = time.monotonic()
+        if agora - _idempotencia_limpa_em >= IDEMPOTENCIA_LIMPEZA_INTERVALO:
+            _idempotencia_limpa_em = agora
+            conn.execute('DELETE FROM chaves_idempotencia WHERE expira_em <= ?', (time.time(),))
+        conn.execute('''
+            INSERT OR REPLACE INTO chaves_idempotencia
+                (rota, chave, hash_requisicao, pedido_id, status, resposta, expira_em)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (self.rota, self.chave, self.hash_requisicao, pedido_id, status,
+              json.dumps(corpo, ensure_ascii=False), time.time() + IDEMPOTENCIA_TTL))
+
+def requisicao_idempotente(extra=None):
+    """(requisição, resposta anterior) da rota atual; (None, None) sem chave.
+
+    `extra` é o que a rota usa além do corpo (o carrinho da sessão em
+    /processar-pedido): reusar a chave com outro valor também é recusado.
+    A consulta usa a conexão de leitura: repetições não disputam a trava de escrita.
+    """
+    chave = _chave_idempotencia()
+    if not chave:
+        return None, None
+    requisicao = RequisicaoIdempotente(request.endpoint, chave, _hash_requisicao(extra))
+    conn = get_db_connection(readonly=True)
+    try:
+        return requisicao, requisicao.buscar(conn)
+    finally:
         conn.close()
-        print("✅ Banco de dados inicializado com sucesso!")
-        # Se o banco estiver vazio de produtos, tentar popular com imagens em static/produtos
-        try:
-            # Abrir conexão separada para seed (evita lock com a anterior)
-            conn2 = get_db_connection()
-            cur = conn2.execute("SELECT COUNT(*) as c FROM produtos")
-            total = cur.fetchone()['c']
-            if total == 0:
-                try:
-                    seed_count = seed_products_from_static(conn2)
-                    if seed_count:
-                        print(f"✅ Seed automático: inseridos {seed_count} produtos a partir de static/produtos")
-                except Exception as se:
-                    print(f"Aviso: falha ao popular produtos automaticamente: {se}")
-            conn2.close()
-        except Exception:
-            pass
-    except Exception as e:
-        print(f"❌ Erro ao inicializar banco: {e}")
 
+# 📣 Notificações de pedidos
+# Outbox transacional: o pedido grava em `notificacoes` uma linha por canal ativo
+# nas configurações da loja (whatsappAtivo, emailPedidos) na mesma transação em que
+# é criado; o checkout não monta nem envia nada. Cada processo do gunicorn entrega
+# a fila num thread (entrega_notificacoes), acordado logo após o commit do pedido e
+# a cada NOTIFICACOES_INTERVALO s: no Heroku/Render um processo à parte não enxerga
+# o SQLite do site. Onde ele enxerga (mesma máquina), `flask notificacoes-worker`
+# pode rodar junto ou no lugar (NOTIFICACOES_NO_WEB=0). Quem entrega pega lotes
+# vencidos, monta as mensagens e usa o transporte de cada canal. Pegar um lote já
+# adia proxima_tentativa por NOTIFICACOES_PRAZO_ENVIO s: se o processo cair no
+# meio, a linha volta sozinha e dois entregadores nunca pegam a mesma linha.
+# Falhas são reagendadas com backoff exponencial até NOTIFICACOES_MAX_TENTATIVAS.
+NOTIFICACOES_NO_WEB = os.getenv('NOTIFICACOES_NO_WEB', '1') == '1'
+NOTIFICACOES_INTERVALO = float(os.getenv('NOTIFICACOES_INTERVALO', '10'))
+NOTIFICACOES_LOTE = int(os.getenv('NOTIFICACOES_LOTE', '20'))
+NOTIFICACOES_MAX_TENTATIVAS = int(os.getenv('NOTIFICACOES_MAX_TENTATIVAS', '8'))
+NOTIFICACOES_BACKOFF_BASE = 30  # segundos; dobra a cada falha
+NOTIFICACOES_BACKOFF_MAX = 3600
+NOTIFICACOES_PRAZO_ENVIO = 120
+NOTIFICACOES_PASTA = os.getenv('NOTIFICACOES_PASTA', os.path.join(BASE_DIR, 'data', 'notificacoes'))
+# Transporte de cada canal: arquivo (padrão, data/notificacoes/<canal>.jsonl),
+# smtp (e-mail) ou webhook (POST JSON, p.ex. uma ponte para a API do WhatsApp)
+NOTIFICACOES_TRANSPORTES = {
+    'whatsapp': os.getenv('NOTIFICACOES_WHATSAPP_TRANSPORTE', 'arquivo'),
+    'email': os.getenv('NOTIFICACOES_EMAIL_TRANSPORTE', 'arquivo'),
+}
+NOTIFICACOES_WEBHOOK_URL = os.getenv('NOTIFICACOES_WEBHOOK_URL', '')
+SMTP_HOST = os.getenv('SMTP_HOST', 'localhost')
+SMTP_PORTA = int(os.getenv('SMTP_PORTA', '25'))
+SMTP_USUARIO = os.getenv('SMTP_USUARIO', '')
+SMTP_SENHA = os.getenv('SMTP_SENHA', '')
+SMTP_TLS = os.getenv('SMTP_TLS', '0') == '1'
+SMTP_REMETENTE = os.getenv('SMTP_REMETENTE', 'pedidos@uzzerstore.com')
 
-def seed_products_from_static(conn=None):
-    """Popula a tabela produtos a partir dos arquivos em static/produtos se não houver entradas.
-    Retorna o número de produtos inseridos.
-    Se uma conexão for passada, usa-a; caso contrário abre uma conexão temporária.
-    """
-    import os
-    from datetime import datetime
+@dataclass
+class Notificacao:
+    canal: str
+    destino: str
+    assunto: str
+    texto: str
 
-    close_conn = False
-    if conn is None:
-        conn = get_db_connection()
-        close_conn = True
+class TransporteArquivo:
+    """Grava cada mensagem como uma linha JSON em <pasta>/<canal>.jsonl"""
 
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    produtos_dir = os.path.join(BASE_DIR, 'static', 'produtos')
-    if not os.path.isdir(produtos_dir):
-        if close_conn:
-            conn.close()
-        return 0
+    def __init__(self, pasta):
+        self.pasta = pasta
 
-    files = [f for f in os.listdir(produtos_dir) if os.path.isfile(os.path.join(produtos_dir, f))]
-    if not files:
-        if close_conn:
-            conn.close()
-        return 0
+    def enviar(self, notificacao):
+        os.makedirs(self.pasta, exist_ok=True)
+        linha = dict(asdict(notificacao), enviada_em=datetime.utcnow().isoformat())
+        with open(os.path.join(self.pasta, f'{notificacao.canal}.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(linha, ensure_ascii=False) + '\n')
 
-    # Ler imagens já referenciadas
-    cur = conn.execute("SELECT imagem FROM produtos WHERE imagem IS NOT NULL")
-    existing = set([r['imagem'] for r in cur.fetchall() if r['imagem']])
+class TransporteSMTP:
+    def __init__(self, host, porta, usuario='', senha='', tls=False, remetente='', timeout=15):
+        self.host = host
+        self.porta = porta
+        self.usuario = usuario
+        self.senha = senha
+        self.tls = tls
+        self.remetente = remetente
+        self.timeout = timeout
 
-    def infer_category(filename):
-        s = filename.lower()
-        if 'bermuda' in s:
-            return 'Bermudas'
-        if 'calça' in s or 'calca' in s:
-            return 'Calças'
-        if 'camisa' in s or 'polo' in s:
-            return 'Camisetas'
-        if 'camiseta' in s:
-            return 'Camisetas'
-        if 'bolsa' in s:
-            return 'Acessórios'
-        if 'boné' in s or 'bone' in s:
-            return 'Acessórios'
-        if 'cueca' in s:
-            return 'Moda Intima'
-        return 'Sem categoria'
+    def enviar(self, notificacao):
+        mensagem = EmailMessage()
+        mensagem['Subject'] = notificacao.assunto
+        mensagem['From'] = self.remetente
+        mensagem['To'] = notificacao.destino
+        mensagem.set_content(notificacao.texto)
+        with smtplib.SMTP(self.host, self.porta, timeout=self.timeout) as smtp:
+            if self.tls:
+                smtp.starttls()
+            if self.usuario:
+                smtp.login(self.usuario, self.senha)
+            smtp.send_message(mensagem)
 
-    inserted = 0
-    for fn in files:
-        imagem_field = f'produtos/{fn}'
-        if imagem_field in existing:
-            continue
-        nome = os.path.splitext(fn)[0].replace('_', ' ').replace('-', ' ').title()
-        preco = 49.90
-        categoria = infer_category(fn)
-        descricao = ''
-        tamanhos = 'P,M,G'
-        estoque = 10
+class TransporteWebhook:
+    """POST do JSON da notificação; qualquer status HTTP de erro conta como falha"""
 
-        try:
-            conn.execute('''
-                INSERT INTO produtos (nome, preco, imagem, categoria, descricao, tamanhos, estoque, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (nome, preco, imagem_field, categoria, descricao, tamanhos, estoque, datetime.utcnow().isoformat()))
-            inserted += 1
-        except Exception:
-            # ignora erros de inserção individuais
-            continue
+    def __init__(self, url, timeout=15):
+        self.url = url
+        self.timeout = timeout
 
-    if inserted > 0:
-        conn.commit()
+    def enviar(self, notificacao):
+        requisicao = urllib.request.Request(
+            self.url, data=json.dumps(asdict(notificacao), ensure_ascii=False).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(requisicao, timeout=self.timeout):
+            pass
 
-    if close_conn:
-        conn.close()
+def criar_transporte(canal):
+    nome = NOTIFICACOES_TRANSPORTES.get(canal, 'arquivo')
+    if nome == 'smtp':
+        return TransporteSMTP(SMTP_HOST, SMTP_PORTA, SMTP_USUARIO, SMTP_SENHA, SMTP_TLS, SMTP_REMETENTE)
+    if nome == 'webhook':
+        if not NOTIFICACOES_WEBHOOK_URL:
+            raise ValueError('NOTIFICACOES_WEBHOOK_URL não definida')
+        return TransporteWebhook(NOTIFICACOES_WEBHOOK_URL)
+    return TransporteArquivo(NOTIFICACOES_PASTA)
 
-    return inserted
+def enfileirar_notificacoes(conn, pedido_id):
+    """Agenda as notificações do pedido; chamar na transação que o criou"""
+    config = carregar_configuracoes()
+    canais = []
+    if config.get('whatsappAtivo', True):
+        canais.append('whatsapp')
+    if config.get('emailPedidos'):
+        canais.append('email')
+    agora = time.time()
+    conn.executemany('INSERT INTO notificacoes (pedido_id, canal, proxima_tentativa) VALUES (?, ?, ?)',
+                     [(pedido_id, canal, agora) for canal in canais])
+    if canais and NOTIFICACOES_NO_WEB:
+        conn.apos_commit.append(entrega_notificacoes.acordar)
 
-def is_admin():
-    """Verifica se usuário atual é administrador (otimizado)"""
-    if 'user_id' not in session:
-        return False
-    
-    # Cache na sessão para evitar consultas repetidas
-    if 'is_admin_cached' in session:
-        return session['is_admin_cached']
-    
+def montar_notificacao(conn, pedido_id, canal):
+    """Mensagem do pedido para o canal (None se o pedido não existe mais)"""
+    pedido = conn.execute('SELECT * FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+    if not pedido:
+        return None
+    itens = itens_dos_pedidos(conn, [pedido_id])[pedido_id]
+    texto = gerar_mensagem_whatsapp(dict(pedido), itens)
+    config = carregar_configuracoes()
+    if canal == 'whatsapp':
+        return Notificacao(canal, config.get('whatsappNumero') or WHATSAPP_NUMERO, f'Pedido #{pedido_id}', texto)
+    if not config.get('emailLoja'):
+        raise ValueError('emailLoja não configurado')
+    return Notificacao(canal, config['emailLoja'], f"Novo pedido #{pedido_id} - {pedido['nome_cliente']}",
+                       texto.replace('*', ''))
+
+def _atraso_notificacao(tentativas):
+    atraso = min(NOTIFICACOES_BACKOFF_MAX, NOTIFICACOES_BACKOFF_BASE * 2 ** (tentativas - 1))
+    return atraso * random.uniform(0.8, 1.2)
+
+def _pegar_lote_notificacoes(conn, limite):
+    agora = time.time()
+    conn.execute('BEGIN IMMEDIATE')
     try:
-        conn = get_db_connection()
-        user = conn.execute('SELECT id, email, is_admin FROM usuarios WHERE id = ?', 
-                           (session['user_id'],)).fetchone()
+        lote = [dict(r) for r in conn.execute('''
+            SELECT id, pedido_id, canal, tentativas FROM notificacoes
+            WHERE status = 'pendente' AND proxima_tentativa <= ?
+            ORDER BY proxima_tentativa LIMIT ?
+        ''', (agora, limite))]
+        conn.executemany('UPDATE notificacoes SET tentativas = tentativas + 1, proxima_tentativa = ? WHERE id = ?',
+                         [(agora + NOTIFICACOES_PRAZO_ENVIO, item['id']) for item in lote])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for item in lote:
+        item['tentativas'] += 1
+    return lote
+
+def processar_notificacoes(transportes, limite=NOTIFICACOES_LOTE):
+    """Entrega um lote de notificações vencidas; retorna (enviadas, falhas)"""
+    conn = get_db_connection()
+    try:
+        lote = _pegar_lote_notificacoes(conn, limite)
+        resultados = []
+        for item in lote:
+            try:
+                notificacao = montar_notificacao(conn, item['pedido_id'], item['canal'])
+                if notificacao:
+                    transportes[item['canal']].enviar(notificacao)
+                resultados.append((item, None))
+            except Exception as e:
+                print(f"Erro ao enviar notificação {item['id']} ({item['canal']}): {e}")
+                resultados.append((item, str(e)[:500]))
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            agora = time.time()
+            for item, erro in resultados:
+                if erro is None:
+                    conn.execute("UPDATE notificacoes SET status = 'enviada', erro = NULL, "
+                                 "enviada_em = CURRENT_TIMESTAMP WHERE id = ?", (item['id'],))
+                elif item['tentativas'] >= NOTIFICACOES_MAX_TENTATIVAS:
+                    conn.execute("UPDATE notificacoes SET status = 'falhou', erro = ? WHERE id = ?",
+                                 (erro, item['id']))
+                else:
+                    conn.execute('UPDATE notificacoes SET proxima_tentativa = ?, erro = ? WHERE id = ?',
+                                 (agora + _atraso_notificacao(item['tentativas']), erro, item['id']))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        falhas = sum(1 for _, erro in resultados if erro)
+        return len(resultados) - falhas, falhas
+    finally:
         conn.close()
 
-        if not user:
-            session['is_admin_cached'] = False
-            return False
+_transportes_web = {}
 
-        # Converter sqlite3.Row para dict para acesso seguro
-        user_dict = dict(user)
-        
-        # Verificação unificada de admin
-        is_admin_user = (
-            bool(user_dict.get('is_admin', False)) or  # Coluna is_admin
-            user_dict['id'] == 1 or  # Primeiro usuário
-            user_dict['email'] in ['admin@uzzerstore.com', 'administrador@uzzerstore.com']  # Emails admin
-        )
-        
-        # Cache o resultado na sessão
-        session['is_admin_cached'] = is_admin_user
-        session.permanent = True
-        
-        return is_admin_user
-        
-    except Exception as e:
-        print(f"Erro ao verificar admin: {e}")
-        return False
+def entregar_notificacoes_pendentes():
+    """Um lote da fila, no thread do processo web; True se pode ter sobrado mais"""
+    if not _transportes_web:
+        _transportes_web.update({canal: criar_transporte(canal) for canal in NOTIFICACOES_TRANSPORTES})
+    enviadas, falhas = processar_notificacoes(_transportes_web)
+    if enviadas or falhas:
+        print(f"📣 {enviadas} notificações enviadas, {falhas} com erro")
+    return enviadas + falhas == NOTIFICACOES_LOTE
 
+entrega_notificacoes = TrabalhoEmSegundoPlano(
+    'entrega-notificacoes', entregar_notificacoes_pendentes, NOTIFICACOES_INTERVALO)
 
+@app.before_request
+def iniciar_trabalhos_em_segundo_plano():
+    """Sobe os threads do processo na primeira requisição (pega o que ficou do último deploy)"""
+    if NOTIFICACOES_NO_WEB:
+        entrega_notificacoes.garantir()
+    recalculo_relacionados.garantir()
 
 # ROTAS DO CARRINHO
 @app.route('/carrinho')
@@ -538,27 +3232,10 @@ def carrinho():
         return render_template('carrinho.html', itens=[], total=0)
     
     try:
-        conn = get_db_connection()
-        itens_detalhados = []
-        total = 0
-        
-        for item in carrinho_itens:
-            produto = conn.execute('SELECT * FROM produtos WHERE id = ?', (item['produto_id'],)).fetchone()
-            if produto:
-                item_total = float(produto['preco']) * item['quantidade']
-                itens_detalhados.append({
-                    'produto': produto,
-                    'quantidade': item['quantidade'],
-                    'tamanho': item.get('tamanho', 'M'),
-                    'cor': item.get('cor', 'Padrão'),
-                    'subtotal': item_total
-                })
-                total += item_total
+        resumo = calcular_carrinho(carrinho_itens)
         
-        conn.close()
-        
-        print(f"Debug - Itens detalhados: {len(itens_detalhados)}")  # Debug
-        return render_template('carrinho.html', itens=itens_detalhados, total=total)
+        print(f"Debug - Itens detalhados: {len(resumo.itens)}")  # Debug
+        return render_template('carrinho.html', itens=resumo.itens, total=resumo.total)
     except Exception as e:
         print(f"Erro no carrinho: {e}")
         return render_template('carrinho.html', itens=[], total=0)
@@ -601,28 +3278,8 @@ def api_carrinho():
         return jsonify({'items': [], 'total': 0})
     
     try:
-        conn = get_db_connection()
-        itens_api = []
-        total = 0
-        
-        for item in carrinho_itens:
-            produto = conn.execute('SELECT * FROM produtos WHERE id = ?', (item['produto_id'],)).fetchone()
-            if produto:
-                item_total = float(produto['preco']) * item['quantidade']
-                itens_api.append({
-                    'produto_id': produto['id'],
-                    'nome': produto['nome'],
-                    'preco': float(produto['preco']),
-                    'imagem': produto['imagem'],
-                    'quantidade': item['quantidade'],
-                    'tamanho': item.get('tamanho', 'M'),
-                    'cor': item.get('cor', 'Padrão'),
-                    'subtotal': item_total
-                })
-                total += item_total
-        
-        conn.close()
-        return jsonify({'items': itens_api, 'total': total})
+        resumo = calcular_carrinho(carrinho_itens)
+        return jsonify({'items': [item.to_dict() for item in resumo.itens], 'total': resumo.total})
     
     except Exception as e:
         print(f"Erro na API do carrinho: {e}")
@@ -644,7 +3301,7 @@ def carrinho_adicionar(produto_id):
     cor = request.args.get('cor', 'Padrão')
     
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(readonly=True)
         produto = conn.execute('SELECT * FROM produtos WHERE id = ?', (produto_id,)).fetchone()
         conn.close()
 
@@ -658,6 +3315,16 @@ def carrinho_adicionar(produto_id):
             session['carrinho'] = []
 
         carrinho = session['carrinho']
+        # A sacola não passa do saldo atual; a baixa de fato acontece no pedido
+        folga = folga_estoque(carrinho, produto_id, produto['estoque'])
+        if quantidade > folga:
+            mensagem = mensagem_estoque(produto['nome'], folga)
+            if request.headers.get('Content-Type') == 'application/json' or request.args.get('ajax'):
+                from flask import jsonify
+                return jsonify({'success': False, 'message': mensagem, 'disponivel': folga})
+            flash(mensagem, 'error')
+            return redirect(request.referrer or url_for('index'))
+
         # Verificar se o produto já está no carrinho (considerando tamanho e cor)
         item_encontrado = False
         for item in carrinho:
@@ -780,6 +3447,13 @@ def carrinho_alterar_quantidade(produto_id):
                                i.get('cor') == cor)
                     ]
                 else:
+                    if delta > 0:
+                        # Aumentos só até o saldo do produto
+                        conn = get_db_connection(readonly=True)
+                        produto = conn.execute('SELECT estoque FROM produtos WHERE id = ?', (produto_id,)).fetchone()
+                        conn.close()
+                        folga = folga_estoque(carrinho, produto_id, produto['estoque'] if produto else 0)
+                        nova_quantidade = item['quantidade'] + min(delta, folga)
                     # Atualiza a quantidade (máximo 99)
                     item['quantidade'] = min(nova_quantidade, 99)
                 
@@ -809,6 +3483,7 @@ def carrinho_limpar():
 
 # ROTAS DE CHECKOUT
 @app.route('/checkout')
+@politica_cache('sensivel')
 def checkout():
     # Verificar se há itens no carrinho
     carrinho_itens = session.get('carrinho', [])
@@ -818,24 +3493,7 @@ def checkout():
         return redirect(url_for('index'))
     
     try:
-        conn = get_db_connection()
-        itens_detalhados = []
-        total = 0
-        
-        for item in carrinho_itens:
-            produto = conn.execute('SELECT * FROM produtos WHERE id = ?', (item['produto_id'],)).fetchone()
-            if produto:
-                item_total = float(produto['preco']) * item['quantidade']
-                itens_detalhados.append({
-                    'produto': produto,
-                    'quantidade': item['quantidade'],
-                    'tamanho': item.get('tamanho', 'M'),
-                    'cor': item.get('cor', 'Padrão'),
-                    'subtotal': item_total
-                })
-                total += item_total
-        
-        conn.close()
+        resumo = calcular_carrinho(carrinho_itens)
         
         # Dados do usuário logado (se houver)
         user_data = {}
@@ -850,19 +3508,36 @@ def checkout():
             conn.close()
         
         return render_template('checkout.html', 
-                             itens=itens_detalhados, 
-                             total=total,
-                             user_data=user_data)
+                             itens=resumo.itens, 
+                             total=resumo.total,
+                             user_data=user_data,
+                             chave_idempotencia=secrets.token_urlsafe(16))
     except Exception as e:
         print(f"Erro no checkout: {e}")
         flash('Erro ao carregar página de checkout!', 'error')
         return redirect(url_for('carrinho'))
 
 @app.route('/processar-pedido', methods=['POST'])
+@politica_cache('sensivel')
 def processar_pedido():
     try:
         # Verificar se há itens no carrinho
         carrinho_itens = session.get('carrinho', [])
+
+        # Repetição de um pedido já criado (duplo clique, reenvio): mesma página de sucesso.
+        # Os itens vêm da sessão, não do formulário: o carrinho entra no hash da chave.
+        # Depois do pedido a sacola fica vazia; o reenvio com a mesma chave usa o
+        # carrinho que foi guardado junto com ela
+        carrinho_chave = _carrinho_normalizado(carrinho_itens)
+        ultimo_pedido = session.get('ultimo_pedido_chave')
+        if not carrinho_itens and ultimo_pedido and ultimo_pedido[0] == _chave_idempotencia():
+            carrinho_chave = ultimo_pedido[1]
+        try:
+            idempotencia, anterior = requisicao_idempotente(carrinho_chave)
+        except ChaveIdempotenciaReutilizada as e:
+            return f'{e}. Recarregue a página e tente novamente.', 422
+        if anterior:
+            return redirect(url_for('pedido_sucesso', pedido_id=anterior.pedido_id))
         
         if not carrinho_itens:
             flash('Seu carrinho está vazio!', 'error')
@@ -892,59 +3567,65 @@ def processar_pedido():
         
         # Calcular total e preparar itens
         conn = get_db_connection()
-        itens_pedido = []
-        total = 0
-        
-        for item in carrinho_itens:
-            produto = conn.execute('SELECT * FROM produtos WHERE id = ?', (item['produto_id'],)).fetchone()
-            if produto:
-                item_total = float(produto['preco']) * item['quantidade']
-                itens_pedido.append({
-                    'produto_id': produto['id'],
-                    'nome': produto['nome'],
-                    'preco': float(produto['preco']),
-                    'quantidade': item['quantidade'],
-                    'tamanho': item.get('tamanho', 'M'),
-                    'cor': item.get('cor', 'Padrão'),
-                    'subtotal': item_total
-                })
-                total += item_total
+        resumo = calcular_carrinho(carrinho_itens, conn)
+        itens_pedido = [item.to_dict() for item in resumo.itens]
+        total = resumo.total
         
         # Salvar pedido no banco
         usuario_id = session.get('user_id')
         itens_json = json.dumps(itens_pedido)
         
-        cursor = conn.execute('''
-            INSERT INTO pedidos (
+        # Pedido, itens e baixa de estoque na mesma transação: entra tudo ou nada
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Outra tentativa com a mesma chave pode ter terminado enquanto esperávamos a trava
+            anterior = idempotencia.buscar(conn) if idempotencia else None
+            if anterior:
+                conn.rollback()
+                conn.close()
+                return redirect(url_for('pedido_sucesso', pedido_id=anterior.pedido_id))
+
+            cursor = conn.execute('''
+                INSERT INTO pedidos (
+                    usuario_id, nome_cliente, email_cliente, telefone,
+                    cep, endereco, numero, complemento, bairro, cidade, estado,
+                    metodo_pagamento, total, itens
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
                 usuario_id, nome_cliente, email_cliente, telefone,
                 cep, endereco, numero, complemento, bairro, cidade, estado,
-                metodo_pagamento, total, itens
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            usuario_id, nome_cliente, email_cliente, telefone,
-            cep, endereco, numero, complemento, bairro, cidade, estado,
-            metodo_pagamento, total, itens_json
-        ))
-        
-        pedido_id = cursor.lastrowid
-        conn.commit()
-        
-        # Buscar o pedido criado para gerar mensagem WhatsApp
-        pedido = conn.execute('SELECT * FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+                metodo_pagamento, total, itens_json
+            ))
+
+            pedido_id = cursor.lastrowid
+            reservar_estoque(conn, pedido_id, itens_pedido, validade_reserva(metodo_pagamento))
+            registrar_itens_pedido(conn, pedido_id, itens_pedido)
+            registrar_venda(conn, pedido_id)
+            enfileirar_notificacoes(conn, pedido_id)
+            marcar_relacionados(conn, [item['produto_id'] for item in itens_pedido])
+            if idempotencia:
+                idempotencia.guardar(conn, pedido_id, 302, {'pedido_id': pedido_id})
+            conn.commit()
+        except EstoqueInsuficiente as e:
+            conn.rollback()
+            conn.close()
+            flash(f'{e} Ajuste a sacola para finalizar o pedido.', 'error')
+            return redirect(url_for('carrinho'))
+        except Exception:
+            conn.rollback()
+            conn.close()
+            raise
         conn.close()
         
         # Limpar carrinho
         session['carrinho'] = []
+        if idempotencia:
+            session['ultimo_pedido_chave'] = [idempotencia.chave, carrinho_chave]
         session.permanent = True
         
-        # Gerar mensagem e URL do WhatsApp
-        mensagem_whatsapp = gerar_mensagem_whatsapp(pedido, itens_pedido)
-        url_whatsapp = gerar_url_whatsapp(WHATSAPP_NUMERO, mensagem_whatsapp)
-        
-        # Salvar URL do WhatsApp na sessão para usar na página de sucesso
-        session['whatsapp_url'] = url_whatsapp
-        session['pedido_mensagem'] = mensagem_whatsapp
-        
+        # A página de sucesso monta o link do WhatsApp deste pedido (só na primeira visita)
+        session['pedido_whatsapp'] = pedido_id
+                
         flash('Pedido realizado com sucesso!', 'success')
         return redirect(url_for('pedido_sucesso', pedido_id=pedido_id))
     
@@ -954,26 +3635,23 @@ def processar_pedido():
         return redirect(url_for('checkout'))
 
 @app.route('/pedido-sucesso/<int:pedido_id>')
+@politica_cache('sensivel')
 def pedido_sucesso(pedido_id):
     try:
         conn = get_db_connection()
         pedido = conn.execute('SELECT * FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+        itens = itens_dos_pedidos(conn, [pedido_id])[pedido_id] if pedido else []
         conn.close()
         
         if not pedido:
             flash('Pedido não encontrado!', 'error')
             return redirect(url_for('index'))
         
-        # Parse dos itens do pedido
-        itens = json.loads(pedido['itens'])
-        
-        # Obter dados do WhatsApp da sessão
-        whatsapp_url = session.get('whatsapp_url')
-        pedido_mensagem = session.get('pedido_mensagem')
-        
-        # Limpar dados da sessão após usar
-        session.pop('whatsapp_url', None)
-        session.pop('pedido_mensagem', None)
+        # Link do WhatsApp só logo após o checkout deste pedido
+        whatsapp_url = pedido_mensagem = None
+        if session.pop('pedido_whatsapp', None) == pedido_id:
+            pedido_mensagem = gerar_mensagem_whatsapp(dict(pedido), itens)
+            whatsapp_url = gerar_url_whatsapp(WHATSAPP_NUMERO, pedido_mensagem)
         
         return render_template('pedido_sucesso.html', 
                              pedido=pedido, 
@@ -998,14 +3676,10 @@ def meus_pedidos():
             'SELECT * FROM pedidos WHERE usuario_id = ? ORDER BY created_at DESC',
             (session['user_id'],)
         ).fetchall()
+        itens = itens_dos_pedidos(conn, [p['id'] for p in pedidos])
         conn.close()
         
-        # Parse dos itens de cada pedido
-        pedidos_com_itens = []
-        for pedido in pedidos:
-            pedido_dict = dict(pedido)
-            pedido_dict['itens'] = json.loads(pedido['itens'])
-            pedidos_com_itens.append(pedido_dict)
+        pedidos_com_itens = [dict(pedido, itens=itens[pedido['id']]) for pedido in pedidos]
         
         return render_template('pedidos_usuario.html', pedidos=pedidos_com_itens)
     
@@ -1016,26 +3690,18 @@ def meus_pedidos():
 
 # ROTA PRINCIPAL
 @app.route('/')
+@politica_cache('catalogo')
 def index():
     try:
         categoria_selecionada = request.args.get('categoria')
-        
-        conn = get_db_connection()
-        
-        if categoria_selecionada:
-            produtos = conn.execute(
-                'SELECT * FROM produtos WHERE categoria = ? ORDER BY id DESC',
-                (categoria_selecionada,)
-            ).fetchall()
-        else:
-            produtos = conn.execute('SELECT * FROM produtos ORDER BY id DESC').fetchall()
-        
-        categorias = conn.execute('SELECT DISTINCT categoria FROM produtos WHERE categoria IS NOT NULL ORDER BY categoria').fetchall()
-        
-        conn.close()
-        
-        return render_template('index.html', 
-                             produtos=produtos, 
+
+        # Só a primeira página vai no HTML; o restante vem da /api/produtos no scroll
+        produtos, proximo_cursor = catalogo_pagina(categoria_selecionada)
+        categorias = catalogo_categorias()
+
+        return render_template('index.html',
+                             produtos=produtos,
+                             proximo_cursor=proximo_cursor,
                              categorias=categorias,
                              categoria_selecionada=categoria_selecionada)
     except Exception as e:
@@ -1050,37 +3716,142 @@ def index():
         </style>
         """
 
+# API paginada do catálogo (scroll infinito da vitrine)
+@app.route('/api/produtos')
+@politica_cache('catalogo')
+def api_produtos():
+    """Lista produtos por cursor: ?cursor=<id>&categoria=<nome>&limite=<n>&html=1"""
+    try:
+        cursor = request.args.get('cursor', type=int)
+        limite = request.args.get('limite', CATALOGO_PAGINA_TAMANHO, type=int)
+        limite = max(1, min(limite, CATALOGO_PAGINA_MAXIMO))
+        categoria = request.args.get('categoria') or None
+
+        produtos, proximo_cursor = catalogo_pagina(categoria, cursor, limite)
+
+        resposta = {
+            'produtos': [{
+                'id': p['id'],
+                'nome': p['nome'],
+                'preco': float(p['preco']),
+                'categoria': p['categoria'],
+                'tamanhos': p.get('tamanhos'),
+                'imagem': p['imagem']
+            } for p in produtos],
+            'proximo_cursor': proximo_cursor
+        }
+        if request.args.get('html'):
+            # Mesmo markup dos cards renderizados no servidor
+            resposta['html'] = render_template_string(
+                "{% for produto in produtos %}{% include '_produto_card.html' %}{% endfor %}",
+                produtos=produtos)
+        return jsonify(resposta)
+    except Exception as e:
+        print(f"Erro na API de produtos: {e}")
+        return jsonify({'produtos': [], 'proximo_cursor': None, 'error': str(e)}), 500
+
+@app.route('/api/busca')
+@politica_cache('catalogo')
+def api_busca():
+    """Busca textual com typeahead: ?q=<texto>&pagina=<n>&limite=<n>"""
+    texto = (request.args.get('q') or '').strip()
+    pagina = max(1, request.args.get('pagina', 1, type=int))
+    limite = request.args.get('limite', BUSCA_PAGINA_TAMANHO, type=int)
+    limite = max(1, min(limite, BUSCA_PAGINA_MAXIMO))
+    try:
+        produtos, tem_mais = buscar_produtos(texto, pagina, limite)
+        return jsonify({
+            'q': texto,
+            'produtos': [{
+                'id': p['id'],
+                'nome': p['nome'],
+                'destaque': p['destaque'],
+                'preco': float(p['preco']),
+                'categoria': p['categoria'],
+                'imagem': url_imagem_produto(p['imagem']),
+                'url': url_for('produto_individual', produto_id=p['id']),
+            } for p in produtos],
+            'pagina': pagina,
+            'proxima_pagina': pagina + 1 if tem_mais else None,
+        })
+    except Exception as e:
+        print(f"Erro na busca de produtos: {e}")
+        return jsonify({'q': texto, 'produtos': [], 'pagina': pagina, 'proxima_pagina': None, 'error': str(e)}), 500
+
+@app.route('/api/filtros')
+@politica_cache('catalogo')
+def api_filtros():
+    """Vitrine filtrada com contagens por faceta.
+
+    ?categoria=&preco=<faixa>&tamanho= (repetíveis), ?em_estoque=1,
+    ?preco_min=&preco_max=, ?pagina=&limite=, ?html=1
+    """
+    try:
+        pagina = max(1, request.args.get('pagina', 1, type=int))
+        limite = request.args.get('limite', CATALOGO_PAGINA_TAMANHO, type=int)
+        limite = max(1, min(limite, CATALOGO_PAGINA_MAXIMO))
+        selecionados = {
+            'categoria': set(request.args.getlist('categoria')) - {''},
+            'preco': set(request.args.getlist('preco')) - {''},
+            'tamanho': {t.upper() for t in request.args.getlist('tamanho') if t},
+            'estoque': {'disponivel'} if request.args.get('em_estoque') else set(),
+        }
+
+        indice = catalogo_facetas()
+        resultado, contagens = indice.filtrar(
+            selecionados, request.args.get('preco_min', type=float), request.args.get('preco_max', type=float))
+        total = resultado.bit_count()
+        produtos = indice.pagina(resultado, pagina, limite)
+
+        resposta = {
+            'total': total,
+            'pagina': pagina,
+            'proxima_pagina': pagina + 1 if pagina * limite < total else None,
+            'produtos': [{
+                'id': p['id'],
+                'nome': p['nome'],
+                'preco': float(p['preco']),
+                'categoria': p['categoria'],
+                'tamanhos': p.get('tamanhos'),
+                'imagem': p['imagem']
+            } for p in produtos],
+            'facetas': {
+                dimensao: [{
+                    'valor': valor,
+                    'rotulo': rotulo_faceta(dimensao, valor),
+                    'total': quantidade,
+                    'selecionado': valor in selecionados[dimensao],
+                } for valor, quantidade in contagens[dimensao].items()]
+                for dimensao in DIMENSOES_FACETAS
+            },
+        }
+        if request.args.get('html'):
+            resposta['html'] = render_template_string(
+                "{% for produto in produtos %}{% include '_produto_card.html' %}{% endfor %}",
+                produtos=produtos)
+        return jsonify(resposta)
+    except Exception as e:
+        print(f"Erro na API de filtros: {e}")
+        return jsonify({'total': 0, 'produtos': [], 'facetas': {}, 'proxima_pagina': None, 'error': str(e)}), 500
+
 # ROTA PRODUTO INDIVIDUAL
 @app.route('/produto/<int:produto_id>')
+@politica_cache('catalogo')
 def produto_individual(produto_id):
     try:
-        conn = get_db_connection()
-        produto = conn.execute('SELECT * FROM produtos WHERE id = ?', (produto_id,)).fetchone()
-        
+        produto = catalogo_produto(produto_id)
+
         if not produto:
-            conn.close()
             flash('Produto não encontrado!', 'error')
             return redirect(url_for('index'))
-        
+
         # Processar imagens adicionais
         imagens_adicionais = get_imagens_adicionais(produto)
-        
-        # Buscar produtos relacionados da mesma categoria
-        # Converter sqlite3.Row para dict para acesso seguro
-        produto_dict = dict(produto)
-        categoria = produto_dict.get('categoria', '')
-        
-        produtos_relacionados = conn.execute(
-            'SELECT * FROM produtos WHERE categoria = ? AND id != ? ORDER BY RANDOM() LIMIT 4',
-            (categoria, produto_id)
-        ).fetchall()
-        
-        conn.close()
-        
+
         return render_template('produto_individual.html', 
                              produto=produto,
                              imagens_adicionais=imagens_adicionais,
-                             produtos_relacionados=produtos_relacionados)
+                             produtos_relacionados=produtos_relacionados(produto_id))
     except Exception as e:
         print(f"Erro ao carregar produto: {e}")
         flash('Erro ao carregar produto!', 'error')
@@ -1099,7 +3870,7 @@ def comprar_agora():
         produto = None
         
         if produto_id:
-            conn = get_db_connection()
+            conn = get_db_connection(readonly=True)
             produto = conn.execute('SELECT * FROM produtos WHERE id = ?', (produto_id,)).fetchone()
             conn.close()
             
@@ -1117,6 +3888,7 @@ def comprar_agora():
         return redirect(url_for('index'))
 
 @app.route('/processar-compra', methods=['POST'])
+@politica_cache('sensivel')
 def processar_compra():
     """Processar dados da compra e criar pedido"""
     try:
@@ -1125,7 +3897,15 @@ def processar_compra():
         # Validar dados recebidos
         if not data or 'cliente' not in data or 'produto' not in data:
             return {'success': False, 'message': 'Dados incompletos'}, 400
-        
+
+        # Repetição de um pedido já criado: devolve a resposta original
+        try:
+            idempotencia, anterior = requisicao_idempotente()
+        except ChaveIdempotenciaReutilizada as e:
+            return {'success': False, 'message': str(e)}, 422
+        if anterior:
+            return anterior.corpo, anterior.status
+
         conn = get_db_connection()
         
         # Calcular total
@@ -1135,104 +3915,214 @@ def processar_compra():
         total = subtotal + frete
         
         # Inserir pedido na base de dados
-        itens_json = json.dumps([{
+        itens_pedido = [{
             'produto_id': produto['id'],
             'nome': produto['nome'],
             'preco': produto['preco'],
             'quantidade': produto['quantidade'],
             'tamanho': produto.get('tamanho', ''),
             'imagem': produto.get('imagem', '')
-        }])
-        
-        cursor = conn.execute('''
-            INSERT INTO pedidos (
-                nome_cliente, email_cliente, telefone, 
-                cep, endereco, numero, complemento, bairro, cidade, estado,
-                metodo_pagamento, total, itens, status
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['cliente']['nome'],
-            data['cliente']['email'], 
-            data['cliente']['telefone'],
-            data['endereco']['cep'],
-            data['endereco']['endereco'],
-            data['endereco']['numero'],
-            data['endereco'].get('complemento', ''),
-            data['endereco']['bairro'],
-            data['endereco']['cidade'],
-            data['endereco']['estado'],
-            data['pagamento'],
-            total,
-            itens_json,
-            'Pendente'
-        ))
-        
-        pedido_id = cursor.lastrowid
-        conn.commit()
+        }]
+        itens_json = json.dumps(itens_pedido)
+
+        # Pedido, itens e baixa de estoque na mesma transação: entra tudo ou nada
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Outra tentativa com a mesma chave pode ter terminado enquanto esperávamos a trava
+            anterior = idempotencia.buscar(conn) if idempotencia else None
+            if anterior:
+                conn.rollback()
+                conn.close()
+                return anterior.corpo, anterior.status
+
+            cursor = conn.execute('''
+                INSERT INTO pedidos (
+                    nome_cliente, email_cliente, telefone,
+                    cep, endereco, numero, complemento, bairro, cidade, estado,
+                    metodo_pagamento, total, itens, status
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                data['cliente']['nome'],
+                data['cliente']['email'],
+                data['cliente']['telefone'],
+                data['endereco']['cep'],
+                data['endereco']['endereco'],
+                data['endereco']['numero'],
+                data['endereco'].get('complemento', ''),
+                data['endereco']['bairro'],
+                data['endereco']['cidade'],
+                data['endereco']['estado'],
+                data['pagamento'],
+                total,
+                itens_json,
+                STATUS_PEDIDO_PADRAO
+            ))
+
+            pedido_id = cursor.lastrowid
+            reservar_estoque(conn, pedido_id, itens_pedido, validade_reserva(data['pagamento']))
+            registrar_itens_pedido(conn, pedido_id, itens_pedido)
+            registrar_venda(conn, pedido_id)
+            enfileirar_notificacoes(conn, pedido_id)
+            marcar_relacionados(conn, [item['produto_id'] for item in itens_pedido])
+
+            # Se for pagamento PIX, redirecionar para página específica
+            if data['pagamento'] == 'pix':
+                resposta = {
+                    'success': True,
+                    'pedido_id': pedido_id,
+                    'token': token_pedido(pedido_id),
+                    'redirect_pix': True,
+                    'message': 'Pedido criado! Redirecionando para pagamento PIX...'
+                }
+            else:
+                resposta = {
+                    'success': True,
+                    'pedido_id': pedido_id,
+                    'message': 'Pedido criado com sucesso!'
+                }
+            if idempotencia:
+                idempotencia.guardar(conn, pedido_id, 200, resposta)
+            conn.commit()
+        except EstoqueInsuficiente as e:
+            conn.rollback()
+            conn.close()
+            return {'success': False, 'message': str(e), 'disponivel': e.disponivel}, 409
+        except Exception:
+            conn.rollback()
+            conn.close()
+            raise
         conn.close()
-        
-        # Se for pagamento PIX, redirecionar para página específica
-        if data['pagamento'] == 'pix':
-            return {
-                'success': True, 
-                'pedido_id': pedido_id,
-                'redirect_pix': True,
-                'message': 'Pedido criado! Redirecionando para pagamento PIX...'
-            }
-        
-        return {
-            'success': True, 
-            'pedido_id': pedido_id,
-            'message': 'Pedido criado com sucesso!'
-        }
+        return resposta
         
     except Exception as e:
         print(f"Erro ao processar compra: {e}")
         return {'success': False, 'message': 'Erro interno do servidor'}, 500
 
 @app.route('/pagamento-pix/<int:pedido_id>')
+@politica_cache('sensivel')
 def pagamento_pix(pedido_id):
-    """Página de pagamento PIX"""
+    """Página de pagamento PIX (?token= do pedido, devolvido por /processar-compra)"""
     try:
+        token = request.args.get('token', '')
         conn = get_db_connection()
-        pedido = conn.execute('SELECT * FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
-        conn.close()
+        try:
+            pedido = None
+            if token_pedido_valido(pedido_id, token):
+                pedido = conn.execute('SELECT * FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+            # BR Code e QR guardados com o pedido (gerados na primeira visita)
+            pix = pix_do_pedido(conn, pedido) if pedido else None
+        finally:
+            conn.close()
         
         if not pedido:
             flash('Pedido não encontrado!', 'error')
             return redirect(url_for('index'))
         
-        # Gerar código PIX simulado (em produção, usar uma API real)
-        codigo_pix = gerar_codigo_pix(pedido['total'], pedido_id)
-        
         return render_template('pagamento_pix.html', 
                              pedido=pedido, 
-                             codigo_pix=codigo_pix)
+                             token_pedido=token,
+                             codigo_pix=pix.codigo,
+                             qr_svg=Markup(pix.qr_svg) if pix.qr_svg else None,
+                             qr_png_url=url_for('pagamento_pix_qrcode', pedido_id=pedido_id, formato='png',
+                                                token=token) if pix.qr_png else None)
     
     except Exception as e:
         print(f"Erro ao carregar pagamento PIX: {e}")
         flash('Erro ao carregar página de pagamento!', 'error')
         return redirect(url_for('index'))
 
+@app.route('/pagamento-pix/<int:pedido_id>/qrcode.<formato>')
+@politica_cache('sensivel')
+def pagamento_pix_qrcode(pedido_id, formato):
+    """QR Code do PIX do pedido em SVG ou PNG (lido de pedidos_pix)"""
+    if formato not in ('svg', 'png'):
+        return 'Formato inválido', 404
+    if not token_pedido_valido(pedido_id, request.args.get('token')):
+        return 'QR Code indisponível', 404
+    conn = get_db_connection()
+    try:
+        pedido = conn.execute('SELECT * FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+        pix = pix_do_pedido(conn, pedido) if pedido else None
+    finally:
+        conn.close()
+    if not pix or not pix.qr_svg:
+        return 'QR Code indisponível', 404
+    if formato == 'svg':
+        return app.response_class(pix.qr_svg, mimetype='image/svg+xml')
+    return app.response_class(pix.qr_png, mimetype='image/png')
+
+@app.route('/api/pedidos/<int:pedido_id>/status')
+@politica_cache('sensivel')
+def status_pedido(pedido_id):
+    """Long-poll do status: com ?status=<atual> a resposta só sai quando ele mudar
+    (ou após ?espera= segundos, no máximo PAGAMENTO_ESPERA_MAX). Exige ?token= do pedido"""
+    if not token_pedido_valido(pedido_id, request.args.get('token')):
+        return jsonify({'success': False, 'message': 'Pedido não encontrado'}), 404
+    conn = get_db_connection(readonly=True)
+    pedido = conn.execute('SELECT status FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+    conn.close()
+    if not pedido:
+        return jsonify({'success': False, 'message': 'Pedido não encontrado'}), 404
+
+    status = pedido['status']
+    if request.args.get('status') == status:
+        try:
+            espera = float(request.args.get('espera', PAGAMENTO_ESPERA_MAX))
+        except ValueError:
+            espera = PAGAMENTO_ESPERA_MAX
+        # A conexão já voltou ao pool: esperar não segura nada do banco
+        novo = notificador_pedidos.esperar(pedido_id, status, max(0, min(espera, PAGAMENTO_ESPERA_MAX)))
+        if novo is None:
+            # Esperas do processo esgotadas: status atual agora, nova tentativa depois
+            resposta = jsonify(resumo_status_pedido(pedido_id, status))
+            resposta.headers['Retry-After'] = str(PAGAMENTO_RETRY_AFTER)
+            return resposta
+        status = novo
+    return jsonify(resumo_status_pedido(pedido_id, status))
+
+@app.route('/webhooks/pix', methods=['POST'])
+@politica_cache('sensivel')
+def webhook_pix():
+    """Aviso de pagamento do PSP: {"pix": [{"txid": "PEDIDO<id>", "valor": "10.00", ...}]}"""
+    token = request.headers.get('X-Webhook-Token', '')
+    if not PIX_WEBHOOK_TOKEN or not hmac.compare_digest(token, PIX_WEBHOOK_TOKEN):
+        return jsonify({'success': False, 'message': 'Não autorizado'}), 401
+
+    data = request.get_json(silent=True)
+    avisos = data.get('pix', [data]) if isinstance(data, dict) else None
+    if not isinstance(avisos, list) or not avisos or not all(isinstance(aviso, dict) for aviso in avisos):
+        return jsonify({'success': False, 'message': 'Corpo inválido'}), 400
+    resultados = []
+    for aviso in avisos:
+        encontrado = re.fullmatch(r'PEDIDO(\d+)', str(aviso.get('txid', '')))
+        if not encontrado:
+            return jsonify({'success': False, 'message': 'txid inválido'}), 400
+        pedido_id = int(encontrado.group(1))
+        try:
+            status, revisao = confirmar_pagamento_pix(pedido_id, aviso.get('valor'), aviso.get('endToEndId'))
+        except LookupError:
+            return jsonify({'success': False, 'message': f'Pedido {pedido_id} não encontrado'}), 404
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 422
+        resultados.append(dict(resumo_status_pedido(pedido_id, status), revisao=revisao))
+    return jsonify({'success': True, 'pedidos': resultados})
+
 @app.route('/verificar-pagamento-pix', methods=['POST'])
+@politica_cache('sensivel')
 def verificar_pagamento_pix():
-    """Verificar status do pagamento PIX"""
+    """Verificar status do pagamento PIX (o pagamento chega pelo /webhooks/pix)"""
     try:
         data = request.get_json()
         pedido_id = data.get('pedido_id')
+        if not token_pedido_valido(pedido_id, data.get('token')):
+            return jsonify({'pago': False, 'message': 'Pedido não encontrado'}), 404
         
-        # Simular verificação (em produção, consultar API do banco/gateway)
-        # Por enquanto, simular que 30% dos pagamentos são aprovados
-        import random
-        pago = random.random() < 0.3  # 30% de chance de estar pago
-        
-        if pago:
-            # Atualizar status do pedido
-            conn = get_db_connection()
-            conn.execute('UPDATE pedidos SET status = ? WHERE id = ?', 
-                        ('Pago', pedido_id))
-            conn.commit()
-            conn.close()
+        conn = get_db_connection(readonly=True)
+        pedido = conn.execute('SELECT status FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+        conn.close()
+        if pedido and pedido['status'] == STATUS_CANCELADO:
+            return jsonify({'pago': False, 'message': 'Pedido cancelado: o prazo de pagamento expirou'})
+        pago = bool(pedido) and pedido['status'] in STATUS_CONCLUIDOS
         
         return jsonify({
             'pago': pago,
@@ -1243,62 +4133,335 @@ def verificar_pagamento_pix():
         print(f"Erro ao verificar pagamento: {e}")
         return jsonify({'pago': False, 'message': 'Erro na verificação'})
 
-def gerar_codigo_pix(valor, pedido_id):
-    """Gerar código PIX usando configurações salvas"""
-    # Carregar configurações PIX
+# 💠 PIX (BR Code)
+# Payload EMV-MPM do Manual do BR Code (Bacen): campos TLV (id + tamanho com 2
+# dígitos + valor), conta do recebedor no campo 26 (GUI br.gov.bcb.pix + chave),
+# txid no 62/05 e CRC16-CCITT (polinômio 0x1021, início 0xFFFF) de todo o payload,
+# "6304" incluído. O código e o QR de cada pedido são gerados na primeira visita à
+# página de pagamento e guardados em pedidos_pix; a chave do cache junta o valor e
+# os dados PIX da loja, então só gera de novo se um deles mudar. Nada depende do
+# processo: todos os workers devolvem o mesmo código.
+PIX_GUI = 'br.gov.bcb.pix'
+PIX_FORMATO = 1  # aumentar ao mudar o payload ou o QR, para gerar tudo de novo
+PIX_QR_ESCALA_SVG = 5
+PIX_QR_ESCALA_PNG = 8
+
+def _tabela_crc16(polinomio=0x1021):
+    tabela = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ polinomio) if crc & 0x8000 else crc << 1
+        tabela.append(crc & 0xFFFF)
+    return tuple(tabela)
+
+CRC16_TABELA = _tabela_crc16()
+
+def crc16_ccitt(dados, crc=0xFFFF):
+    """CRC16-CCITT (FALSE) por tabela; crc16_ccitt(b'123456789') == 0x29B1"""
+    for byte in dados:
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABELA[(crc >> 8) ^ byte]
+    return crc
+
+def _tlv(campo, valor):
+    valor = str(valor)
+    if len(valor) > 99:
+        raise ValueError(f'Campo {campo} do BR Code passa de 99 caracteres')
+    return f'{campo}{len(valor):02d}{valor}'
+
+def _texto_pix(texto, limite):
+    """Maiúsculas ASCII sem acento, cortadas no tamanho do campo"""
+    texto = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return ' '.join(re.sub(r'[^A-Za-z0-9 .\-]', '', texto).upper().split())[:limite]
+
+def _chave_pix(chave, tipo):
+    chave = (chave or '').strip()
+    if '@' in chave:
+        return chave.lower()
+    if tipo == 'telefone' or chave.startswith('+'):
+        digitos = re.sub(r'\D', '', chave)
+        return '+' + (digitos if digitos.startswith('55') else '55' + digitos)
+    if tipo in ('cpf', 'cnpj'):
+        return re.sub(r'\D', '', chave)
+    return chave
+
+def _dados_pix_loja():
     config = carregar_configuracoes()
-    
-    # Valores padrão caso não estejam configurados
-    chave_pix = config.get('chavePix', 'contato@uzzerstore.com')
-    nome_beneficiario = config.get('nomeBeneficiarioPix', 'UZZERSTORE LTDA')
-    cidade_beneficiario = config.get('cidadeBeneficiario', 'SAO PAULO')
-    
-    # Em produção, usar biblioteca real para PIX (como pypix ou similar)
-    # Este é apenas um código simulado para demonstração
-    
-    # Formato básico do código PIX
-    base_code = f"PIX{pedido_id:06d}{int(valor*100):08d}"
-    
-    # Montar código PIX simplificado (formato real é mais complexo)
-    codigo_completo = (
-        f"00020126"  # Payload Format Indicator
-        f"{len(chave_pix)+4:02d}0014{chave_pix}"  # Merchant Account Information
-        f"5303986"  # Transaction Currency (986 = BRL)
-        f"54{len(f'{valor:.2f}'):02d}{valor:.2f}"  # Transaction Amount
-        f"5802BR"  # Country Code
-        f"59{len(nome_beneficiario):02d}{nome_beneficiario}"  # Merchant Name
-        f"60{len(cidade_beneficiario):02d}{cidade_beneficiario}"  # Merchant City
-        f"62{len(str(pedido_id))+4:02d}05{len(str(pedido_id)):02d}{pedido_id}"  # Additional Data
-        f"6304"  # CRC16
+    return {
+        'chave': _chave_pix(config.get('chavePix', 'contato@uzzerstore.com'), config.get('tipoChavePix')),
+        'nome': _texto_pix(config.get('nomeBeneficiarioPix', 'UZZERSTORE LTDA'), 25),
+        'cidade': _texto_pix(config.get('cidadeBeneficiario', 'SAO PAULO'), 15),
+    }
+
+def montar_br_code(chave, nome, cidade, valor, txid='***'):
+    """Payload PIX copia-e-cola (estático, com valor e txid)"""
+    payload = (
+        _tlv('00', '01')  # Payload Format Indicator
+        + _tlv('26', _tlv('00', PIX_GUI) + _tlv('01', chave))  # Merchant Account Information
+        + _tlv('52', '0000')  # Merchant Category Code
+        + _tlv('53', '986')  # Transaction Currency (986 = BRL)
+        + (_tlv('54', f'{valor:.2f}') if valor else '')  # Transaction Amount
+        + _tlv('58', 'BR')  # Country Code
+        + _tlv('59', nome)  # Merchant Name
+        + _tlv('60', cidade)  # Merchant City
+        + _tlv('62', _tlv('05', txid))  # Additional Data Field: txid
+        + '6304'  # CRC16 (id + tamanho entram no cálculo)
     )
-    
-    # Simular checksum (em produção, calcular CRC16 real)
-    checksum = str(abs(hash(codigo_completo)) % 10000).zfill(4)
-    
-    return codigo_completo + checksum
+    return payload + f'{crc16_ccitt(payload.encode()):04X}'
+
+# Referências fixas do encoder, conferidas por `flask verificar-pix` (roda no build):
+# o vetor padrão do CRC16-CCITT (FALSE) e o exemplo estático do Manual do BR Code
+CRC16_VERIFICACAO = (b'123456789', 0x29B1)
+BR_CODE_EXEMPLO_BACEN = (
+    ('123e4567-e12b-12d1-a456-426655440000', 'Fulano de Tal', 'BRASILIA', 0),
+    '00020126580014br.gov.bcb.pix0136123e4567-e12b-12d1-a456-426655440000'
+    '5204000053039865802BR5913Fulano de Tal6008BRASILIA62070503***63041D3D',
+)
+
+def verificar_br_code():
+    """Lista das divergências do encoder com as referências (vazia se está tudo certo)"""
+    falhas = []
+    dados, esperado = CRC16_VERIFICACAO
+    if crc16_ccitt(dados) != esperado:
+        falhas.append(f'crc16_ccitt({dados!r}) = {crc16_ccitt(dados):04X}, esperado {esperado:04X}')
+    args, esperado = BR_CODE_EXEMPLO_BACEN
+    gerado = montar_br_code(*args)
+    if gerado != esperado:
+        falhas.append(f'exemplo do Bacen: gerado {gerado}, esperado {esperado}')
+    return falhas
+
+def gerar_codigo_pix(valor, pedido_id):
+    """Gerar código PIX usando configurações salvas"""
+    dados = _dados_pix_loja()
+    return montar_br_code(dados['chave'], dados['nome'], dados['cidade'], float(valor), f'PEDIDO{pedido_id}')
+
+def renderizar_qr_pix(codigo):
+    """(svg, png) do QR Code do payload; (None, None) sem segno"""
+    if segno is None:
+        return None, None
+    qr = segno.make(codigo, error='m', micro=False)
+    png = io.BytesIO()
+    qr.save(png, kind='png', scale=PIX_QR_ESCALA_PNG, border=4)
+    return qr.svg_inline(scale=PIX_QR_ESCALA_SVG, border=4), png.getvalue()
+
+@dataclass
+class CodigoPix:
+    codigo: str
+    qr_svg: str = None
+    qr_png: bytes = None
+
+def pix_do_pedido(conn, pedido):
+    """Código e QR do pedido: leitura de pedidos_pix, gerando e gravando só na primeira vez"""
+    dados = _dados_pix_loja()
+    valor = round(float(pedido['total']), 2)
+    chave_cache = hashlib.sha1(json.dumps([PIX_FORMATO, valor, dados], sort_keys=True).encode()).hexdigest()
+    row = conn.execute('SELECT chave_cache, codigo, qr_svg, qr_png FROM pedidos_pix WHERE pedido_id = ?',
+                       (pedido['id'],)).fetchone()
+    if row and row['chave_cache'] == chave_cache:
+        return CodigoPix(row['codigo'], row['qr_svg'], row['qr_png'])
+
+    codigo = montar_br_code(dados['chave'], dados['nome'], dados['cidade'], valor, f"PEDIDO{pedido['id']}")
+    qr_svg, qr_png = renderizar_qr_pix(codigo)
+    # Dois workers gerando ao mesmo tempo gravam exatamente o mesmo conteúdo
+    conn.execute('''
+        INSERT OR REPLACE INTO pedidos_pix (pedido_id, chave_cache, codigo, qr_svg, qr_png)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (pedido['id'], chave_cache, codigo, qr_svg, qr_png))
+    conn.commit()
+    return CodigoPix(codigo, qr_svg, qr_png)
+
+# 📡 Status de pagamento em tempo real
+# A página de pagamento faz long-poll em /api/pedidos/<id>/status: a requisição fica
+# parada até o status mudar, em vez de uma consulta a cada N segundos. Em cada
+# processo, um único thread observa PRAGMA data_version (muda quando outra conexão
+# faz commit) e só então lê, numa consulta, o status dos pedidos com alguém
+# esperando; quem espera é acordado por uma Condition. O pagamento chega pelo
+# webhook do PSP (/webhooks/pix, `flask simular-pix` faz esse papel localmente).
+# Cada espera ocupa uma thread do gunicorn (--threads, ver Procfile): no máximo
+# PAGAMENTO_ESPERAS_MAX por processo; acima disso a resposta sai na hora, com o
+# status atual e Retry-After. O id do pedido é sequencial, então página, QR e status
+# pedem também o token do pedido (HMAC do id com a SECRET_KEY).
+# PIX que chega para um pedido já cancelado (reserva vencida) não se perde: o
+# estoque é reservado de novo e o pedido volta como pago; sem saldo, fica cancelado
+# e marcado para reembolso. Os dois casos vão para pagamentos_revisao, no admin.
+PAGAMENTO_ESPERA_MAX = float(os.getenv('PAGAMENTO_ESPERA_MAX', '50'))
+PAGAMENTO_ESPERAS_MAX = int(os.getenv('PAGAMENTO_ESPERAS_MAX', '4'))
+PAGAMENTO_RETRY_AFTER = 5
+PAGAMENTO_NOTIFICADOR_INTERVALO = float(os.getenv('PAGAMENTO_NOTIFICADOR_INTERVALO', '0.5'))
+PIX_WEBHOOK_TOKEN = os.getenv('PIX_WEBHOOK_TOKEN', '')
+
+def token_pedido(pedido_id):
+    return hmac.new(app.secret_key.encode(), f'pedido:{pedido_id}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+def token_pedido_valido(pedido_id, token):
+    return isinstance(token, str) and hmac.compare_digest(token, token_pedido(pedido_id))
+
+class NotificadorStatusPedidos:
+    """Acorda as requisições que esperam a mudança de status de um pedido"""
+
+    def __init__(self, intervalo=0.5, max_esperas=4):
+        self.intervalo = intervalo
+        self.max_esperas = max_esperas
+        self._vagas = threading.BoundedSemaphore(max_esperas)
+        self._cond = threading.Condition()
+        self._esperando = Counter()
+        self._status = {}
+        self._reler = False
+        self._pid = None
+
+    def _garantir_thread(self):
+        # Um thread por processo (recriado nos filhos do fork do gunicorn)
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._vagas = threading.BoundedSemaphore(self.max_esperas)
+            self._esperando.clear()
+            self._status.clear()
+        threading.Thread(target=self._observar, name='notificador-pedidos', daemon=True).start()
+
+    def esperar(self, pedido_id, status, timeout):
+        """Bloqueia até o status do pedido deixar de ser `status` (ou timeout) e devolve o atual.
+
+        None, sem esperar, quando o processo já tem max_esperas requisições paradas.
+        """
+        self._garantir_thread()
+        vagas = self._vagas
+        if not vagas.acquire(blocking=False):
+            return None
+        try:
+            return self._esperar(pedido_id, status, timeout)
+        finally:
+            vagas.release()
+
+    def _esperar(self, pedido_id, status, timeout):
+        fim = time.monotonic() + timeout
+        with self._cond:
+            self._esperando[pedido_id] += 1
+            self._status.setdefault(pedido_id, status)
+            # O status pode ter mudado entre a leitura da rota e este ponto
+            self._reler = True
+            try:
+                while self._status[pedido_id] == status:
+                    restante = fim - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+                return self._status[pedido_id]
+            finally:
+                self._esperando[pedido_id] -= 1
+                if not self._esperando[pedido_id]:
+                    del self._esperando[pedido_id]
+                    del self._status[pedido_id]
+
+    def _observar(self):
+        conn = None
+        versao = None
+        while True:
+            time.sleep(self.intervalo)
+            with self._cond:
+                pedido_ids = list(self._esperando)
+                reler, self._reler = self._reler, False
+            if not pedido_ids:
+                continue
+            try:
+                if conn is None:
+                    conn = _abrir_conexao(readonly=True)
+                atual = conn.execute('PRAGMA data_version').fetchone()[0]
+                if atual == versao and not reler:
+                    continue
+                versao = atual
+                marcadores = ','.join('?' * len(pedido_ids))
+                status = {row['id']: row['status'] for row in conn.execute(
+                    f'SELECT id, status FROM pedidos WHERE id IN ({marcadores})', pedido_ids)}
+            except sqlite3.Error as e:
+                print(f"Erro no notificador de pedidos: {e}")
+                continue
+            with self._cond:
+                mudou = False
+                for pedido_id, novo in status.items():
+                    if pedido_id in self._status and self._status[pedido_id] != novo:
+                        self._status[pedido_id] = novo
+                        mudou = True
+                if mudou:
+                    self._cond.notify_all()
+
+notificador_pedidos = NotificadorStatusPedidos(PAGAMENTO_NOTIFICADOR_INTERVALO, PAGAMENTO_ESPERAS_MAX)
+
+def resumo_status_pedido(pedido_id, status):
+    return {
+        'pedido_id': pedido_id,
+        'status': status,
+        'pago': status in STATUS_CONCLUIDOS,
+        'cancelado': status == STATUS_CANCELADO,
+    }
+
+def _reativar_pedido_pago(conn, pedido_id, pago_inteiro):
+    """Pedido cancelado que recebeu o PIX: reserva o estoque de novo e marca como pago.
+
+    Devolve a situação para pagamentos_revisao (reativado ou reembolsar).
+    """
+    if not pago_inteiro:
+        return 'reembolsar'
+    conn.execute('SAVEPOINT reativar_pedido')
+    try:
+        alterar_status_pedido(conn, pedido_id, 'Pago')
+    except EstoqueInsuficiente:
+        conn.execute('ROLLBACK TO reativar_pedido')
+        conn.execute('RELEASE reativar_pedido')
+        return 'reembolsar'
+    conn.execute('RELEASE reativar_pedido')
+    return 'reativado'
+
+def confirmar_pagamento_pix(pedido_id, valor=None, end_to_end_id=None):
+    """Marca o pedido como pago (idempotente); devolve (status final, situação da revisão).
+
+    A situação só vem para pedido já cancelado (reserva vencida) quando o PIX chega:
+    ver _reativar_pedido_pago. Repetições do aviso devolvem a mesma situação.
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        pedido = conn.execute('SELECT status, total FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+        if not pedido:
+            raise LookupError(pedido_id)
+        revisao = conn.execute('SELECT situacao FROM pagamentos_revisao WHERE pedido_id = ?',
+                               (pedido_id,)).fetchone()
+        if revisao or pedido['status'] in STATUS_CONCLUIDOS:
+            conn.rollback()
+            return pedido['status'], revisao['situacao'] if revisao else None
+        pago_inteiro = valor is None or round(float(valor), 2) >= round(float(pedido['total']), 2)
+        if pedido['status'] == STATUS_CANCELADO:
+            situacao = _reativar_pedido_pago(conn, pedido_id, pago_inteiro)
+            conn.execute('INSERT INTO pagamentos_revisao (pedido_id, valor, end_to_end_id, situacao) '
+                         'VALUES (?, ?, ?, ?)', (pedido_id, valor, end_to_end_id, situacao))
+            conn.commit()
+            print(f"⚠️ PIX do pedido {pedido_id} chegou depois do cancelamento: {situacao}")
+            return ('Pago' if situacao == 'reativado' else STATUS_CANCELADO), situacao
+        if not pago_inteiro:
+            raise ValueError('Valor pago menor que o total do pedido')
+        alterar_status_pedido(conn, pedido_id, 'Pago')
+        conn.commit()
+        return 'Pago', None
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 # ROTA MOBILE
 @app.route('/mobile')
+@politica_cache('catalogo')
 def mobile_index():
     try:
         categoria_selecionada = request.args.get('categoria')
-        
-        conn = get_db_connection()
-        
-        if categoria_selecionada:
-            produtos = conn.execute(
-                'SELECT * FROM produtos WHERE categoria = ? ORDER BY id DESC',
-                (categoria_selecionada,)
-            ).fetchall()
-        else:
-            produtos = conn.execute('SELECT * FROM produtos ORDER BY id DESC').fetchall()
-        
-        categorias = conn.execute('SELECT DISTINCT categoria FROM produtos WHERE categoria IS NOT NULL ORDER BY categoria').fetchall()
-        
-        conn.close()
-        
-        return render_template('index.html', 
-                             produtos=produtos, 
+
+        produtos, proximo_cursor = catalogo_pagina(categoria_selecionada)
+        categorias = catalogo_categorias()
+
+        return render_template('index.html',
+                             produtos=produtos,
+                             proximo_cursor=proximo_cursor,
                              categorias=categorias,
                              categoria_selecionada=categoria_selecionada,
                              mobile_view=True)
@@ -1315,10 +4478,31 @@ def mobile_index():
         """
 
 # PWA Routes
+# Além dos bundles, o app shell pré-carregado pelo service worker
+PWA_PRECACHE_ESTATICOS = ['js/img-fallback.js']
+
+def manifesto_assets():
+    """Manifesto versionado do app shell (URLs com hash) para o service worker"""
+    precache = []
+    for bundle in ASSET_BUNDLES:
+        precache += asset_urls(bundle)
+    precache += [asset_url(f) for f in PWA_PRECACHE_ESTATICOS]
+    # templates também entram na versão: páginas guardadas pelo SW ficam obsoletas
+    versao = hashlib.sha1(json.dumps([VERSAO_APLICACAO, precache]).encode()).hexdigest()[:12]
+    return {'versao': versao, 'precache': precache}
+
+@app.route('/asset-manifest.json')
+def asset_manifest():
+    return jsonify(manifesto_assets())
+
 @app.route('/sw.js')
 def service_worker():
-    response = app.send_static_file('sw.js')
-    response.headers['Content-Type'] = 'application/javascript'
+    # O manifesto vai embutido no script: um deploy novo muda os bytes do sw.js,
+    # o que faz o navegador instalar a nova versão e descartar os caches antigos
+    with open(os.path.join(STATIC_DIR, 'sw.js'), 'r', encoding='utf-8') as f:
+        codigo = f.read()
+    corpo = f"self.MANIFESTO_ASSETS = {json.dumps(manifesto_assets())};\n{codigo}"
+    response = app.response_class(corpo, mimetype='application/javascript')
     response.headers['Service-Worker-Allowed'] = '/'
     return response
 
@@ -1329,6 +4513,7 @@ def manifest():
     return response
 
 @app.route('/cadastro', methods=['GET', 'POST'])
+@politica_cache('sensivel')
 def cadastro():
     if request.method == 'POST':
         nome = request.form['nome']
@@ -1372,6 +4557,7 @@ def cadastro():
     return render_template('cadastro.html')
 
 @app.route('/login', methods=['GET', 'POST'])
+@politica_cache('sensivel')
 def login():
     if request.method == 'POST':
         email = request.form['email']
@@ -1379,21 +4565,14 @@ def login():
         try:
             conn = get_db_connection()
             user = conn.execute('SELECT * FROM usuarios WHERE email = ?', (email,)).fetchone()
-
-            # checa colunas
-            cols = [r['name'] for r in conn.execute("PRAGMA table_info(usuarios)").fetchall()]
             conn.close()
 
             if user and check_password_hash(user['senha'], senha):
                 session['user_id'] = user['id']
                 session['user_nome'] = user['nome']
 
-                db_admin = False
-                if 'is_admin' in cols:
-                    try:
-                        db_admin = bool(user['is_admin'])
-                    except Exception:
-                        db_admin = False
+                # is_admin é garantida pelas migrações
+                db_admin = bool(user['is_admin'])
 
                 # Fallbacks
                 is_first_user = user['id'] == 1
@@ -1441,13 +4620,82 @@ def admin_dashboard():
             'carrinho_ativos': 0,  # Removido contador de pedidos
             'vendas_total': 0,     # Removido vendas
         }
+        # PIX recebidos depois do cancelamento do pedido, ainda sem conferência
+        pagamentos_revisao = conn.execute('''
+            SELECT r.pedido_id, r.valor, r.end_to_end_id, r.situacao, r.recebido_em, p.nome_cliente, p.total
+            FROM pagamentos_revisao r LEFT JOIN pedidos p ON p.id = r.pedido_id
+            WHERE r.resolvido_em IS NULL ORDER BY r.recebido_em
+        ''').fetchall()
         
         conn.close()
         
-        return render_template('admin_dashboard.html', stats=stats)
+        return render_template('admin_dashboard.html', stats=stats, pagamentos_revisao=pagamentos_revisao)
     except Exception as e:
         return f"Erro no admin: {e}"
 
+ADMIN_PEDIDOS_LISTA = 200
+STATUS_PEDIDO_OPCOES = (STATUS_PEDIDO_PADRAO, *STATUS_CONCLUIDOS, STATUS_CANCELADO)
+
+@app.route('/admin/pedidos')
+def admin_pedidos():
+    if not is_admin():
+        flash('Acesso negado!', 'error')
+        return redirect(url_for('login'))
+    conn = get_db_connection(readonly=True)
+    pedidos = conn.execute(f'''
+        SELECT p.id, p.nome_cliente, p.metodo_pagamento, p.total, p.created_at, {STATUS_PEDIDO_SQL} AS status
+        FROM pedidos p ORDER BY p.id DESC LIMIT ?
+    ''', (ADMIN_PEDIDOS_LISTA,)).fetchall()
+    conn.close()
+    return render_template('admin_pedidos.html', pedidos=pedidos, status_opcoes=STATUS_PEDIDO_OPCOES)
+
+@app.route('/admin/pedidos/<int:pedido_id>/status', methods=['POST'])
+def admin_status_pedido(pedido_id):
+    """Troca o status (confirma cartão/boleto, cancela...) mantendo reservas e rollups"""
+    if not is_admin():
+        flash('Acesso negado!', 'error')
+        return redirect(url_for('login'))
+    status = request.form.get('status', '')
+    if status not in STATUS_PEDIDO_OPCOES:
+        flash('Status inválido!', 'error')
+        return redirect(url_for('admin_pedidos'))
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        if not conn.execute('SELECT 1 FROM pedidos WHERE id = ?', (pedido_id,)).fetchone():
+            conn.rollback()
+            flash('Pedido não encontrado!', 'error')
+            return redirect(url_for('admin_pedidos'))
+        alterar_status_pedido(conn, pedido_id, status)
+        conn.commit()
+    except EstoqueInsuficiente as e:
+        conn.rollback()
+        flash(f'Não dá para reabrir o pedido #{pedido_id}: {e}', 'error')
+        return redirect(url_for('admin_pedidos'))
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    flash(f'Pedido #{pedido_id}: {status}.', 'success')
+    return redirect(url_for('admin_pedidos'))
+
+@app.route('/admin/pagamentos-revisao/<int:pedido_id>/resolver', methods=['POST'])
+def admin_resolver_pagamento(pedido_id):
+    """Tira da lista do painel um PIX pago após o cancelamento (reembolsado ou conferido)"""
+    if not is_admin():
+        flash('Acesso negado!', 'error')
+        return redirect(url_for('login'))
+    conn = get_db_connection()
+    try:
+        conn.execute('UPDATE pagamentos_revisao SET resolvido_em = CURRENT_TIMESTAMP '
+                     'WHERE pedido_id = ? AND resolvido_em IS NULL', (pedido_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    flash(f'Pagamento do pedido #{pedido_id} marcado como resolvido.', 'success')
+    return redirect(url_for('admin_dashboard'))
+
 @app.route('/admin/configuracoes')
 def admin_configuracoes():
     """Página de configurações do admin"""
@@ -1483,47 +4731,97 @@ def salvar_configuracoes():
     
     try:
         data = request.get_json()
-        
-        # Salvar configurações em arquivo JSON
-        config_file = os.path.join(BASE_DIR, 'data', 'config.json')
-        
-        # Criar diretório se não existir
-        os.makedirs(os.path.dirname(config_file), exist_ok=True)
-        
-        # Carregar configurações existentes ou criar novo
-        if os.path.exists(config_file):
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        else:
-            config = {}
-        
-        # Atualizar com novas configurações
-        config.update(data)
-        config['ultima_atualizacao'] = datetime.now().isoformat()
-        
-        # Salvar arquivo
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        
+        if not isinstance(data, dict):
+            return {'success': False, 'message': 'Dados inválidos'}, 400
+
+        configuracoes_loja.salvar(data)
+
         print(f"Configurações salvas: {data}")
-        
+
         return {'success': True, 'message': 'Configurações salvas com sucesso!'}
         
     except Exception as e:
         print(f"Erro ao salvar configurações: {e}")
         return {'success': False, 'message': f'Erro interno do servidor: {str(e)}'}, 500
 
+# ⚙️ Configurações da loja
+CONFIG_PATH = os.path.join(BASE_DIR, 'data', 'config.json')
+CONFIG_VERSAO_INTERVALO = float(os.getenv('CONFIG_VERSAO_INTERVALO', '2'))
+
+class ConfiguracoesLoja:
+    """Snapshot em memória de data/config.json.
+
+    O arquivo só é relido quando o contador 'configuracoes' da tabela versoes
+    muda (verificado no máximo a cada `intervalo_versao` segundos). A gravação
+    faz leitura-modificação-escrita sob trava de arquivo e troca o JSON de forma
+    atômica (arquivo temporário + os.replace), então workers concorrentes não
+    perdem alterações nem leem um arquivo pela metade.
+    """
+
+    def __init__(self, caminho, intervalo_versao=2):
+        self.caminho = caminho
+        self.intervalo_versao = intervalo_versao
+        self._dados = {}
+        self._versao = None
+        self._versao_lida_em = 0.0
+        self._lock = threading.Lock()
+
+    def _ler_arquivo(self):
+        try:
+            if os.path.exists(self.caminho):
+                with open(self.caminho, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            return {}
+        except Exception as e:
+            print(f"Erro ao carregar configurações: {e}")
+            return {}
+
+    def versao(self):
+        return self._versao
+
+    def obter(self):
+        """Cópia rasa das configurações atuais"""
+        agora = time.monotonic()
+        if self._versao is None or agora - self._versao_lida_em >= self.intervalo_versao:
+            versao = ler_versao('configuracoes')
+            with self._lock:
+                if versao != self._versao:
+                    self._dados = self._ler_arquivo()
+                    self._versao = versao
+                self._versao_lida_em = agora
+        return dict(self._dados)
+
+    def salvar(self, alteracoes):
+        """Mescla `alteracoes` no arquivo, grava atomicamente e publica nova versão"""
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        with TravaArquivo(self.caminho + '.lock'):
+            config = self._ler_arquivo()
+            config.update(alteracoes)
+            config['ultima_atualizacao'] = datetime.now().isoformat()
+
+            temporario = f"{self.caminho}.{os.getpid()}.tmp"
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporario, self.caminho)
+
+            conn = get_db_connection()
+            try:
+                incrementar_versao('configuracoes', conn)
+                conn.commit()
+            finally:
+                conn.close()
+
+        with self._lock:
+            self._versao = None
+        return config
+
+configuracoes_loja = ConfiguracoesLoja(CONFIG_PATH, CONFIG_VERSAO_INTERVALO)
+
 def carregar_configuracoes():
-    """Carregar configurações salvas"""
-    try:
-        config_file = os.path.join(BASE_DIR, 'data', 'config.json')
-        if os.path.exists(config_file):
-            with open(config_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
-    except Exception as e:
-        print(f"Erro ao carregar configurações: {e}")
-        return {}
+    """Carregar configurações salvas (snapshot em memória, sem I/O de disco)"""
+    return configuracoes_loja.obter()
 
 @app.route('/admin/produtos')
 def admin_produtos():
@@ -1531,7 +4829,6 @@ def admin_produtos():
         flash('Acesso negado!', 'error')
         return redirect(url_for('login'))
     conn = get_db_connection()
-    ensure_visivel_column(conn)
     produtos = conn.execute('SELECT * FROM produtos ORDER BY id DESC').fetchall()
     conn.close()
     return render_template('admin_produtos.html', produtos=produtos)
@@ -1544,13 +4841,15 @@ def admin_ocultar_produto(produto_id):
         return redirect(url_for('login'))
     try:
         conn = get_db_connection()
-        produto = conn.execute('SELECT visivel, nome FROM produtos WHERE id = ?', (produto_id,)).fetchone()
+        produto = conn.execute('SELECT visivel, nome, categoria FROM produtos WHERE id = ?', (produto_id,)).fetchone()
         if not produto:
             flash('Produto não encontrado!', 'error')
             conn.close()
             return redirect(url_for('admin_produtos'))
         novo_visivel = 0 if produto['visivel'] else 1
         conn.execute('UPDATE produtos SET visivel = ? WHERE id = ?', (novo_visivel, produto_id))
+        marcar_relacionados_do_produto(conn, produto_id, [produto['categoria']])
+        invalidar_catalogo(conn)
         conn.commit()
         conn.close()
         status = 'ocultado' if novo_visivel == 0 else 'exibido'
@@ -1576,16 +4875,10 @@ def admin_novo_produto():
         # Imagem principal: pode ser upload via form file 'imagem_file' ou URL no campo 'imagem'
         imagem = None
         imagem_file = request.files.get('imagem_file')
+        enviadas = []
         if imagem_file and imagem_file.filename:
-            filename = secure_filename(imagem_file.filename)
-            base, ext = os.path.splitext(filename)
-            timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
-            filename = f"{base}-{timestamp}{ext}"
-            upload_dir = os.path.join(BASE_DIR, 'static', 'produtos')
-            os.makedirs(upload_dir, exist_ok=True)
-            upload_path = os.path.join(upload_dir, filename)
-            imagem_file.save(upload_path)
-            imagem = f'produtos/{filename}'
+            imagem = salvar_upload_imagem(imagem_file)
+            enviadas.append(imagem)
         else:
             imagem = request.form.get('imagem', '').strip()  # fallback para URL
         estoque = int(request.form.get('estoque', 0))
@@ -1600,15 +4893,8 @@ def admin_novo_produto():
             # Checar upload primeiro
             file_field = request.files.get(f'imagem_adicional_file_{i}')
             if file_field and file_field.filename:
-                filename = secure_filename(file_field.filename)
-                base, ext = os.path.splitext(filename)
-                timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
-                filename = f"{base}-{timestamp}{ext}"
-                upload_dir = os.path.join(BASE_DIR, 'static', 'produtos')
-                os.makedirs(upload_dir, exist_ok=True)
-                upload_path = os.path.join(upload_dir, filename)
-                file_field.save(upload_path)
-                imagens_adicionais.append(f'produtos/{filename}')
+                imagens_adicionais.append(salvar_upload_imagem(file_field))
+                enviadas.append(imagens_adicionais[-1])
                 continue
             # fallback para campo URL
             imagem_adicional = request.form.get(f'imagem_adicional_{i}')
@@ -1619,19 +4905,22 @@ def admin_novo_produto():
         
         try:
             conn = get_db_connection()
-            # Garantir que as colunas existem
-            ensure_tamanhos_column(conn)
-            ensure_estoque_column(conn)
-            ensure_imagens_adicionais_column(conn)
-            
-            conn.execute('''
+            cur = conn.execute('''
                 INSERT INTO produtos (nome, preco, categoria, descricao, imagem, imagens_adicionais, tamanhos, estoque)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (nome, preco, categoria, descricao, imagem, imagens_adicionais_str, tamanhos_str, estoque))
+            atualizar_referencias(conn, novas=imagens_do_produto(
+                {'imagem': imagem, 'imagens_adicionais': imagens_adicionais_str}))
+            marcar_relacionados_do_produto(conn, cur.lastrowid, [categoria])
+            invalidar_catalogo(conn)
             conn.commit()
             conn.close()
-            
+
+            # Versões das imagens em segundo plano: a resposta não espera por elas
+            tarefa_id = tarefas_imagens.enviar(cur.lastrowid, enviadas)
             flash(f'Produto "{nome}" adicionado com sucesso!', 'success')
+            if tarefa_id:
+                flash(f'Imagens em processamento (tarefa {tarefa_id})', 'info')
             return redirect(url_for('admin_produtos'))
         except Exception as e:
             flash(f'Erro ao adicionar produto: {e}', 'error')
@@ -1659,19 +4948,18 @@ def admin_editar_produto(produto_id):
         # Imagem principal: aceitar upload via 'imagem_file' ou fallback para campo URL 'imagem'
         imagem = None
         imagem_file = request.files.get('imagem_file')
+        enviadas = []
         if imagem_file and imagem_file.filename:
-            filename = secure_filename(imagem_file.filename)
-            base, ext = os.path.splitext(filename)
-            timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
-            filename = f"{base}-{timestamp}{ext}"
-            upload_dir = os.path.join(BASE_DIR, 'static', 'produtos')
-            os.makedirs(upload_dir, exist_ok=True)
-            upload_path = os.path.join(upload_dir, filename)
-            imagem_file.save(upload_path)
-            imagem = f'produtos/{filename}'
+            imagem = salvar_upload_imagem(imagem_file)
+            enviadas.append(imagem)
         else:
             imagem = request.form.get('imagem', '').strip()
+        # O estoque muda com as vendas enquanto o formulário está aberto: aplica só a
+        # diferença que o admin digitou sobre o valor que ele viu (estoque_original)
         estoque = int(request.form.get('estoque', 0))
+        estoque_original = request.form.get('estoque_original', type=int)
+        if estoque_original is None:
+            estoque_original = produto['estoque'] or 0
         
         # Processar tamanhos selecionados
         tamanhos_selecionados = request.form.getlist('tamanhos[]')
@@ -1682,15 +4970,8 @@ def admin_editar_produto(produto_id):
         for i in range(1, 10):  # Imagens adicionais de 1 a 9 (total 10 com a principal)
             file_field = request.files.get(f'imagem_adicional_file_{i}')
             if file_field and file_field.filename:
-                filename = secure_filename(file_field.filename)
-                base, ext = os.path.splitext(filename)
-                timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
-                filename = f"{base}-{timestamp}{ext}"
-                upload_dir = os.path.join(BASE_DIR, 'static', 'produtos')
-                os.makedirs(upload_dir, exist_ok=True)
-                upload_path = os.path.join(upload_dir, filename)
-                file_field.save(upload_path)
-                imagens_adicionais.append(f'produtos/{filename}')
+                imagens_adicionais.append(salvar_upload_imagem(file_field))
+                enviadas.append(imagens_adicionais[-1])
                 continue
             imagem_adicional = request.form.get(f'imagem_adicional_{i}')
             if imagem_adicional and imagem_adicional.strip():
@@ -1699,20 +4980,26 @@ def admin_editar_produto(produto_id):
         imagens_adicionais_str = ','.join(imagens_adicionais) if imagens_adicionais else ''
         
         try:
-            # Garantir que as colunas existem
-            ensure_tamanhos_column(conn)
-            ensure_estoque_column(conn)
-            ensure_imagens_adicionais_column(conn)
-            
             conn.execute('''
                 UPDATE produtos 
-                SET nome = ?, preco = ?, categoria = ?, descricao = ?, imagem = ?, imagens_adicionais = ?, tamanhos = ?, estoque = ?
+                SET nome = ?, preco = ?, categoria = ?, descricao = ?, imagem = ?, imagens_adicionais = ?, tamanhos = ?,
+                    estoque = MAX(0, COALESCE(estoque, 0) + ?)
                 WHERE id = ?
-            ''', (nome, preco, categoria, descricao, imagem, imagens_adicionais_str, tamanhos_str, estoque, produto_id))
+            ''', (nome, preco, categoria, descricao, imagem, imagens_adicionais_str, tamanhos_str,
+                  estoque - estoque_original, produto_id))
+            atualizar_referencias(conn, antigas=imagens_do_produto(produto), novas=imagens_do_produto(
+                {'imagem': imagem, 'imagens_adicionais': imagens_adicionais_str}))
+            orfas = coletar_imagens_orfas(conn)
+            marcar_relacionados_do_produto(conn, produto_id, [produto['categoria'], categoria])
+            invalidar_catalogo(conn)
             conn.commit()
             conn.close()
-            
+            remover_imagens_orfas(orfas)
+
+            tarefa_id = tarefas_imagens.enviar(produto_id, enviadas)
             flash(f'Produto "{nome}" atualizado com sucesso!', 'success')
+            if tarefa_id:
+                flash(f'Imagens em processamento (tarefa {tarefa_id})', 'info')
             return redirect(url_for('admin_produtos'))
         except Exception as e:
             flash(f'Erro ao atualizar produto: {e}', 'error')
@@ -1728,11 +5015,17 @@ def admin_deletar_produto(produto_id):
     
     try:
         conn = get_db_connection()
-        produto = conn.execute('SELECT nome FROM produtos WHERE id = ?', (produto_id,)).fetchone()
+        produto = conn.execute('SELECT nome, categoria, imagem, imagens_adicionais FROM produtos WHERE id = ?',
+                               (produto_id,)).fetchone()
         
         if produto:
             conn.execute('DELETE FROM produtos WHERE id = ?', (produto_id,))
+            atualizar_referencias(conn, antigas=imagens_do_produto(produto))
+            orfas = coletar_imagens_orfas(conn)
+            marcar_relacionados_do_produto(conn, produto_id, [produto['categoria']])
+            invalidar_catalogo(conn)
             conn.commit()
+            remover_imagens_orfas(orfas)
             flash(f'Produto "{produto["nome"]}" removido com sucesso!', 'success')
         else:
             flash('Produto não encontrado!', 'error')
@@ -1759,10 +5052,18 @@ def admin_remover_todos_produtos():
             conn.close()
             return jsonify({'success': False, 'message': 'Não há produtos para remover!'}), 400
         
-        # Remover todos os produtos
+        # Remover todos os produtos (e as imagens que ficarem sem uso)
+        antigas = []
+        for produto in conn.execute('SELECT imagem, imagens_adicionais FROM produtos').fetchall():
+            antigas += imagens_do_produto(produto)
         conn.execute('DELETE FROM produtos')
+        atualizar_referencias(conn, antigas=antigas)
+        orfas = coletar_imagens_orfas(conn)
+        marcar_relacionados(conn)
+        invalidar_catalogo(conn)
         conn.commit()
         conn.close()
+        remover_imagens_orfas(orfas)
         
         return jsonify({
             'success': True, 
@@ -1790,14 +5091,15 @@ def admin_relatorios():
         # Total de usuários
         stats['total_usuarios'] = conn.execute('SELECT COUNT(*) as count FROM usuarios').fetchone()['count']
         
-        # Vendas totais (simular - você pode implementar uma tabela de vendas)
-        stats['vendas_total'] = '15.750,80'
-        
-        # Total de pedidos (simular)
-        stats['total_pedidos'] = 127
+        # Vendas e pedidos (rollup diário)
+        vendas = conn.execute(
+            'SELECT COALESCE(SUM(pedidos), 0) AS pedidos, COALESCE(SUM(receita), 0) AS total FROM vendas_dia').fetchone()
+        stats['vendas_total'] = f"{vendas['total']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+        stats['total_pedidos'] = vendas['pedidos']
         
         conn.close()
-        return render_template('admin_relatorios.html', stats=stats)
+        categorias = [c['categoria'] for c in catalogo_categorias()]
+        return render_template('admin_relatorios.html', stats=stats, categorias=categorias)
     
     except Exception as e:
         flash(f'Erro ao carregar relatórios: {e}', 'error')
@@ -1809,54 +5111,45 @@ def admin_relatorios_dados():
         return jsonify({'success': False, 'message': 'Acesso negado'})
     
     try:
-        filtros = request.get_json()
-        
-        # Aqui você implementaria a lógica real de filtragem
-        # Por enquanto, retornando dados simulados
-        dados = {
-            'vendas': {
-                'total': 15750.80,
-                'periodo': [
-                    {'data': '2025-10-01', 'valor': 1200.50},
-                    {'data': '2025-10-02', 'valor': 890.00},
-                    {'data': '2025-10-03', 'valor': 1450.30},
-                    {'data': '2025-10-04', 'valor': 1120.75},
-                    {'data': '2025-10-05', 'valor': 2100.20},
-                ]
-            },
-            'pedidos': {
-                'total': 127,
-                'concluidos': 95,
-                'pendentes': 22,
-                'cancelados': 10
-            },
-            'produtos': [
-                {'nome': 'Vestido Floral Primavera', 'vendas': 25, 'valor': 4747.50},
-                {'nome': 'Calça Jeans Skinny', 'vendas': 18, 'valor': 2338.20},
-                {'nome': 'Blusa Básica Algodão', 'vendas': 32, 'valor': 1596.80},
-                {'nome': 'Tênis Casual Branco', 'vendas': 15, 'valor': 1847.25},
-                {'nome': 'Saia Midi Estampada', 'vendas': 12, 'valor': 1176.00}
-            ],
-            'categorias': {
-                'Feminino': 45,
-                'Masculino': 30, 
-                'Infantil': 15,
-                'Acessórios': 10
-            }
-        }
+        filtros = request.get_json(silent=True) or {}
+        conn = get_db_connection(readonly=True)
+        try:
+            dados = relatorio_vendas(conn, filtros)
+        finally:
+            conn.close()
         
         return jsonify({'success': True, 'dados': dados})
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/admin/tarefas/<tarefa_id>')
+def admin_tarefa(tarefa_id):
+    """Andamento do processamento das imagens de um upload"""
+    if not is_admin():
+        return jsonify({'success': False, 'message': 'Acesso negado!'}), 403
+    tarefa = tarefas_imagens.status(tarefa_id)
+    if not tarefa:
+        return jsonify({'success': False, 'message': 'Tarefa não encontrada'}), 404
+    return jsonify({'success': True, 'tarefa': tarefa})
+
+@app.route('/admin/cache/estatisticas')
+def admin_cache_estatisticas():
+    """Contadores dos caches do catálogo, busca, facetas e fragmentos (hits/misses) do worker atual"""
+    if not is_admin():
+        return jsonify({'success': False, 'message': 'Acesso negado'}), 403
+    return jsonify({'success': True, 'catalogo': cache_catalogo.estatisticas(),
+                    'busca': cache_busca.estatisticas(),
+                    'facetas': cache_facetas.estatisticas(),
+                    'fragmentos': cache_fragmentos.estatisticas()})
+
 @app.route('/debug/produtos')
 def debug_produtos():
     if not is_admin():
         return "Acesso negado"
     
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(readonly=True)
         produtos = conn.execute('SELECT * FROM produtos ORDER BY id DESC').fetchall()
         conn.close()
         
@@ -1894,6 +5187,118 @@ def db_info():
     finally:
         conn.close()
 
+# 🔎 Auditoria de planos de consulta
+COMANDOS_AUDITAVEIS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+def _sql_literal(no):
+    """SQL do 1º argumento da chamada; f-strings só quando interpolam constantes do módulo"""
+    if not no.args:
+        return None
+    arg = no.args[0]
+    if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+        return arg.value
+    if not isinstance(arg, ast.JoinedStr):
+        return None
+    partes = []
+    for parte in arg.values:
+        if isinstance(parte, ast.Constant):
+            partes.append(parte.value)
+        elif (isinstance(parte.value, ast.Name) and parte.value.id.isupper()
+              and isinstance(globals().get(parte.value.id), (str, int))):
+            partes.append(str(globals()[parte.value.id]))
+        else:
+            return None
+    return ''.join(partes)
+
+def consultas_do_codigo(caminho=None):
+    """(linha, sql) de cada execute/executemany/_consultar_catalogo de app.py (sql None = dinâmico)"""
+    with open(caminho or os.path.abspath(__file__), encoding='utf-8') as f:
+        arvore = ast.parse(f.read())
+    consultas = []
+    for no in ast.walk(arvore):
+        if not isinstance(no, ast.Call):
+            continue
+        func = no.func
+        if ((isinstance(func, ast.Attribute) and func.attr in ('execute', 'executemany'))
+                or (isinstance(func, ast.Name) and func.id == '_consultar_catalogo')):
+            consultas.append((no.lineno, _sql_literal(no)))
+    return sorted(consultas, key=lambda c: c[0])
+
+def auditar_plano(conn, sql):
+    """(plano, alertas) do EXPLAIN QUERY PLAN de uma consulta, com parâmetros NULL"""
+    plano = [r['detail'] for r in conn.execute(f'EXPLAIN QUERY PLAN {sql}', [None] * sql.count('?'))]
+    alertas = []
+    for detalhe in plano:
+        if detalhe.startswith('SCAN ') and 'INDEX' not in detalhe and 'CONSTANT ROW' not in detalhe:
+            alertas.append(f'varredura completa: {detalhe}')
+        elif 'TEMP B-TREE' in detalhe:
+            alertas.append(f'B-tree temporária: {detalhe}')
+    return plano, alertas
+
+def tamanhos_do_banco(conn):
+    """[(nome, tipo, tabela, linhas, bytes)] de tabelas e índices (bytes via dbstat, se disponível)"""
+    objetos = conn.execute(
+        "SELECT name, type, tbl_name FROM sqlite_master WHERE type IN ('table', 'index') ORDER BY tbl_name, type DESC, name"
+    ).fetchall()
+    try:
+        bytes_por_objeto = {r['name']: r['bytes'] for r in conn.execute(
+            'SELECT name, SUM(pgsize) AS bytes FROM dbstat GROUP BY name')}
+    except sqlite3.OperationalError:
+        bytes_por_objeto = {}
+    tamanhos = []
+    for obj in objetos:
+        linhas = None
+        if obj['type'] == 'table' and not obj['name'].startswith('sqlite_'):
+            linhas = conn.execute(f'SELECT COUNT(*) FROM "{obj["name"]}"').fetchone()[0]
+        tamanhos.append((obj['name'], obj['type'], obj['tbl_name'], linhas, bytes_por_objeto.get(obj['name'])))
+    return tamanhos
+
+@app.cli.command("db-explain")
+@click.option('--todas', is_flag=True, help='Mostra o plano de todas as consultas, não só as com alerta')
+def db_explain(todas):
+    """Roda EXPLAIN QUERY PLAN nas consultas de app.py e mostra tamanhos de tabelas/índices."""
+    aplicar_migracoes()
+    conn = get_db_connection()
+    try:
+        analisadas, dinamicas, com_alerta = 0, [], 0
+        for linha, sql in consultas_do_codigo():
+            if sql is None:
+                dinamicas.append(linha)
+                continue
+            if (_normalizar_sql(sql).split(' ', 1)[0].upper() not in COMANDOS_AUDITAVEIS
+                    or 'sqlite_master' in sql):
+                continue
+            analisadas += 1
+            try:
+                plano, alertas = auditar_plano(conn, sql)
+            except sqlite3.Error as e:
+                print(f"app.py:{linha}  ERRO {e}: {_normalizar_sql(sql)[:100]}")
+                continue
+            if alertas:
+                com_alerta += 1
+            if alertas or todas:
+                print(f"app.py:{linha}  {_normalizar_sql(sql)[:100]}")
+                for detalhe in plano:
+                    print(f"    {detalhe}")
+                for alerta in alertas:
+                    print(f"    ⚠️  {alerta}")
+        print(f"\n{analisadas} consultas analisadas, {com_alerta} com alerta")
+        if dinamicas:
+            print(f"SQL montado em tempo de execução (não analisado): linhas {', '.join(map(str, dinamicas))}")
+
+        faltando = [nome for nome in INDICES
+                    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (nome,)).fetchone()]
+        if faltando:
+            print(f"Índices gerenciados ausentes: {', '.join(faltando)}")
+
+        print("\nTamanhos:")
+        for nome, tipo, tabela, linhas, tamanho in tamanhos_do_banco(conn):
+            kb = f"{tamanho / 1024:.1f} KB" if tamanho is not None else '?'
+            detalhe = f"{linhas} linhas" if linhas is not None else f"em {tabela}"
+            print(f"  {tipo:5} {nome:40} {kb:>10}  {detalhe}")
+    finally:
+        conn.close()
+
 @app.cli.command("create-admin")
 @click.option('--nome', prompt=True)
 @click.option('--email', prompt=True)
@@ -1902,7 +5307,7 @@ def create_admin(nome, email, senha):
     """Cria (ou promove) um usuário para administrador."""
     conn = get_db_connection()
     try:
-        ensure_is_admin_column(conn)
+        aplicar_migracoes()
         pass_col = ensure_password_column(conn)
         senha_val = generate_password_hash(senha) if pass_col == 'senha_hash' else senha
 
@@ -1923,6 +5328,223 @@ def create_admin(nome, email, senha):
     finally:
         conn.close()
 
+@app.cli.command("build-assets")
+def build_assets():
+    """Gera os bundles de CSS/JS minificados e com hash em static/dist."""
+    manifest = gerar_bundles()
+    print(f"OK: {len(manifest)} bundles gerados em", ASSETS_DIST_DIR)
+
+@app.cli.command("gerar-imagens")
+@click.option('--todas', is_flag=True, help='Regera também as imagens que já têm versões')
+def gerar_imagens(todas):
+    """Gera as versões WebP redimensionadas das imagens de produto já cadastradas."""
+    if Image is None:
+        print("Erro: instale o Pillow (pip install Pillow) para gerar as imagens")
+        return
+    aplicar_migracoes()
+    conn = get_db_connection()
+    try:
+        imagens = set()
+        for row in conn.execute('SELECT imagem, imagens_adicionais FROM produtos').fetchall():
+            imagens.update(imagens_do_produto(row))
+        prontas = {r['imagem'] for r in conn.execute('SELECT DISTINCT imagem FROM imagens_derivadas')}
+        geradas = 0
+        for imagem in sorted(i for i in imagens if imagem_local(i)):
+            if not todas and imagem in prontas:
+                continue
+            if not os.path.exists(os.path.join(STATIC_DIR, imagem)):
+                print(f"Aviso: arquivo não encontrado: {imagem}")
+                continue
+            if processar_imagem(conn, imagem, regerar=True):
+                geradas += 1
+        invalidar_catalogo(conn)
+        conn.commit()
+        print(f"OK: versões geradas para {geradas} imagens")
+    finally:
+        conn.close()
+
+@app.cli.command("reconstruir-relatorios")
+def reconstruir_relatorios():
+    """Recalcula os rollups de vendas a partir dos pedidos."""
+    aplicar_migracoes()
+    conn = get_db_connection()
+    try:
+        reconstruir_rollups_vendas(conn)
+        conn.commit()
+        dias = conn.execute('SELECT COUNT(DISTINCT dia) FROM vendas_dia').fetchone()[0]
+        print(f"OK: rollups de vendas recalculados ({dias} dias)")
+    finally:
+        conn.close()
+
+@app.cli.command("recalcular-relacionados")
+@click.option('--todos', is_flag=True, help='Recalcula todos os produtos, não só os pendentes')
+def recalcular_relacionados_cli(todos):
+    """Recalcula os produtos relacionados pendentes (para cron, sem depender do thread dos workers)."""
+    aplicar_migracoes()
+    if todos:
+        conn = get_db_connection()
+        try:
+            marcar_relacionados(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    while processar_relacionados_pendentes():
+        pass
+    print("OK: relacionados pendentes recalculados")
+
+@app.cli.command("limpar-sessoes")
+def limpar_sessoes():
+    """Apaga as sessões vencidas guardadas no servidor."""
+    if not _interface_sessao:
+        print("Sessões em cookie (SESSAO_BACKEND=cookie): nada a limpar")
+        return
+    aplicar_migracoes()
+    print(f"OK: {_interface_sessao.armazem.limpar_expiradas()} sessões vencidas apagadas")
+
+@app.cli.command("liberar-reservas")
+def liberar_reservas():
+    """Devolve ao estoque as reservas vencidas e cancela os pedidos delas."""
+    aplicar_migracoes()
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        pedidos = liberar_reservas_expiradas(conn)
+        conn.commit()
+        print(f"OK: {len(pedidos)} pedidos com reserva vencida cancelados")
+    finally:
+        conn.close()
+
+@app.cli.command("notificacoes-worker")
+@click.option('--uma-vez', is_flag=True, help='Entrega o que estiver vencido e sai')
+@click.option('--intervalo', default=2.0, show_default=True, help='Espera (s) quando a fila está vazia')
+def notificacoes_worker(uma_vez, intervalo):
+    """Entrega as notificações de pedidos num processo à parte (só onde ele enxerga o SQLite do site)."""
+    aplicar_migracoes()
+    transportes = {canal: criar_transporte(canal) for canal in NOTIFICACOES_TRANSPORTES}
+    print(f"📣 Worker de notificações: {NOTIFICACOES_TRANSPORTES}")
+    try:
+        while True:
+            enviadas, falhas = processar_notificacoes(transportes)
+            if enviadas or falhas:
+                print(f"📣 {enviadas} notificações enviadas, {falhas} com erro")
+                continue
+            if uma_vez:
+                break
+            time.sleep(intervalo)
+    except KeyboardInterrupt:
+        print("📣 Worker de notificações encerrado")
+
+@app.cli.command("verificar-pix")
+def verificar_pix():
+    """Confere o CRC16 e o BR Code contra as referências; sai com erro se divergir."""
+    falhas = verificar_br_code()
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    if falhas:
+        raise SystemExit(1)
+    print("OK: CRC16-CCITT e exemplo do Manual do BR Code conferem")
+
+@app.cli.command("simular-pix")
+@click.argument('pedido_id', type=int)
+@click.option('--url', default='http://127.0.0.1:5000/webhooks/pix', show_default=True)
+def simular_pix(pedido_id, url):
+    """Faz o papel do PSP: envia ao webhook o aviso de pagamento PIX do pedido."""
+    if not PIX_WEBHOOK_TOKEN:
+        print("Defina PIX_WEBHOOK_TOKEN (o mesmo do servidor)")
+        return
+    conn = get_db_connection(readonly=True)
+    pedido = conn.execute('SELECT total FROM pedidos WHERE id = ?', (pedido_id,)).fetchone()
+    conn.close()
+    if not pedido:
+        print(f"Pedido {pedido_id} não encontrado")
+        return
+    corpo = {'pix': [{'txid': f'PEDIDO{pedido_id}', 'valor': f"{pedido['total']:.2f}",
+                      'endToEndId': 'E' + secrets.token_hex(15), 'horario': datetime.utcnow().isoformat()}]}
+    requisicao = urllib.request.Request(url, data=json.dumps(corpo).encode(), method='POST', headers={
+        'Content-Type': 'application/json', 'X-Webhook-Token': PIX_WEBHOOK_TOKEN})
+    try:
+        with urllib.request.urlopen(requisicao, timeout=15) as resposta:
+            print(resposta.status, resposta.read().decode())
+    except urllib.error.HTTPError as e:
+        print(e.code, e.read().decode())
+
+@app.cli.command("bench-estoque")
+@click.option('--processos', default=8, show_default=True, help='Processos comprando ao mesmo tempo (como workers do gunicorn)')
+@click.option('--tentativas', default=50, show_default=True, help='Compras tentadas por processo')
+@click.option('--estoque', default=100, show_default=True, help='Estoque inicial do produto disputado')
+@click.option('--quantidade', default=1, show_default=True, help='Unidades por pedido')
+def bench_estoque(processos, tentativas, estoque, quantidade):
+    """Compra concorrente do mesmo produto em vários processos, num banco temporário.
+
+    Confere que nenhuma unidade é vendida além do estoque e mede pedidos/s.
+    """
+    global DB_PATH, MIGRACAO_LOCK_PATH, NOTIFICACOES_NO_WEB
+    import multiprocessing
+    import tempfile
+
+    caminho_original = DB_PATH, MIGRACAO_LOCK_PATH
+    # Os pedidos do bench ficam na fila: nada de entregar mensagens de teste
+    NOTIFICACOES_NO_WEB = False
+    with tempfile.TemporaryDirectory(prefix='bench-estoque-') as pasta:
+        DB_PATH = os.path.join(pasta, 'bench.db')
+        MIGRACAO_LOCK_PATH = DB_PATH + '.migracao.lock'
+        fechar_conexoes_da_thread()
+        try:
+            aplicar_migracoes()
+            conn = get_db_connection()
+            produto_id = conn.execute(
+                "INSERT INTO produtos (nome, preco, categoria, estoque) VALUES ('Produto disputado', 10, 'bench', ?)",
+                (estoque,)
+            ).lastrowid
+            conn.commit()
+            conn.close()
+            fechar_conexoes_da_thread()
+
+            # fork: os filhos herdam o DB_PATH temporário e abrem as próprias conexões
+            inicio = time.perf_counter()
+            with ProcessPoolExecutor(processos, mp_context=multiprocessing.get_context('fork')) as executor:
+                resultados = list(executor.map(_bench_estoque_trabalhador,
+                                               [(produto_id, tentativas, quantidade)] * processos))
+            duracao = time.perf_counter() - inicio
+
+            conn = get_db_connection()
+            restante = conn.execute('SELECT estoque FROM produtos WHERE id = ?', (produto_id,)).fetchone()[0]
+            reservado = conn.execute('SELECT COALESCE(SUM(quantidade), 0) FROM reservas_estoque WHERE produto_id = ?',
+                                     (produto_id,)).fetchone()[0]
+            gravados = conn.execute('''
+                SELECT (SELECT COUNT(*) FROM pedidos),
+                       (SELECT COALESCE(SUM(quantidade), 0) FROM pedido_itens),
+                       (SELECT COUNT(*) FROM chaves_idempotencia),
+                       (SELECT COUNT(DISTINCT pedido_id) FROM notificacoes)
+            ''').fetchone()
+            conn.close()
+        finally:
+            fechar_conexoes_da_thread()
+            DB_PATH, MIGRACAO_LOCK_PATH = caminho_original
+
+    vendidos = sum(r[0] for r in resultados)
+    recusados = sum(r[1] for r in resultados)
+    erros = sum(r[2] for r in resultados)
+    tempos = sorted(t for r in resultados for t in r[3])
+
+    def percentil(p):
+        return tempos[min(len(tempos) - 1, int(len(tempos) * p))] * 1000 if tempos else 0
+
+    print(f"{processos} processos x {tentativas} tentativas de {quantidade} un. (estoque inicial {estoque})")
+    print(f"  vendidos: {vendidos} pedidos ({vendidos * quantidade} un.), recusados: {recusados}, erros: {erros}")
+    print(f"  estoque final: {restante}, reservado: {reservado}")
+    print(f"  gravados: {gravados[0]} pedidos, {gravados[1]} un. em pedido_itens, "
+          f"{gravados[2]} chaves de idempotência, {gravados[3]} pedidos na fila de notificações")
+    print(f"  {len(tempos) / duracao:.0f} tentativas/s, {vendidos / duracao:.0f} pedidos/s, "
+          f"p50 {percentil(0.5):.1f} ms, p99 {percentil(0.99):.1f} ms")
+    if restante < 0 or reservado != vendidos * quantidade or restante + reservado != estoque:
+        print("FALHA: estoque e reservas não batem (overselling)")
+        raise SystemExit(1)
+    if tuple(gravados)[:3] != (vendidos, vendidos * quantidade, vendidos):
+        print("FALHA: pedidos vendidos e o que foi gravado não batem")
+        raise SystemExit(1)
+    print("OK: nenhuma unidade vendida além do estoque")
+
 @app.cli.command("init-db")
 @click.option('--schema', default=os.path.join(BASE_DIR, 'sql', 'schema.sql'))
 def init_db_cli(schema):  # RENOMEADO para não sobrescrever init_db()
@@ -1941,25 +5563,22 @@ def init_db_cli(schema):  # RENOMEADO para não sobrescrever init_db()
 
 @app.cli.command("upgrade-db")
 def upgrade_db():
-    """Garante estrutura mínima (tabelas + coluna is_admin)."""
-    # garante tabelas
-    init_db()
-    conn = get_db_connection()
+    """Aplica as migrações de schema pendentes."""
     try:
-        # garante coluna is_admin
-        ensure_is_admin_column(conn)
-        # garante coluna de senha compatível (senha ou senha_hash)
-        ensure_password_column(conn)
-        conn.commit()
-        print("OK: Migração mínima aplicada em", DB_PATH)
-        # Mostra colunas para conferência
-        cols = [dict(c) for c in conn.execute("PRAGMA table_info(usuarios)").fetchall()]
-        print("usuarios =>", cols)
+        aplicadas = aplicar_migracoes()
     except Exception as e:
-        conn.rollback()
         print("Erro no upgrade-db:", e)
+        return
+    conn = get_db_connection()
+    try:
+        versao = versao_schema(conn)
     finally:
         conn.close()
+    if aplicadas:
+        print(f"OK: migrações {aplicadas} aplicadas em", DB_PATH)
+    else:
+        print("OK: schema já está atualizado em", DB_PATH)
+    print(f"Versão do schema: {versao}")
 
 # Comando para criar as tabelas no MySQL
 @app.cli.command('create-db')
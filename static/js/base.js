@@ -0,0 +1,894 @@
+// Scripts globais do base.html (navegação, banners, sacola lateral, WhatsApp)
+// Smooth scroll para âncoras
+document.querySelectorAll('a[href^="#"]').forEach(anchor => {
+    anchor.addEventListener('click', function (e) {
+        e.preventDefault();
+        document.querySelector(this.getAttribute('href')).scrollIntoView({
+            behavior: 'smooth'
+        });
+    });
+});
+
+// Header scroll effect
+let lastScrollTop = 0;
+const header = document.querySelector('.header');
+
+window.addEventListener('scroll', () => {
+    let scrollTop = window.pageYOffset || document.documentElement.scrollTop;
+
+    if (scrollTop > lastScrollTop && scrollTop > 100) {
+        header.style.transform = 'translateY(-100%)';
+    } else {
+        header.style.transform = 'translateY(0)';
+    }
+
+    lastScrollTop = scrollTop;
+});
+
+// Auto-hide flash messages
+document.querySelectorAll('.flash-message').forEach(message => {
+    setTimeout(() => {
+        message.style.opacity = '0';
+        message.style.transform = 'translateY(-20px)';
+        setTimeout(() => message.remove(), 300);
+    }, 5000);
+});
+
+// 🎠 Banner Rotativo JavaScript
+let currentSlideIndex = 1;
+let slideInterval;
+const totalSlides = 3;
+
+// Função para mostrar slide específico
+function showSlide(n) {
+    const slides = document.querySelectorAll('.banner-slide');
+    const dots = document.querySelectorAll('.dot');
+
+    if (n > totalSlides) currentSlideIndex = 1;
+    if (n < 1) currentSlideIndex = totalSlides;
+
+    // Remove active class de todos os slides
+    slides.forEach(slide => {
+        slide.classList.remove('active', 'prev');
+    });
+
+    // Remove active class de todos os dots
+    dots.forEach(dot => {
+        dot.classList.remove('active');
+    });
+
+    // Adiciona active class no slide atual
+    const currentSlide = document.getElementById(`slide-${currentSlideIndex}`);
+    if (currentSlide) {
+        currentSlide.classList.add('active');
+    }
+
+    // Adiciona active class no dot atual
+    if (dots[currentSlideIndex - 1]) {
+        dots[currentSlideIndex - 1].classList.add('active');
+    }
+}
+
+// Função para próximo slide
+function nextSlide() {
+    currentSlideIndex++;
+    showSlide(currentSlideIndex);
+    resetAutoSlide();
+}
+
+// Função para slide anterior
+function previousSlide() {
+    currentSlideIndex--;
+    showSlide(currentSlideIndex);
+    resetAutoSlide();
+}
+
+// Função para ir para slide específico
+function currentSlide(n) {
+    currentSlideIndex = n;
+    showSlide(currentSlideIndex);
+    resetAutoSlide();
+}
+
+// Função para auto rotação
+function autoSlide() {
+    slideInterval = setInterval(() => {
+        nextSlide();
+    }, 4000); // Muda a cada 4 segundos
+}
+
+// Função para resetar auto rotação
+function resetAutoSlide() {
+    clearInterval(slideInterval);
+    autoSlide();
+}
+
+// Iniciar banner quando carregar a página
+document.addEventListener('DOMContentLoaded', function() {
+    showSlide(currentSlideIndex);
+    autoSlide();
+
+    // Pausar rotação quando hover no banner
+    const bannerContainer = document.querySelector('.banner-container');
+    if (bannerContainer) {
+        bannerContainer.addEventListener('mouseenter', () => {
+            clearInterval(slideInterval);
+        });
+
+        bannerContainer.addEventListener('mouseleave', () => {
+            autoSlide();
+        });
+    }
+});
+
+// Controle por teclado
+document.addEventListener('keydown', function(e) {
+    if (e.key === 'ArrowLeft') {
+        previousSlide();
+    } else if (e.key === 'ArrowRight') {
+        nextSlide();
+    }
+});
+
+// Touch/swipe para mobile
+let touchStartX = 0;
+let touchEndX = 0;
+
+document.addEventListener('touchstart', function(e) {
+    touchStartX = e.changedTouches[0].screenX;
+});
+
+document.addEventListener('touchend', function(e) {
+    touchEndX = e.changedTouches[0].screenX;
+    handleSwipe();
+});
+
+function handleSwipe() {
+    const swipeThreshold = 50;
+    const diffX = touchStartX - touchEndX;
+
+    if (Math.abs(diffX) > swipeThreshold) {
+        if (diffX > 0) {
+            // Swipe left - próximo slide
+            nextSlide();
+        } else {
+            // Swipe right - slide anterior
+            previousSlide();
+        }
+    }
+}
+
+// Função para toggle da sacola
+function toggleSacola() {
+    const overlay = document.getElementById('sacola-overlay');
+    if (overlay.classList.contains('active')) {
+        overlay.classList.remove('active');
+        document.body.style.overflow = '';
+    } else {
+        overlay.classList.add('active');
+        document.body.style.overflow = 'hidden';
+        carregarItensSacola();
+    }
+}
+
+// 🔍 Busca com sugestões: consulta /api/busca enquanto o usuário digita
+const BUSCA_ATRASO_MS = 150;
+let buscaTimer = null;
+let buscaControle = null;
+
+function toggleBusca() {
+    const painel = document.getElementById('buscaPainel');
+    painel.hidden = !painel.hidden;
+    if (!painel.hidden) {
+        document.getElementById('buscaInput').focus();
+    }
+}
+
+function escaparHtml(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto == null ? '' : String(texto);
+    return div.innerHTML;
+}
+
+function renderizarBusca(produtos, termo) {
+    const lista = document.getElementById('buscaResultados');
+    if (!termo) {
+        lista.innerHTML = '';
+        return;
+    }
+    if (!produtos.length) {
+        lista.innerHTML = '<li class="busca-vazia"><a>Nenhum produto encontrado</a></li>';
+        return;
+    }
+    // "destaque" já vem escapado do servidor, só com <mark> nos termos encontrados
+    lista.innerHTML = produtos.map((p) => `
+        <li role="option">
+            <a href="${p.url}">
+                ${p.imagem ? `<img src="${escaparHtml(p.imagem)}" alt="" loading="lazy">` : ''}
+                <span>${p.destaque}</span>
+                <span class="busca-preco">R$ ${p.preco.toFixed(2).replace('.', ',')}</span>
+            </a>
+        </li>`).join('');
+}
+
+function buscarProdutos(termo) {
+    if (buscaControle) {
+        buscaControle.abort();
+    }
+    if (!termo) {
+        renderizarBusca([], '');
+        return;
+    }
+    buscaControle = new AbortController();
+    fetch(`/api/busca?${new URLSearchParams({ q: termo, limite: 8 })}`, { signal: buscaControle.signal })
+        .then((response) => response.json())
+        .then((data) => renderizarBusca(data.produtos || [], termo))
+        .catch((erro) => {
+            if (erro.name !== 'AbortError') {
+                console.log('Erro na busca:', erro);
+            }
+        });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    const input = document.getElementById('buscaInput');
+    if (!input) return;
+    input.addEventListener('input', function() {
+        clearTimeout(buscaTimer);
+        buscaTimer = setTimeout(() => buscarProdutos(input.value.trim()), BUSCA_ATRASO_MS);
+    });
+    input.addEventListener('keydown', function(e) {
+        const itens = Array.from(document.querySelectorAll('#buscaResultados li[role="option"]'));
+        let atual = itens.findIndex((li) => li.classList.contains('ativo'));
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            if (!itens.length) return;
+            if (atual >= 0) itens[atual].classList.remove('ativo');
+            atual = e.key === 'ArrowDown' ? (atual + 1) % itens.length : (atual - 1 + itens.length) % itens.length;
+            itens[atual].classList.add('ativo');
+        } else if (e.key === 'Enter' && itens.length) {
+            e.preventDefault();
+            window.location.href = itens[Math.max(atual, 0)].querySelector('a').href;
+        } else if (e.key === 'Escape') {
+            document.getElementById('buscaPainel').hidden = true;
+        }
+    });
+});
+
+// Função para carregar itens da sacola
+let carregandoSacola = false; // Proteção contra múltiplas chamadas
+async function carregarItensSacola() {
+    if (carregandoSacola) {
+        console.log('[SACOLA] Já está carregando, ignorando chamada duplicada');
+        return;
+    }
+
+    carregandoSacola = true;
+    try {
+        const response = await fetch('/api/carrinho');
+        const data = await response.json();
+
+        const container = document.getElementById('sacola-items');
+        const totalElement = document.getElementById('sacola-total');
+
+        if (data.items && data.items.length > 0) {
+            container.innerHTML = data.items.map(item => `
+                <div class="sacola-item" data-produto-id="${item.produto_id}" data-tamanho="${item.tamanho || 'M'}" data-cor="${item.cor || 'Padrão'}">
+                    <div class="sacola-item-image">
+                        ${item.imagem ? 
+                            `<img src="${item.imagem}" alt="${item.nome}" onerror="this.src='data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iNDAiIGhlaWdodD0iNDAiIHZpZXdCb3g9IjAgMCA0MCA0MCIgZmlsbD0ibm9uZSIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj4KPHJlY3Qgd2lkdGg9IjQwIiBoZWlnaHQ9IjQwIiBmaWxsPSIjRjVGNUY1Ii8+CjxwYXRoIGQ9Ik0yNSAyMEgyMFYxNUgxNVYyMEgxMFYyNUgxNVYzMEgyMFYyNUgyNVYyMFoiIGZpbGw9IiNDQ0NDQ0MiLz4KPC9zdmc+Cg==';">` : 
+                            `<div class="sacola-item-placeholder">👕</div>`
+                        }
+                    </div>
+                    <div class="sacola-item-details">
+                        <h4>${item.nome}</h4>
+                        <p>Tam: ${item.tamanho || 'M'} | Cor: ${item.cor || 'Padrão'}</p>
+                        <div class="sacola-item-price">R$ ${item.preco ? item.preco.toFixed(2).replace('.', ',') : '0,00'}</div>
+                    </div>
+                    <div class="sacola-item-quantity">
+                        <button onclick="alterarQuantidade(${item.produto_id}, -1, '${item.tamanho || 'M'}', '${item.cor || 'Padrão'}')">−</button>
+                        <span>${item.quantidade}</span>
+                        <button onclick="alterarQuantidade(${item.produto_id}, 1, '${item.tamanho || 'M'}', '${item.cor || 'Padrão'}')">+</button>
+                    </div>
+                    <button class="sacola-item-remove" onclick="removerItem(${item.produto_id}, '${item.tamanho || 'M'}', '${item.cor || 'Padrão'}')">
+                        <i class="fas fa-trash"></i>
+                    </button>
+                </div>
+            `).join('');
+
+            totalElement.textContent = `R$ ${data.total.toFixed(2).replace('.', ',')}`;
+        } else {
+            container.innerHTML = `
+                <div class="sacola-empty">
+                    <i class="fas fa-shopping-bag"></i>
+                    <p>Sua sacola está vazia</p>
+                    <button onclick="toggleSacola(); window.location.href='/'">
+                        CONTINUAR COMPRANDO
+                    </button>
+                </div>
+            `;
+            totalElement.textContent = 'R$ 0,00';
+        }
+    } catch (error) {
+        console.error('Erro ao carregar sacola:', error);
+    } finally {
+        carregandoSacola = false;
+    }
+}
+
+// Função para abrir formulário WhatsApp
+function abrirFormularioWhatsApp() {
+    const response = fetch('/api/carrinho').then(r => r.json());
+    response.then(data => {
+        if (!data.items || data.items.length === 0) {
+            alert('Seu carrinho está vazio!');
+            return;
+        }
+        document.getElementById('modal-whatsapp-form').style.display = 'flex';
+        document.body.style.overflow = 'hidden';
+    });
+}
+
+// Função para fechar formulário
+function fecharFormularioWhatsApp() {
+    document.getElementById('modal-whatsapp-form').style.display = 'none';
+    document.body.style.overflow = '';
+}
+
+// Máscara para celular
+document.addEventListener('DOMContentLoaded', function() {
+    const celularInput = document.getElementById('whatsapp-celular');
+    if (celularInput) {
+        celularInput.addEventListener('input', function(e) {
+            let valor = e.target.value.replace(/\D/g, '');
+            if (valor.length <= 11) {
+                valor = valor.replace(/^(\d{2})(\d{5})(\d{4}).*/, '($1) $2-$3');
+            }
+            e.target.value = valor;
+        });
+    }
+});
+
+// Função para enviar com dados do formulário
+async function enviarParaWhatsAppComDados(event) {
+    event.preventDefault();
+
+    const nome = document.getElementById('whatsapp-nome').value;
+    const celular = document.getElementById('whatsapp-celular').value;
+
+    await enviarParaWhatsApp(nome, celular);
+    fecharFormularioWhatsApp();
+}
+
+// Função para enviar sem informar dados
+async function enviarSemInformarDados(event) {
+    event.preventDefault();
+    await enviarParaWhatsApp();
+    fecharFormularioWhatsApp();
+}
+
+// 📱 Função para enviar produtos para WhatsApp
+async function enviarParaWhatsApp(nomeCliente = null, celularCliente = null) {
+    try {
+        // Buscar configurações do WhatsApp
+        const configResponse = await fetch('/api/whatsapp-config');
+        const config = await configResponse.json();
+
+        // Buscar itens do carrinho
+        const response = await fetch('/api/carrinho');
+        const data = await response.json();
+
+        if (!data.items || data.items.length === 0) {
+            alert('Seu carrinho está vazio!');
+            return;
+        }
+
+        // Número da loja
+        const numeroLoja = config.numero;
+        const lojaNome = config.loja_nome;
+
+        // Montar mensagem
+        let mensagem = `🛍️ *Olá ${lojaNome}! Gostaria de fazer um pedido:*\n\n`;
+
+        // Adicionar dados do cliente se fornecidos
+        if (nomeCliente && celularCliente) {
+            mensagem += `👤 *Dados do Cliente:*\n`;
+            mensagem += `Nome: ${nomeCliente}\n`;
+            mensagem += `Celular: ${celularCliente}\n\n`;
+            mensagem += `━━━━━━━━━━━━━━━━\n\n`;
+        }
+
+        mensagem += `📦 *Produtos:*\n\n`;
+
+        data.items.forEach((item, index) => {
+            mensagem += `${index + 1}. *${item.nome}*\n`;
+            mensagem += `   💰 R$ ${item.preco.toFixed(2).replace('.', ',')}\n`;
+            mensagem += `   📏 Tamanho: ${item.tamanho || 'Padrão'}\n`;
+            mensagem += `   🎨 Cor: ${item.cor || 'Padrão'}\n`;
+            mensagem += `   📦 Quantidade: ${item.quantidade}\n`;
+            mensagem += `   💵 Subtotal: R$ ${(item.preco * item.quantidade).toFixed(2).replace('.', ',')}\n\n`;
+        });
+
+        mensagem += `━━━━━━━━━━━━━━━━\n`;
+        mensagem += `💰 *Total: R$ ${data.total.toFixed(2).replace('.', ',')}*\n\n`;
+        mensagem += `✨ _Cliente da UzzeStore_`;
+
+        // Codificar mensagem para URL
+        const mensagemCodificada = encodeURIComponent(mensagem);
+
+        // Abrir WhatsApp
+        const urlWhatsApp = `https://wa.me/${numeroLoja}?text=${mensagemCodificada}`;
+        window.open(urlWhatsApp, '_blank');
+
+        // Opcional: Fechar a sacola após enviar
+        setTimeout(() => {
+            toggleSacola();
+        }, 500);
+
+    } catch (error) {
+        console.error('Erro ao enviar para WhatsApp:', error);
+        alert('Erro ao preparar mensagem do WhatsApp');
+    }
+}
+
+// Função para alterar quantidade
+async function alterarQuantidade(produtoId, delta, tamanho, cor) {
+    try {
+        const response = await fetch(
+            `/carrinho/alterar-quantidade/${produtoId}?ajax=true&delta=${delta}&tamanho=${encodeURIComponent(tamanho)}&cor=${encodeURIComponent(cor)}`,
+            { method: 'GET', headers: { 'Content-Type': 'application/json' } }
+        );
+
+        const data = await response.json();
+
+        if (data.success) {
+            // Atualiza itens da sacola e contador no header
+            carregarItensSacola();
+
+            const cartCount = document.querySelector('.cart-count');
+            if (cartCount) {
+                if (data.carrinho_count > 0) {
+                    cartCount.textContent = data.carrinho_count;
+                    cartCount.style.display = 'block';
+                } else {
+                    cartCount.style.display = 'none';
+                }
+            }
+        } else {
+            console.error('Erro ao alterar quantidade:', data.message);
+        }
+    } catch (error) {
+        console.error('Erro:', error);
+    }
+}
+
+// Função para remover item
+async function removerItem(produtoId, tamanho, cor) {
+    if (confirm('Tem certeza que deseja remover este item?')) {
+        try {
+            const response = await fetch(`/carrinho/remover/${produtoId}?ajax=true&tamanho=${encodeURIComponent(tamanho)}&cor=${encodeURIComponent(cor)}`, {
+                method: 'GET',
+                headers: {
+                    'Content-Type': 'application/json'
+                }
+            });
+
+            const data = await response.json();
+
+            if (data.success) {
+                // Recarregar os itens da sacola
+                carregarItensSacola();
+
+                // Atualizar contador na sacola do header
+                const cartCount = document.querySelector('.cart-count');
+                if (cartCount) {
+                    if (data.carrinho_count > 0) {
+                        cartCount.textContent = data.carrinho_count;
+                        cartCount.style.display = 'block';
+                    } else {
+                        cartCount.style.display = 'none';
+                    }
+                }
+
+                // Mostrar notificação
+                showNotification('Item removido da sacola!', 'info');
+            } else {
+                console.error('Erro ao remover item:', data.message);
+            }
+        } catch (error) {
+            console.error('Erro:', error);
+        }
+    }
+}
+
+// Função para mostrar notificações na sacola
+function showNotification(message, type = 'info') {
+    const notification = document.createElement('div');
+    notification.className = `notification notification-${type}`;
+    notification.innerHTML = `
+        <span>${message}</span>
+        <button onclick="this.parentElement.remove()">&times;</button>
+    `;
+
+    notification.style.cssText = `
+        position: fixed;
+        top: 20px;
+        right: 20px;
+        background: ${type === 'success' ? '#27ae60' : type === 'error' ? '#e74c3c' : type === 'info' ? '#3498db' : '#f39c12'};
+        color: white;
+        padding: 12px 20px;
+        border-radius: 6px;
+        box-shadow: 0 4px 12px rgba(0,0,0,0.15);
+        z-index: 10000;
+        font-family: Inter, sans-serif;
+        font-size: 14px;
+        display: flex;
+        align-items: center;
+        gap: 12px;
+        animation: slideInRight 0.3s ease;
+    `;
+
+    notification.querySelector('button').style.cssText = `
+        background: none;
+        border: none;
+        color: white;
+        font-size: 18px;
+        cursor: pointer;
+        padding: 0;
+        width: 20px;
+        height: 20px;
+        display: flex;
+        align-items: center;
+        justify-content: center;
+    `;
+
+    document.body.appendChild(notification);
+
+    setTimeout(() => {
+        if (notification.parentElement) {
+            notification.style.animation = 'slideOutRight 0.3s ease';
+            setTimeout(() => notification.remove(), 300);
+        }
+    }, 3000);
+}
+
+// Carregar itens da sacola APENAS quando clicar (removido auto-carregamento)
+document.addEventListener('DOMContentLoaded', function() {
+  //  console.log('[DEBUG] DOM carregado - SEM auto-carregamento da sacola');
+    // carregarItensSacola(); // DESABILITADO para evitar loop
+});
+
+// 🦶 JavaScript do Rodapé
+
+// Botão voltar ao topo
+function scrollToTop() {
+    window.scrollTo({
+        top: 0,
+        behavior: 'smooth'
+    });
+}
+
+// Mostrar/ocultar botão de voltar ao topo
+window.addEventListener('scroll', () => {
+    const backToTop = document.querySelector('.back-to-top');
+    if (window.pageYOffset > 300) {
+        backToTop.classList.add('visible');
+    } else {
+        backToTop.classList.remove('visible');
+    }
+});
+
+// Newsletter subscription
+function subscribeNewsletter(event) {
+    event.preventDefault();
+    const email = event.target.querySelector('input[type="email"]').value;
+
+    // Simulação de envio
+    const button = event.target.querySelector('button');
+    const originalIcon = button.innerHTML;
+
+    button.innerHTML = '<i class="fas fa-spinner fa-spin"></i>';
+    button.disabled = true;
+
+    setTimeout(() => {
+        button.innerHTML = '<i class="fas fa-check"></i>';
+
+        // Mostrar notificação de sucesso
+        showNotification('🎉 Newsletter cadastrada com sucesso! Você receberá 2% OFF na primeira compra.', 'success');
+
+        // Reset form
+        event.target.querySelector('input[type="email"]').value = '';
+
+        setTimeout(() => {
+            button.innerHTML = originalIcon;
+            button.disabled = false;
+        }, 2000);
+    }, 1500);
+}
+
+// Sistema de modals para informações
+function openModal(type) {
+    const modal = document.getElementById('info-modal');
+    const title = document.getElementById('modal-title');
+    const body = document.getElementById('modal-body');
+
+    const modalContent = {
+        trocas: {
+            title: 'Trocas e Devoluções',
+            content: `
+                <div style="display: grid; gap: 20px;">
+                    <div>
+                        <h4 style="color: var(--accent-color);">🔄 Política de Trocas</h4>
+                        <ul style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li>Prazo de 30 dias para trocas</li>
+                            <li>Produto deve estar em perfeito estado</li>
+                            <li>Embalagem original preservada</li>
+                            <li>Etiquetas não podem estar danificadas</li>
+                            <li>Primeira troca gratuita</li>
+                        </ul>
+                    </div>
+                    <div>
+                        <h4 style="color: var(--accent-color);">📦 Como Solicitar</h4>
+                        <ol style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li>Entre em contato pelo WhatsApp</li>
+                            <li>Informe o número do pedido</li>
+                            <li>Descreva o motivo da troca</li>
+                            <li>Aguarde as instruções de envio</li>
+                        </ol>
+                    </div>
+                </div>
+            `
+        },
+        entrega: {
+            title: 'Política de Entrega',
+            content: `
+                <div style="display: grid; gap: 20px;">
+                    <div>
+                        <h4 style="color: var(--accent-color);">🚚 Prazos de Entrega</h4>
+                        <ul style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li><strong>São Paulo Capital:</strong> 1-2 dias úteis</li>
+                            <li><strong>Grande São Paulo:</strong> 2-3 dias úteis</li>
+                            <li><strong>Interior SP:</strong> 3-5 dias úteis</li>
+                            <li><strong>Outras capitais:</strong> 3-7 dias úteis</li>
+                            <li><strong>Demais regiões:</strong> 5-10 dias úteis</li>
+                        </ul>
+                    </div>
+                    <div>
+                        <h4 style="color: var(--accent-color);">💰 Valores do Frete</h4>
+                        <ul style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li><strong>Compras acima de R$ 299:</strong> Frete GRÁTIS</li>
+                            <li><strong>PAC:</strong> A partir de R$ 15,90</li>
+                            <li><strong>SEDEX:</strong> A partir de R$ 25,90</li>
+                            <li><strong>Entrega expressa:</strong> A partir de R$ 35,90</li>
+                        </ul>
+                    </div>
+                </div>
+            `
+        },
+        guia: {
+            title: 'Guia de Tamanhos',
+            content: '<div style="display: grid; gap: 25px;"><div><h4 style="color: var(--accent-color);">👔 Camisas Sociais</h4><table style="width: 100%; border-collapse: collapse; margin: 10px 0;"><tr style="background: #f8f9fa;"><th style="padding: 10px; border: 1px solid #ddd;">Tamanho</th><th style="padding: 10px; border: 1px solid #ddd;">Peito (cm)</th><th style="padding: 10px; border: 1px solid #ddd;">Cintura (cm)</th><th style="padding: 10px; border: 1px solid #ddd;">Quadril (cm)</th></tr><tr><td style="padding: 8px; border: 1px solid #ddd;">P</td><td style="padding: 8px; border: 1px solid #ddd;">96-100</td><td style="padding: 8px; border: 1px solid #ddd;">82-86</td><td style="padding: 8px; border: 1px solid #ddd;">96-100</td></tr><tr><td style="padding: 8px; border: 1px solid #ddd;">M</td><td style="padding: 8px; border: 1px solid #ddd;">100-104</td><td style="padding: 8px; border: 1px solid #ddd;">86-90</td><td style="padding: 8px; border: 1px solid #ddd;">100-104</td></tr><tr><td style="padding: 8px; border: 1px solid #ddd;">G</td><td style="padding: 8px; border: 1px solid #ddd;">104-108</td><td style="padding: 8px; border: 1px solid #ddd;">90-94</td><td style="padding: 8px; border: 1px solid #ddd;">104-108</td></tr><tr><td style="padding: 8px; border: 1px solid #ddd;">GG</td><td style="padding: 8px; border: 1px solid #ddd;">108-112</td><td style="padding: 8px; border: 1px solid #ddd;">94-98</td><td style="padding: 8px; border: 1px solid #ddd;">108-112</td></tr></table></div><div><h4 style="color: var(--accent-color);">📏 Como Medir</h4><ul style="margin: 10px 0 0 20px; line-height: 1.8;"><li><strong>Peito:</strong> Meça na parte mais larga do tórax</li><li><strong>Cintura:</strong> Meça na parte mais estreita do tronco</li><li><strong>Quadril:</strong> Meça na parte mais larga do quadril</li></ul></div></div>'
+        },
+        cuidados: {
+            title: 'Cuidados com as Peças',
+            content: `
+                <div style="display: grid; gap: 20px;">
+                    <div>
+                        <h4 style="color: var(--accent-color);">👔 Camisas Sociais</h4>
+                        <ul style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li>Lave em água fria (máx. 30°C)</li>
+                            <li>Use sabão neutro ou detergente suave</li>
+                            <li>Passe ainda úmida em temperatura média</li>
+                            <li>Pendure em cabides para secar</li>
+                        </ul>
+                    </div>
+                    <div>
+                        <h4 style="color: var(--accent-color);">👕 Camisetas</h4>
+                        <ul style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li>Lave do avesso para preservar a estampa</li>
+                            <li>Não use alvejante</li>
+                            <li>Seque à sombra</li>
+                            <li>Passe em temperatura baixa</li>
+                        </ul>
+                    </div>
+                    <div>
+                        <h4 style="color: var(--accent-color);">👖 Calças</h4>
+                        <ul style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li>Lave com peças de cores similares</li>
+                            <li>Não torça ao secar</li>
+                            <li>Use amaciante com moderação</li>
+                            <li>Guarde pendurada ou dobrada adequadamente</li>
+                        </ul>
+                    </div>
+                    <div>
+                        <h4 style="color: var(--accent-color);">🩳 Bermudas</h4>
+                        <ul style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li>Lave em água fria para manter a cor</li>
+                            <li>Evite centrifugação forte</li>
+                            <li>Seque preferencialmente à sombra</li>
+                            <li>Passe com ferro morno se necessário</li>
+                            <li>Dobre ou pendure para guardar</li>
+                        </ul>
+                    </div>
+                </div>
+            `
+        },
+        privacidade: {
+            title: 'Política de Privacidade',
+            content: `
+                <div style="display: grid; gap: 20px;">
+                    <p>A UzzeStore se compromete a proteger sua privacidade e dados pessoais de acordo com a LGPD.</p>
+                    <div>
+                        <h4 style="color: var(--accent-color);">🔒 Coleta de Dados</h4>
+                        <p>Coletamos apenas dados necessários para processamento de pedidos, comunicação e melhoramento da experiência.</p>
+                    </div>
+                    <div>
+                        <h4 style="color: var(--accent-color);">🛡️ Uso dos Dados</h4>
+                        <ul style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li>Processamento de pedidos</li>
+                            <li>Comunicação sobre seu pedido</li>
+                            <li>Envio de ofertas (com seu consentimento)</li>
+                            <li>Melhoria dos nossos serviços</li>
+                        </ul>
+                    </div>
+                    <div>
+                        <h4 style="color: var(--accent-color);">✅ Seus Direitos</h4>
+                        <p>Você pode solicitar acesso, correção ou exclusão dos seus dados a qualquer momento entrando em contato conosco.</p>
+                    </div>
+                </div>
+            `
+        },
+        termos: {
+            title: 'Termos de Uso',
+            content: `
+                <div style="display: grid; gap: 20px;">
+                    <p>Ao utilizar nosso site, você concorda com os seguintes termos:</p>
+                    <div>
+                        <h4 style="color: var(--accent-color);">📝 Condições Gerais</h4>
+                        <ul style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li>Os preços podem sofrer alterações sem aviso prévio</li>
+                            <li>As ofertas são válidas enquanto durarem os estoques</li>
+                            <li>Reservamos o direito de cancelar pedidos suspeitos</li>
+                        </ul>
+                    </div>
+                    <div>
+                        <h4 style="color: var(--accent-color);">💳 Pagamentos</h4>
+                        <p>Todos os pagamentos são processados de forma segura. Cartões de crédito podem ter análise de risco.</p>
+                    </div>
+                    <div>
+                        <h4 style="color: var(--accent-color);">📞 Suporte</h4>
+                        <p>Para dúvidas sobre os termos, entre em contato através dos nossos canais oficiais.</p>
+                    </div>
+                </div>
+            `
+        },
+        cookies: {
+            title: 'Política de Cookies',
+            content: `
+                <div style="display: grid; gap: 20px;">
+                    <p>Utilizamos cookies para melhorar sua experiência em nosso site.</p>
+                    <div>
+                        <h4 style="color: var(--accent-color);">🍪 Tipos de Cookies</h4>
+                        <ul style="margin: 10px 0 0 20px; line-height: 1.8;">
+                            <li><strong>Essenciais:</strong> Necessários para funcionamento do site</li>
+                            <li><strong>Funcionais:</strong> Lembram suas preferências</li>
+                            <li><strong>Analytics:</strong> Nos ajudam a entender o uso do site</li>
+                            <li><strong>Marketing:</strong> Para mostrar anúncios relevantes</li>
+                        </ul>
+                    </div>
+                    <div>
+                        <h4 style="color: var(--accent-color);">⚙️ Gerenciar Cookies</h4>
+                        <p>Você pode gerenciar suas preferências de cookies através das configurações do seu navegador.</p>
+                    </div>
+                </div>
+            `
+        }
+    };
+
+    const content = modalContent[type];
+    if (content) {
+        title.textContent = content.title;
+        body.innerHTML = content.content;
+
+        modal.classList.add('active');
+        document.body.style.overflow = 'hidden';
+    }
+}
+
+function closeModal() {
+    const modal = document.getElementById('info-modal');
+    modal.classList.remove('active');
+    document.body.style.overflow = '';
+
+    setTimeout(() => {
+        modal.style.display = 'none';
+    }, 300);
+}
+
+// Fechar modal clicando fora
+document.getElementById('info-modal').addEventListener('click', function(e) {
+    if (e.target === this) {
+        closeModal();
+    }
+});
+
+// Fechar modal com ESC
+document.addEventListener('keydown', function(e) {
+    if (e.key === 'Escape') {
+        closeModal();
+    }
+});
+
+// 📲 Service worker: app shell e vitrine em cache (stale-while-revalidate)
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', function() {
+        navigator.serviceWorker.register('/sw.js', { scope: '/' }).catch(function(e) {
+            console.log('[SW] Falha ao registrar:', e);
+        });
+    });
+}
+
+// 🧹 LIMPEZA COMPLETA DE CACHE
+function limparTodosOsCaches() {
+    console.log('[CACHE] Iniciando limpeza completa...');
+
+    // 1. Limpar Service Worker caches
+    if ('caches' in window) {
+        caches.keys().then((cacheNames) => {
+            cacheNames.forEach((cacheName) => {
+                console.log('[CACHE] Removendo cache SW:', cacheName);
+                caches.delete(cacheName);
+            });
+        });
+    }
+
+    // 2. Limpar Local Storage
+    try {
+        localStorage.clear();
+        console.log('[CACHE] LocalStorage limpo');
+    } catch(e) {
+        console.log('[CACHE] Erro ao limpar localStorage:', e);
+    }
+
+    // 3. Limpar Session Storage
+    try {
+        sessionStorage.clear();
+        console.log('[CACHE] SessionStorage limpo');
+    } catch(e) {
+        console.log('[CACHE] Erro ao limpar sessionStorage:', e);
+    }
+
+    // 4. Forçar reload sem cache
+    setTimeout(() => {
+        console.log('[CACHE] Recarregando sem cache...');
+        window.location.reload(true);
+    }, 1000);
+}
+
+// 🔄 Auto-limpeza quando detectar problema
+const requestCount = window.requestCount || 0;
+window.requestCount = requestCount + 1;
+
+if (window.requestCount > 5) {
+    console.log('[CACHE] Muitas requisições detectadas, limpando cache...');
+    limparTodosOsCaches();
+}
+
+// ⌨️ Atalho para limpeza manual: Ctrl+Shift+R
+document.addEventListener('keydown', function(e) {
+    if (e.ctrlKey && e.shiftKey && e.code === 'KeyR') {
+        e.preventDefault();
+        console.log('[CACHE] Limpeza manual ativada');
+        limparTodosOsCaches();
+    }
+});
+
+// animação de entrada das categorias (stagger)
+document.addEventListener('DOMContentLoaded', function() {
+    try {
+        const items = document.querySelectorAll('.categories-list .category-item');
+        items.forEach((el, i) => {
+            setTimeout(() => el.classList.add('show'), i * 80);
+        });
+    } catch (e) { /* silencioso */ }
+});
@@ -0,0 +1,979 @@
+// Scripts da vitrine (index.html): navegação, sacola rápida, scroll infinito e filtros
+function imgFallback(el, w=800, h=800, text='Sem Imagem') {
+  el.onerror = null;
+  const url = `https://placehold.co/${w}x${h}/f0f0f0/666?text=${encodeURIComponent(text)}`;
+  const test = new Image();
+  test.onload = () => el.src = url;
+  test.onerror = () => {
+    const svg = `<svg xmlns='http://www.w3.org/2000/svg' width='${w}' height='${h}'>
+      <rect width='100%' height='100%' fill='#f0f0f0'/><text x='50%' y='50%' dominant-baseline='middle'
+      text-anchor='middle' font-family='Arial' font-size='24' fill='#666'>${text}</text></svg>`;
+    el.src = 'data:image/svg+xml;charset=UTF-8,' + encodeURIComponent(svg);
+  };
+  test.src = url;
+}
+
+// =============== LAZY LOADING E TELA LIMPA ===============
+
+// Sistema de lazy loading melhorado
+document.addEventListener('DOMContentLoaded', function() {
+  // Intersection Observer para lazy loading
+  if ('IntersectionObserver' in window) {
+    const imageObserver = new IntersectionObserver((entries, observer) => {
+      entries.forEach(entry => {
+        if (entry.isIntersecting) {
+          const img = entry.target;
+          if (img.dataset.srcset && !img.srcset) {
+            img.srcset = img.dataset.srcset;
+          }
+          if (img.dataset.src && !img.src) {
+            img.src = img.dataset.src;
+          }
+          observer.unobserve(img);
+        }
+      });
+    });
+
+    // Também usado pelo scroll infinito para os cards carregados depois
+    window.observarImagensLazy = function(root) {
+      root.querySelectorAll('img[data-src]').forEach(img => {
+        imageObserver.observe(img);
+      });
+    };
+    window.observarImagensLazy(document);
+  }
+
+  // Animação de fade-in para produtos
+  const productCards = document.querySelectorAll('.produto-card');
+  productCards.forEach((card, index) => {
+    card.style.opacity = '0';
+    card.style.transform = 'translateY(20px)';
+    setTimeout(() => {
+      card.style.transition = 'all 0.6s cubic-bezier(0.4, 0, 0.2, 1)';
+      card.style.opacity = '1';
+      card.style.transform = 'translateY(0)';
+    }, index * 100);
+  });
+});
+
+function openCleanScreen(event){
+    try{
+        if(event && event.preventDefault) event.preventDefault();
+        if(document.getElementById('clean-screen-overlay')) return;
+        const overlay = document.createElement('div');
+        overlay.id = 'clean-screen-overlay';
+        overlay.setAttribute('role','dialog');
+        overlay.setAttribute('aria-modal','true');
+        overlay.innerHTML = '<button class="clean-close" aria-label="Fechar tela limpa">\u00d7</button>';
+        document.body.appendChild(overlay);
+
+        const btn = overlay.querySelector('.clean-close');
+        btn.addEventListener('click', closeCleanScreen);
+
+        // Fecha ao clicar no fundo
+        overlay.addEventListener('click', function(e){ if(e.target === overlay) closeCleanScreen(); });
+
+        // Fecha com ESC
+        document.addEventListener('keydown', escHandler);
+    }catch(err){ console.error('openCleanScreen error', err); }
+}
+
+function closeCleanScreen(){
+    const o = document.getElementById('clean-screen-overlay');
+    if(o) o.remove();
+    document.removeEventListener('keydown', escHandler);
+}
+
+function escHandler(e){ if(e.key === 'Escape') closeCleanScreen(); }
+
+// Listener para imagens de produto (qualquer elemento .product-image)
+document.addEventListener('click', function(e){
+    try{
+        const productImage = e.target.closest && e.target.closest('.product-image');
+        if(productImage){
+            // evitar interferir com botões dentro do card
+            if(e.target.closest('button') || e.target.closest('a')) return;
+            openCleanScreen(e);
+        }
+    }catch(err){ /* ignore */ }
+});
+
+// Mostrar apenas produtos de uma categoria (chamado pelos hero-cards)
+function showCategory(category){
+    try{
+        // Garantir que os produtos já foram carregados
+        if(!allProducts || allProducts.length === 0){
+            // tenta carregar produtos se ainda não carregados
+            loadProducts();
+        }
+
+        // Atualiza filtros de categoria (client-side)
+        activeFilters.categories = [category];
+
+        // Atualiza checkboxes no painel de filtros (se existirem)
+        document.querySelectorAll('.filter-options input[type="checkbox"]').forEach(cb => {
+            if(cb.value === ''){
+                cb.checked = false; // desmarca 'Todas as categorias'
+            } else {
+                cb.checked = (cb.value === category);
+            }
+        });
+
+        filterProducts();
+
+        // Rolar para a área de produtos
+        const productsSection = document.querySelector('.products-container');
+        if(productsSection){ productsSection.scrollIntoView({behavior: 'smooth'}); }
+    }catch(e){ console.error('showCategory error', e); }
+}
+
+// =============== FUNÇÕES DE NAVEGAÇÃO E INTERAÇÃO ===============
+
+// Função para abrir página de produto
+function abrirProduto(produtoId) {
+    window.location.href = `/produto/${produtoId}`;
+}
+
+// Função para visualização rápida (modal)
+function visualizarRapido(produtoId) {
+    // Por enquanto, redireciona para a página do produto
+    // No futuro, pode abrir um modal
+    window.location.href = `/produto/${produtoId}`;
+}
+
+// Função para adicionar ao carrinho rapidamente
+function adicionarCarrinhoRapido(produtoId) {
+    const url = `/carrinho/adicionar/${produtoId}?q=1&tamanho=M&cor=Padrão`;
+
+    fetch(url, {
+        method: 'GET'
+    })
+    .then(response => {
+        if (response.ok) {
+            // Mostrar notificação de sucesso
+            mostrarNotificacao('Produto adicionado ao carrinho!', 'success');
+
+            // Atualizar contador do carrinho se existir
+            atualizarContadorCarrinho();
+        } else {
+            mostrarNotificacao('Erro ao adicionar produto!', 'error');
+        }
+    })
+    .catch(error => {
+        console.error('Erro:', error);
+        mostrarNotificacao('Erro ao adicionar produto ao carrinho!', 'error');
+    });
+}
+
+// Função para toggle favorito
+function toggleFavorito(produtoId) {
+    const btn = document.querySelector(`[onclick*="toggleFavorito(${produtoId})"]`);
+    const icon = btn.querySelector('i');
+
+    if (icon.classList.contains('fas')) {
+        icon.classList.remove('fas');
+        icon.classList.add('far');
+        btn.classList.remove('active');
+        mostrarNotificacao('Removido dos favoritos', 'info');
+    } else {
+        icon.classList.remove('far');
+        icon.classList.add('fas');
+        btn.classList.add('active');
+        mostrarNotificacao('Adicionado aos favoritos!', 'success');
+    }
+}
+
+// Função para mostrar notificações
+function mostrarNotificacao(message, type = 'info') {
+    // Verificar se já existe uma notificação
+    const existingNotification = document.querySelector('.notification');
+    if (existingNotification) {
+        existingNotification.remove();
+    }
+
+    // Criar elemento de notificação
+    const notification = document.createElement('div');
+    notification.className = 'notification';
+    notification.style.cssText = `
+        position: fixed;
+        top: 20px;
+        right: 20px;
+        background: ${type === 'success' ? '#28a745' : type === 'error' ? '#dc3545' : '#007bff'};
+        color: white;
+        padding: 15px 20px;
+        border-radius: 8px;
+        box-shadow: 0 4px 12px rgba(0,0,0,0.2);
+        z-index: 10000;
+        font-weight: 600;
+        max-width: 300px;
+        opacity: 0;
+        transform: translateX(100%);
+        transition: all 0.3s ease;
+        display: flex;
+        align-items: center;
+        gap: 10px;
+    `;
+
+    // Adicionar ícone baseado no tipo
+    const icon = type === 'success' ? '✅' : type === 'error' ? '❌' : 'ℹ️';
+    notification.innerHTML = `${icon} ${message}`;
+
+    document.body.appendChild(notification);
+
+    // Animar entrada
+    setTimeout(() => {
+        notification.style.opacity = '1';
+        notification.style.transform = 'translateX(0)';
+    }, 100);
+
+    // Remover após 3 segundos
+    setTimeout(() => {
+        notification.style.opacity = '0';
+        notification.style.transform = 'translateX(100%)';
+        setTimeout(() => {
+            if (notification.parentNode) {
+                notification.parentNode.removeChild(notification);
+            }
+        }, 300);
+    }, 3000);
+}
+
+// Função para atualizar contador do carrinho
+function atualizarContadorCarrinho() {
+    const contador = document.querySelector('.cart-count');
+    if (contador) {
+        fetch('/api/carrinho')
+            .then(response => response.json())
+            .then(data => {
+                const count = data.items ? data.items.length : 0;
+                contador.textContent = count;
+                contador.style.display = count > 0 ? 'flex' : 'none';
+            })
+            .catch(error => console.error('Erro ao atualizar contador:', error));
+    }
+}
+
+// =============== SCROLL INFINITO ===============
+// Busca as próximas páginas na /api/produtos (cursor por id) quando o fim da
+// grade se aproxima da tela
+document.addEventListener('DOMContentLoaded', function() {
+    const grid = document.getElementById('products-grid');
+    const sentinel = document.getElementById('products-sentinel');
+    if (!grid || !sentinel || !('IntersectionObserver' in window)) return;
+
+    let carregando = false;
+
+    async function carregarProximaPagina() {
+        // Com filtros de servidor ativos a paginação é a da /api/filtros
+        if (grid.dataset.proximaPagina) {
+            carregarFiltrosServidor(parseInt(grid.dataset.proximaPagina, 10));
+            return;
+        }
+        const cursor = grid.dataset.proximoCursor;
+        if (carregando || !cursor) return;
+        carregando = true;
+        try {
+            const params = new URLSearchParams({ cursor: cursor, html: '1' });
+            if (grid.dataset.categoria) params.set('categoria', grid.dataset.categoria);
+            const response = await fetch(`/api/produtos?${params.toString()}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const data = await response.json();
+
+            const temp = document.createElement('div');
+            temp.innerHTML = data.html || '';
+            const novos = Array.from(temp.children);
+            novos.forEach(card => grid.appendChild(card));
+            if (window.observarImagensLazy) window.observarImagensLazy(grid);
+
+            grid.dataset.proximoCursor = data.proximo_cursor ?? '';
+
+            // Inclui os novos cards no sistema de filtros
+            loadProducts();
+            aplicarFiltrosLocais();
+        } catch (error) {
+            console.error('Erro ao carregar mais produtos:', error);
+        } finally {
+            carregando = false;
+        }
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) carregarProximaPagina();
+    }, { rootMargin: '600px 0px' });
+    observer.observe(sentinel);
+});
+
+// =============== SISTEMA DE FILTROS ===============
+let allProducts = [];
+let filteredProducts = [];
+let activeFilters = {
+    categories: [],
+    sizes: [],
+    priceMin: null,
+    priceMax: null,
+    quickFilter: null
+};
+
+// Inicializar filtros quando a página carregar
+document.addEventListener('DOMContentLoaded', function() {
+    initializeFilters();
+    loadProducts();
+});
+
+// Função para inicializar o sistema de filtros
+function initializeFilters() {
+    // Configurar eventos de filtros
+    setupFilterEvents();
+
+    // Configurar checkbox "Todas as categorias"
+    const allCategoriesCheckbox = document.querySelector('input[value=""]:checked');
+    if (allCategoriesCheckbox) {
+        allCategoriesCheckbox.addEventListener('change', handleAllCategoriesChange);
+    }
+
+    // Configurar checkbox "Todos os tamanhos"
+    const allSizesCheckbox = document.querySelector('.size-options input[value=""]:checked');
+    if (allSizesCheckbox) {
+        allSizesCheckbox.addEventListener('change', handleAllSizesChange);
+    }
+}
+
+// Carregar produtos da página
+function loadProducts() {
+    const productCards = document.querySelectorAll('.produto-card');
+    allProducts = Array.from(productCards).map(card => {
+        const nameEl = card.querySelector('.produto-nome');
+        const priceEl = card.querySelector('.produto-preco');
+        const categoryEl = card.querySelector('.produto-categoria');
+        const sizesEl = card.querySelector('.produto-tamanhos');
+
+        return {
+            element: card,
+            name: nameEl ? nameEl.textContent.trim() : '',
+            price: priceEl ? parseFloat(priceEl.textContent.replace(/[R$\s.]/g, '').replace(',', '.')) : 0,
+            category: categoryEl ? categoryEl.textContent.trim() : '',
+            sizes: sizesEl ? sizesEl.textContent.split(',').map(s => s.trim().toUpperCase()) : [],
+            id: card.dataset.productId || Math.random().toString()
+        };
+    });
+
+    filteredProducts = [...allProducts];
+    updateProductCount();
+}
+
+// Configurar eventos dos filtros
+function setupFilterEvents() {
+    // Filtros de categoria
+    const categoryCheckboxes = document.querySelectorAll('.filter-options input[type="checkbox"]:not([value=""])');
+    categoryCheckboxes.forEach(checkbox => {
+        checkbox.addEventListener('change', handleCategoryFilter);
+    });
+
+    // Filtros de tamanho
+    const sizeCheckboxes = document.querySelectorAll('.size-options input[type="checkbox"]:not([value=""])');
+    sizeCheckboxes.forEach(checkbox => {
+        checkbox.addEventListener('change', handleSizeFilter);
+    });
+
+    // Filtros de preço
+    const minPriceInput = document.getElementById('min-price');
+    const maxPriceInput = document.getElementById('max-price');
+
+    if (minPriceInput) {
+        minPriceInput.addEventListener('input', debounce(handlePriceFilter, 500));
+    }
+    if (maxPriceInput) {
+        maxPriceInput.addEventListener('input', debounce(handlePriceFilter, 500));
+    }
+
+    // Filtros rápidos
+    const quickFilterButtons = document.querySelectorAll('.quick-filter');
+    quickFilterButtons.forEach(button => {
+        button.addEventListener('click', handleQuickFilter);
+    });
+}
+
+// Toggle do painel de filtros
+function toggleFilters() {
+    const filtersPanel = document.getElementById('filters-panel');
+    const isActive = filtersPanel.classList.contains('active');
+
+    if (isActive) {
+        filtersPanel.classList.remove('active');
+        document.body.style.overflow = '';
+    } else {
+        filtersPanel.classList.add('active');
+        document.body.style.overflow = 'hidden';
+    }
+}
+
+// Manipular filtro de categorias
+function handleCategoryFilter(event) {
+    const value = event.target.value;
+    const isChecked = event.target.checked;
+
+    if (isChecked) {
+        if (!activeFilters.categories.includes(value)) {
+            activeFilters.categories.push(value);
+        }
+    } else {
+        activeFilters.categories = activeFilters.categories.filter(cat => cat !== value);
+    }
+
+    // Desmarcar "Todas as categorias" se alguma categoria específica for selecionada
+    if (activeFilters.categories.length > 0) {
+        const allCategoriesCheckbox = document.querySelector('.filter-options input[value=""]');
+        if (allCategoriesCheckbox) {
+            allCategoriesCheckbox.checked = false;
+        }
+    }
+
+    filterProducts();
+}
+
+// Manipular "Todas as categorias"
+function handleAllCategoriesChange(event) {
+    const isChecked = event.target.checked;
+
+    if (isChecked) {
+        // Limpar filtros de categoria e desmarcar todos os checkboxes
+        activeFilters.categories = [];
+        const categoryCheckboxes = document.querySelectorAll('.filter-options input[type="checkbox"]:not([value=""])');
+        categoryCheckboxes.forEach(checkbox => {
+            checkbox.checked = false;
+        });
+    }
+
+    filterProducts();
+}
+
+// Manipular filtro de tamanhos
+function handleSizeFilter(event) {
+    const value = event.target.value;
+    const isChecked = event.target.checked;
+
+    if (isChecked) {
+        if (!activeFilters.sizes.includes(value)) {
+            activeFilters.sizes.push(value);
+        }
+    } else {
+        activeFilters.sizes = activeFilters.sizes.filter(size => size !== value);
+    }
+
+    // Desmarcar "Todos os tamanhos" se algum tamanho específico for selecionado
+    if (activeFilters.sizes.length > 0) {
+        const allSizesCheckbox = document.querySelector('.size-options input[value=""]');
+        if (allSizesCheckbox) {
+            allSizesCheckbox.checked = false;
+        }
+    }
+
+    filterProducts();
+}
+
+// Manipular "Todos os tamanhos"
+function handleAllSizesChange(event) {
+    const isChecked = event.target.checked;
+
+    if (isChecked) {
+        // Limpar filtros de tamanho e desmarcar todos os checkboxes
+        activeFilters.sizes = [];
+        const sizeCheckboxes = document.querySelectorAll('.size-options input[type="checkbox"]:not([value=""])');
+        sizeCheckboxes.forEach(checkbox => {
+            checkbox.checked = false;
+        });
+    }
+
+    filterProducts();
+}
+
+// Manipular filtro de preço
+function handlePriceFilter() {
+    const minPrice = document.getElementById('min-price');
+    const maxPrice = document.getElementById('max-price');
+
+    activeFilters.priceMin = minPrice && minPrice.value ? parseFloat(minPrice.value) : null;
+    activeFilters.priceMax = maxPrice && maxPrice.value ? parseFloat(maxPrice.value) : null;
+
+    filterProducts();
+}
+
+// Manipular filtros rápidos
+function handleQuickFilter(event) {
+    const filterType = event.target.dataset.filter || event.target.textContent.toLowerCase();
+    const button = event.target;
+
+    // Toggle do filtro rápido
+    if (activeFilters.quickFilter === filterType) {
+        activeFilters.quickFilter = null;
+        button.classList.remove('active');
+    } else {
+        // Remover active de outros botões
+        document.querySelectorAll('.quick-filter').forEach(btn => {
+            btn.classList.remove('active');
+        });
+
+        activeFilters.quickFilter = filterType;
+        button.classList.add('active');
+    }
+
+    filterProducts();
+}
+
+// Definir filtro rápido (chamado pelos botões)
+function setQuickFilter(filterType) {
+    const button = document.querySelector(`[onclick*="${filterType}"]`);
+    if (button) {
+        handleQuickFilter({ target: button });
+    }
+}
+
+// =============== FILTROS NO SERVIDOR ===============
+// Categoria, tamanho e preço são resolvidos pela /api/filtros (índice de facetas
+// do servidor), que devolve os cards e quantos produtos cada opção traria. Os
+// filtros rápidos continuam locais, sobre os cards carregados.
+let filtroControle = null;
+let totalFiltrado = null;
+let vitrineOriginal = null;
+
+function temFiltrosServidor() {
+    return activeFilters.categories.length > 0 || activeFilters.sizes.length > 0
+        || activeFilters.priceMin !== null || activeFilters.priceMax !== null;
+}
+
+function parametrosFiltros(pagina) {
+    const params = new URLSearchParams({ html: '1', pagina: pagina });
+    // A categoria da página (/?categoria=X) vai sempre; as marcadas no painel somam a ela
+    const grid = document.getElementById('products-grid');
+    const categorias = new Set(activeFilters.categories);
+    if (grid && grid.dataset.categoria) categorias.add(grid.dataset.categoria);
+    categorias.forEach(categoria => params.append('categoria', categoria));
+    activeFilters.sizes.forEach(tamanho => params.append('tamanho', tamanho));
+    if (activeFilters.priceMin !== null) params.set('preco_min', activeFilters.priceMin);
+    if (activeFilters.priceMax !== null) params.set('preco_max', activeFilters.priceMax);
+    return params;
+}
+
+function atualizarContagensFacetas(facetas) {
+    document.querySelectorAll('.faceta-contagem').forEach(el => {
+        const opcoes = facetas ? facetas[el.dataset.faceta] || [] : null;
+        const opcao = opcoes && opcoes.find(o => o.valor === el.dataset.valor);
+        el.textContent = opcoes ? `(${opcao ? opcao.total : 0})` : '';
+    });
+}
+
+async function carregarFiltrosServidor(pagina = 1) {
+    const grid = document.getElementById('products-grid');
+    if (!grid) return;
+    if (vitrineOriginal === null) {
+        vitrineOriginal = { html: grid.innerHTML, cursor: grid.dataset.proximoCursor };
+    }
+    if (filtroControle) filtroControle.abort();
+    filtroControle = new AbortController();
+    try {
+        const response = await fetch(`/api/filtros?${parametrosFiltros(pagina)}`, { signal: filtroControle.signal });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const data = await response.json();
+
+        if (pagina === 1) grid.innerHTML = '';
+        const temp = document.createElement('div');
+        temp.innerHTML = data.html || '';
+        Array.from(temp.children).forEach(card => grid.appendChild(card));
+        if (window.observarImagensLazy) window.observarImagensLazy(grid);
+
+        grid.dataset.proximoCursor = '';
+        grid.dataset.proximaPagina = data.proxima_pagina ?? '';
+        totalFiltrado = data.total;
+        atualizarContagensFacetas(data.facetas);
+        loadProducts();
+        aplicarFiltrosLocais();
+    } catch (error) {
+        if (error.name !== 'AbortError') console.error('Erro ao filtrar produtos:', error);
+    }
+}
+
+function restaurarVitrine() {
+    const grid = document.getElementById('products-grid');
+    if (filtroControle) filtroControle.abort();
+    if (grid && vitrineOriginal !== null) {
+        grid.innerHTML = vitrineOriginal.html;
+        grid.dataset.proximoCursor = vitrineOriginal.cursor || '';
+        grid.dataset.proximaPagina = '';
+        if (window.observarImagensLazy) window.observarImagensLazy(grid);
+        vitrineOriginal = null;
+        loadProducts();
+    }
+    totalFiltrado = null;
+    atualizarContagensFacetas(null);
+}
+
+// Aplicar filtros aos produtos
+function filterProducts() {
+    if (temFiltrosServidor()) {
+        carregarFiltrosServidor(1);
+        return;
+    }
+    restaurarVitrine();
+    aplicarFiltrosLocais();
+}
+
+// Filtros sobre os cards já carregados (os de servidor só confirmam o resultado)
+function aplicarFiltrosLocais() {
+    filteredProducts = allProducts.filter(product => {
+        // Filtro por categoria
+        if (activeFilters.categories.length > 0) {
+            if (!activeFilters.categories.includes(product.category)) {
+                return false;
+            }
+        }
+
+        // Filtro por tamanho
+        if (activeFilters.sizes.length > 0) {
+            const hasMatchingSize = activeFilters.sizes.some(size => 
+                product.sizes.includes(size)
+            );
+            if (!hasMatchingSize) {
+                return false;
+            }
+        }
+
+        // Filtro por preço
+        if (activeFilters.priceMin !== null && product.price < activeFilters.priceMin) {
+            return false;
+        }
+        if (activeFilters.priceMax !== null && product.price > activeFilters.priceMax) {
+            return false;
+        }
+
+        // Filtros rápidos
+        if (activeFilters.quickFilter) {
+            switch (activeFilters.quickFilter) {
+                case 'promocao':
+                    // Lógica para promoção (ex: produtos com desconto)
+                    // Por enquanto, mostrar produtos com preço menor que 100
+                    if (product.price >= 100) return false;
+                    break;
+                case 'lancamento':
+                    // Lógica para lançamentos (ex: produtos recentes)
+                    // Por enquanto, mostrar produtos que contenham "novo" no nome
+                    if (!product.name.toLowerCase().includes('novo')) return false;
+                    break;
+                case 'mais-vendidos':
+                    // Lógica para mais vendidos
+                    // Por enquanto, mostrar produtos com preço entre 50-200
+                    if (product.price < 50 || product.price > 200) return false;
+                    break;
+            }
+        }
+
+        return true;
+    });
+
+    updateProductDisplay();
+    updateProductCount();
+}
+
+// Atualizar exibição dos produtos
+function updateProductDisplay() {
+    // Esconder todos os produtos
+    allProducts.forEach(product => {
+        product.element.style.display = 'none';
+    });
+
+    // Mostrar produtos filtrados
+    filteredProducts.forEach(product => {
+        product.element.style.display = 'block';
+    });
+
+    // Adicionar animação suave
+    const productsGrid = document.querySelector('.produtos-grid');
+    if (productsGrid) {
+        productsGrid.style.opacity = '0.7';
+        setTimeout(() => {
+            productsGrid.style.opacity = '1';
+        }, 150);
+    }
+}
+
+// Atualizar contador de produtos
+function updateProductCount() {
+    const countElement = document.querySelector('.product-count');
+    if (countElement) {
+        // Com filtros de servidor o total inclui as páginas ainda não carregadas
+        const count = totalFiltrado !== null && !activeFilters.quickFilter ? totalFiltrado : filteredProducts.length;
+        countElement.textContent = `${count} produto${count !== 1 ? 's' : ''}`;
+    }
+}
+
+// Ordenar produtos
+function sortProducts(sortType) {
+    let sortedProducts;
+
+    switch (sortType) {
+        case 'menor-preco':
+            sortedProducts = [...filteredProducts].sort((a, b) => a.price - b.price);
+            break;
+        case 'maior-preco':
+            sortedProducts = [...filteredProducts].sort((a, b) => b.price - a.price);
+            break;
+        case 'nome-az':
+            sortedProducts = [...filteredProducts].sort((a, b) => a.name.localeCompare(b.name));
+            break;
+        case 'nome-za':
+            sortedProducts = [...filteredProducts].sort((a, b) => b.name.localeCompare(a.name));
+            break;
+        case 'mais-novos':
+            // Por enquanto, manter ordem original (ou implementar lógica de data)
+            sortedProducts = [...filteredProducts];
+            break;
+        default:
+            sortedProducts = [...filteredProducts];
+    }
+
+    // Reordenar elementos no DOM
+    const productsGrid = document.querySelector('.produtos-grid');
+    if (productsGrid) {
+        // Criar um fragment para otimizar manipulação do DOM
+        const fragment = document.createDocumentFragment();
+
+        sortedProducts.forEach(product => {
+            fragment.appendChild(product.element);
+        });
+
+        // Limpar grid e adicionar produtos ordenados
+        productsGrid.innerHTML = '';
+        productsGrid.appendChild(fragment);
+
+        // Adicionar produtos não filtrados no final (escondidos)
+        allProducts.forEach(product => {
+            if (!sortedProducts.includes(product)) {
+                productsGrid.appendChild(product.element);
+            }
+        });
+    }
+
+    filteredProducts = sortedProducts;
+}
+
+// Limpar todos os filtros
+function clearAllFilters() {
+    // Resetar filtros ativos
+    activeFilters = {
+        categories: [],
+        sizes: [],
+        priceMin: null,
+        priceMax: null,
+        quickFilter: null
+    };
+
+    // Resetar checkboxes de categoria
+    const categoryCheckboxes = document.querySelectorAll('.filter-options input[type="checkbox"]');
+    categoryCheckboxes.forEach(checkbox => {
+        checkbox.checked = checkbox.value === '';
+    });
+
+    // Resetar checkboxes de tamanho
+    const sizeCheckboxes = document.querySelectorAll('.size-options input[type="checkbox"]');
+    sizeCheckboxes.forEach(checkbox => {
+        checkbox.checked = checkbox.value === '';
+    });
+
+    // Resetar inputs de preço
+    const minPriceInput = document.getElementById('min-price');
+    const maxPriceInput = document.getElementById('max-price');
+    if (minPriceInput) minPriceInput.value = '';
+    if (maxPriceInput) maxPriceInput.value = '';
+
+    // Resetar filtros rápidos
+    document.querySelectorAll('.quick-filter').forEach(button => {
+        button.classList.remove('active');
+    });
+
+    // Resetar ordenação
+    const sortDropdown = document.querySelector('.sort-dropdown');
+    if (sortDropdown) {
+        sortDropdown.value = 'destaque';
+    }
+
+    // Aplicar filtros (que agora estão vazios)
+    filterProducts();
+}
+
+// Função utilitária para debounce
+function debounce(func, wait) {
+    let timeout;
+    return function executedFunction(...args) {
+        const later = () => {
+            clearTimeout(timeout);
+            func(...args);
+        };
+        clearTimeout(timeout);
+        timeout = setTimeout(later, wait);
+    };
+}
+
+// Fechar filtros ao clicar fora
+document.addEventListener('click', function(event) {
+    const filtersPanel = document.getElementById('filters-panel');
+    const filterToggle = document.querySelector('.filter-toggle');
+
+    if (filtersPanel && filtersPanel.classList.contains('active')) {
+        if (!filtersPanel.contains(event.target) && !filterToggle.contains(event.target)) {
+            toggleFilters();
+        }
+    }
+});
+
+// =============== BANNER ROTATIVO ===============
+let bannerAtual = 0;
+let bannerInterval;
+
+// Função para mudar banner
+function mudarBanner(direcao) {
+    const slides = document.querySelectorAll('.banner-slide');
+    const indicators = document.querySelectorAll('.indicator');
+
+    if (slides.length === 0) return;
+
+    // Verifica se o slide atual existe antes de remover a classe
+    if (slides[bannerAtual]) {
+        slides[bannerAtual].classList.remove('active');
+    }
+    if (indicators[bannerAtual]) {
+        indicators[bannerAtual].classList.remove('active');
+    }
+
+    // Calcula novo índice
+    bannerAtual = (bannerAtual + direcao + slides.length) % slides.length;
+
+    // Adiciona classe active ao novo slide
+    if (slides[bannerAtual]) {
+        slides[bannerAtual].classList.add('active');
+    }
+    if (indicators[bannerAtual]) {
+        indicators[bannerAtual].classList.add('active');
+    }
+
+    // Reinicia o intervalo automático
+    clearInterval(bannerInterval);
+    iniciarBannerAutomatico();
+}
+
+// Função para ir para um banner específico
+function irParaBanner(index) {
+    const slides = document.querySelectorAll('.banner-slide');
+    const indicators = document.querySelectorAll('.indicator');
+
+    if (slides.length === 0 || index < 0 || index >= slides.length) return;
+
+    // Remove classe active do slide atual
+    if (slides[bannerAtual]) {
+        slides[bannerAtual].classList.remove('active');
+    }
+    if (indicators[bannerAtual]) {
+        indicators[bannerAtual].classList.remove('active');
+    }
+
+    // Define novo índice
+    bannerAtual = index;
+
+    // Adiciona classe active ao novo slide
+    if (slides[bannerAtual]) {
+        slides[bannerAtual].classList.add('active');
+    }
+    if (indicators[bannerAtual]) {
+        indicators[bannerAtual].classList.add('active');
+    }
+
+    // Reinicia o intervalo automático
+    clearInterval(bannerInterval);
+    iniciarBannerAutomatico();
+}
+
+// Função para iniciar rotação automática
+function iniciarBannerAutomatico() {
+    const slides = document.querySelectorAll('.banner-slide');
+    if (slides.length === 0) return;
+
+    clearInterval(bannerInterval);
+    bannerInterval = setInterval(() => {
+        mudarBanner(1);
+    }, 4000); // Muda a cada 4 segundos
+}
+
+// Inicializar banner quando o DOM estiver pronto
+document.addEventListener('DOMContentLoaded', function() {
+    const slides = document.querySelectorAll('.banner-slide');
+    if (slides.length > 0) {
+        // Garantir que o primeiro slide está ativo
+        slides[0].classList.add('active');
+        const indicators = document.querySelectorAll('.indicator');
+        if (indicators.length > 0) {
+            indicators[0].classList.add('active');
+        }
+
+        iniciarBannerAutomatico();
+
+        // Pausar rotação quando o mouse estiver sobre o banner
+        const bannerContainer = document.querySelector('.banner-rotativo-container');
+        if (bannerContainer) {
+            bannerContainer.addEventListener('mouseenter', () => {
+                clearInterval(bannerInterval);
+            });
+
+            bannerContainer.addEventListener('mouseleave', () => {
+                iniciarBannerAutomatico();
+            });
+        }
+    }
+
+    // Banner interno rotativo (dentro do segundo slide)
+    let bannerInternoAtual = 0;
+    let bannerInternoInterval;
+
+    function mudarBannerInterno() {
+        const slidesInternos = document.querySelectorAll('.banner-interno-slide');
+        if (slidesInternos.length === 0) return;
+
+        // Remove active do slide atual
+        if (slidesInternos[bannerInternoAtual]) {
+            slidesInternos[bannerInternoAtual].classList.remove('active');
+        }
+
+        // Calcula próximo índice
+        bannerInternoAtual = (bannerInternoAtual + 1) % slidesInternos.length;
+
+        // Adiciona active ao novo slide
+        if (slidesInternos[bannerInternoAtual]) {
+            slidesInternos[bannerInternoAtual].classList.add('active');
+        }
+    }
+
+    function iniciarBannerInterno() {
+        const slidesInternos = document.querySelectorAll('.banner-interno-slide');
+        if (slidesInternos.length === 0) return;
+
+        // Garantir que o primeiro slide interno está ativo
+        if (slidesInternos[0]) {
+            slidesInternos[0].classList.add('active');
+        }
+
+        clearInterval(bannerInternoInterval);
+        bannerInternoInterval = setInterval(() => {
+            mudarBannerInterno();
+        }, 5000); // Muda a cada 5 segundos
+    }
+
+    // Iniciar banner interno
+    iniciarBannerInterno();
+});
+
+// Fechar filtros com tecla Escape
+document.addEventListener('keydown', function(event) {
+    if (event.key === 'Escape') {
+        const filtersPanel = document.getElementById('filters-panel');
+        if (filtersPanel && filtersPanel.classList.contains('active')) {
+            toggleFilters();
+        }
+    }
+});
@@ -0,0 +1,58 @@
+// Status do pagamento PIX por long-poll
+// O elemento #pagamentoStatus traz data-pedido-id, data-token (token do pedido) e
+// data-status (status atual). Cada requisição fica aberta no servidor até o status
+// mudar; sem mudança, ela volta depois de ~50 s e é refeita. Com o servidor cheio
+// a resposta volta na hora com Retry-After, respeitado antes da próxima. Ao pagar
+// (ou cancelar) dispara o evento
+// "pagamento:status" no document e, se houver data-redirect, segue para ele.
+(function () {
+  const painel = document.getElementById('pagamentoStatus');
+  if (!painel) {
+    return;
+  }
+
+  const pedidoId = painel.dataset.pedidoId;
+  const token = painel.dataset.token || '';
+  let status = painel.dataset.status || '';
+  let falhas = 0;
+
+  function avisar(dados) {
+    document.dispatchEvent(new CustomEvent('pagamento:status', { detail: dados }));
+    if (dados.pago && painel.dataset.redirect) {
+      window.location.href = painel.dataset.redirect;
+    }
+  }
+
+  async function aguardar() {
+    try {
+      const url = `/api/pedidos/${pedidoId}/status?status=${encodeURIComponent(status)}` +
+        `&token=${encodeURIComponent(token)}`;
+      const response = await fetch(url, { headers: { Accept: 'application/json' } });
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      const dados = await response.json();
+      falhas = 0;
+      if (dados.status !== status) {
+        status = dados.status;
+        painel.dataset.status = status;
+        avisar(dados);
+      }
+      if (dados.pago || dados.cancelado) {
+        return;
+      }
+      const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+      if (retryAfter > 0) {
+        setTimeout(aguardar, retryAfter * 1000);
+        return;
+      }
+      aguardar();
+    } catch (erro) {
+      // Rede instável: tenta de novo com espera crescente (máx. 30 s)
+      falhas += 1;
+      setTimeout(aguardar, Math.min(30000, 1000 * 2 ** falhas));
+    }
+  }
+
+  aguardar();
+})();
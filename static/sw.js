@@ -1,48 +1,146 @@
-// Service Worker - LIMPEZA COMPLETA DE CACHE
-console.log('[SW] Iniciando limpeza completa de cache...');
+// Service Worker - cache offline da vitrine
+// O servidor (rota /sw.js) injeta self.MANIFESTO_ASSETS = {versao, precache} antes
+// deste código. Um deploy que muda assets/templates muda a versão, o navegador
+// instala o novo SW e os caches da versão anterior são apagados no activate.
+const MANIFESTO = self.MANIFESTO_ASSETS || { versao: 'dev', precache: [] };
+const PREFIXO = 'uzze-';
+const CACHE_SHELL = `${PREFIXO}shell-${MANIFESTO.versao}`;
+const CACHE_CATALOGO = `${PREFIXO}catalogo-${MANIFESTO.versao}`;
+// Imagens de produto não dependem da versão do código: sobrevivem aos deploys
+const CACHE_IMAGENS = `${PREFIXO}imagens`;
+const CACHES_ATUAIS = [CACHE_SHELL, CACHE_CATALOGO, CACHE_IMAGENS];
+const MAX_IMAGENS = 300;
 
-// Install Event - Limpar todos os caches
+const PAGINAS_CATALOGO = [/^\/$/, /^\/mobile$/, /^\/produto\/\d+$/];
+const APIS_CATALOGO = [/^\/api\/produtos$/];
+// GETs que alteram a sessão (sacola, logout)
+const MUDAM_SESSAO = [/^\/carrinho\//, /^\/logout$/, /^\/limpar-cache$/];
+const PASTAS_IMAGENS = ['/static/produtos/', '/static/banner/', '/static/header-categories/', '/static/img categoria/', '/static/img%20categoria/', '/static/icons/'];
+
+// Install - baixa o app shell (CSS/JS com hash) da versão atual
 self.addEventListener('install', (event) => {
-  console.log('[SW] Install - Limpando caches...');
   event.waitUntil(
-    caches.keys().then((cacheNames) => {
-      return Promise.all(
-        cacheNames.map((cacheName) => {
-          console.log('[SW] Deletando cache:', cacheName);
-          return caches.delete(cacheName);
-        })
-      );
-    }).then(() => {
-      console.log('[SW] Todos os caches limpos!');
-      return self.skipWaiting();
-    })
+    caches.open(CACHE_SHELL)
+      .then((cache) => cache.addAll(MANIFESTO.precache.map((url) => new Request(url, { cache: 'reload' }))))
+      .then(() => self.skipWaiting())
   );
 });
 
-// Activate Event - Forçar atualização
+// Activate - remove só os caches de versões anteriores
 self.addEventListener('activate', (event) => {
-  // console.log('[SW] Activate - Finalizando limpeza...');
   event.waitUntil(
-    caches.keys().then((cacheNames) => {
-      return Promise.all(
-        cacheNames.map((cacheName) => {
-         // console.log('[SW] Removendo cache restante:', cacheName);
-          return caches.delete(cacheName);
-        })
-      );
-    }).then(() => {
-     // console.log('[SW] Cache completamente limpo!');
-      return self.clients.claim();
-    })
+    caches.keys().then((nomes) => Promise.all(
+      nomes
+        .filter((nome) => nome.startsWith(PREFIXO) && !CACHES_ATUAIS.includes(nome))
+        .map((nome) => caches.delete(nome))
+    )).then(() => self.clients.claim())
   );
 });
 
-// Fetch Event - SEM CACHE (bypass completo)
+function combina(padroes, caminho) {
+  return padroes.some((padrao) => padrao.test(caminho));
+}
+
+// Só respostas que o servidor marcou como públicas (visitante anônimo) podem ser
+// reaproveitadas; qualquer resposta privada indica sessão (login, sacola, flash)
+function respostaPublica(response) {
+  return response && response.ok && (response.headers.get('Cache-Control') || '').includes('public');
+}
+
+async function limitarCache(nome, maximo) {
+  const cache = await caches.open(nome);
+  const chaves = await cache.keys();
+  for (let i = 0; i < chaves.length - maximo; i++) {
+    await cache.delete(chaves[i]);
+  }
+}
+
+// Stale-while-revalidate: responde do cache e atualiza em segundo plano
+async function staleWhileRevalidate(event, nomeCache, podeGuardar) {
+  const cache = await caches.open(nomeCache);
+  const emCache = await cache.match(event.request);
+  const daRede = fetch(event.request).then(async (response) => {
+    if (podeGuardar(response)) {
+      await cache.put(event.request, response.clone());
+      if (nomeCache === CACHE_IMAGENS) {
+        await limitarCache(CACHE_IMAGENS, MAX_IMAGENS);
+      }
+    } else if (nomeCache === CACHE_CATALOGO && response.ok) {
+      // Sessão ativa: nada da vitrine anônima pode ser servido a partir daqui
+      await caches.delete(CACHE_CATALOGO);
+    } else {
+      await cache.delete(event.request);
+    }
+    return response;
+  });
+  if (emCache) {
+    event.waitUntil(daRede.catch(() => undefined));
+    return emCache;
+  }
+  return daRede;
+}
+
+// Assets versionados (?v= ou /static/dist/) nunca mudam: cache primeiro
+async function cacheFirst(request) {
+  const emCache = await caches.match(request);
+  if (emCache) {
+    return emCache;
+  }
+  const response = await fetch(request);
+  if (response.ok) {
+    const cache = await caches.open(CACHE_SHELL);
+    await cache.put(request, response.clone());
+  }
+  return response;
+}
+
+async function redeComFallback(request) {
+  try {
+    return await fetch(request);
+  } catch (erro) {
+    const emCache = (await caches.match(request)) || (await caches.match('/'));
+    if (emCache) {
+      return emCache;
+    }
+    throw erro;
+  }
+}
+
 self.addEventListener('fetch', (event) => {
-  // Passa todas as requisições direto para a rede
-  // SEM qualquer tipo de cache
-  // console.log('[SW] Fetch sem cache:', event.request.url);
-  return;
+  const request = event.request;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) {
+    return;
+  }
+
+  const caminho = url.pathname;
+
+  // POST e GETs como /carrinho/adicionar mudam a sessão: descarta a vitrine guardada
+  if (request.method !== 'GET' || combina(MUDAM_SESSAO, caminho)) {
+    event.waitUntil(caches.delete(CACHE_CATALOGO));
+    return;
+  }
+
+  if (caminho.startsWith('/admin') || caminho === '/sw.js') {
+    return;
+  }
+
+  if (caminho.startsWith('/static/dist/') || (caminho.startsWith('/static/') && url.searchParams.has('v'))) {
+    event.respondWith(cacheFirst(request));
+    return;
+  }
+
+  if (request.destination === 'image' || PASTAS_IMAGENS.some((pasta) => caminho.startsWith(pasta))) {
+    event.respondWith(staleWhileRevalidate(event, CACHE_IMAGENS, (response) => response.ok));
+    return;
+  }
+
+  if (combina(APIS_CATALOGO, caminho) || (request.mode === 'navigate' && combina(PAGINAS_CATALOGO, caminho))) {
+    event.respondWith(staleWhileRevalidate(event, CACHE_CATALOGO, respostaPublica));
+    return;
+  }
+
+  if (request.mode === 'navigate') {
+    event.respondWith(redeComFallback(request));
+  }
 });
- 
-// console.log('[SW] Service Worker de limpeza ativo!'); 
\ No newline at end of file